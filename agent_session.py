@@ -1,4 +1,5 @@
 import os, json, traceback, subprocess, sys, uuid
+import functools
 from time import sleep
 import threading
 import datetime
@@ -8,6 +9,15 @@ import logging
 from pathlib import Path
 import time
 import re
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+from output_buffer import OutputRingBuffer
+from event_bus import event_bus
+from io_reactor import io_reactor
+from output_filter import output_filter, load_output_filter
+from aider_events import AiderEventParser
+
+MAX_PENDING_EVENTS = 1000  # Parsed aider events held until the orchestrator persists them
 
 def normalize_path(path_str):
     if not path_str:
@@ -20,39 +30,40 @@ def normalize_path(path_str):
         return None
 
 class AgentSession:
-    def __init__(self, workspace_path, task, config=None, aider_commands=None):
+    def __init__(self, workspace_path, task, config=None, aider_commands=None, agent_id=None):
         self.workspace_path = normalize_path(workspace_path)
         self.task = task
+        # When set, output is also published to the event bus for /events
+        self.agent_id = agent_id
         self.aider_commands = aider_commands
-        self.output_buffer = io.StringIO()
         self.process = None
         self._stop_event = threading.Event()
         self.session_id = str(uuid.uuid4())[:8]
         self._buffer_lock = threading.Lock()
+        # Signalled whenever output lands in the buffer; readiness waits on it with a deadline
+        self._output_cond = threading.Condition(self._buffer_lock)
+        self._last_output_time = None
         self.aider_commands = aider_commands
         default_config = {
             'stability_duration': 10,
-            'output_buffer_max_length': 10000
+            'output_buffer_max_length': 1000000
         }
         self.config = {**default_config, **(config or {})}
+        self.output_buffer = OutputRingBuffer(self.config['output_buffer_max_length'])
+        self._event_parser = AiderEventParser()
+        self._events_lock = threading.Lock()
+        self._pending_events = deque(maxlen=MAX_PENDING_EVENTS)
 
     def start(self) -> bool:
         try:
             env = os.environ.copy()
             env['PYTHONUNBUFFERED'] = '1'
             env['PYTHONIOENCODING'] = 'utf-8'
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
             # Start aider process with unbuffered output and console mode
             # Get the configured aider model
             from database import get_model_config
             config = get_model_config()
-            aider_model = config.get('aider_model') if config else None
-            if not aider_model:
-                from database import get_model_config
-                config = get_model_config()
-                aider_model = config.get('aider_model') if config else 'openrouter/google/gemini-flash-1.5'
+            aider_model = (config.get('aider_model') if config else None) or 'openrouter/google/gemini-flash-1.5'
 
             cmd = [
                 'aider',
@@ -64,108 +75,173 @@ class AgentSession:
             ]
             if self.aider_commands:
                 cmd.extend(self.aider_commands.split())
+            load_output_filter()
+            platform_args = {}
+            if os.name == 'nt':
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                platform_args = {
+                    'shell': True,
+                    'startupinfo': startupinfo,
+                    'creationflags': subprocess.CREATE_NO_WINDOW
+                }
             self.process = subprocess.Popen(
                 cmd,
-                shell=True,
                 cwd=str(Path(self.workspace_path).resolve()),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
                 text=True,
                 bufsize=1,
                 universal_newlines=True,
                 env=env,
-                creationflags=subprocess.CREATE_NO_WINDOW
+                **platform_args
             )
-            stdout_thread = threading.Thread(
-                target=self._read_output, 
-                args=(self.process.stdout, "stdout"), 
-                daemon=True,
-                name=f"stdout-{self.session_id}"
-            )
-            stderr_thread = threading.Thread(
-                target=self._read_output, 
-                args=(self.process.stderr, "stderr"), 
-                daemon=True,
-                name=f"stderr-{self.session_id}"
-            )
-            stdout_thread.start()
-            stderr_thread.start()
+            self._attach_pipes()
             time.sleep(2)
             return True
         except Exception as e:
             return False
 
+    def _attach_pipes(self) -> None:
+        """Route the process's stdout and stderr into the output buffer.
+
+        Uses the shared I/O reactor where available, so no threads are added per
+        session; otherwise falls back to a reader thread per pipe.
+        """
+        if io_reactor.supported:
+            for pipe, pipe_name in ((self.process.stdout, "stdout"), (self.process.stderr, "stderr")):
+                io_reactor.register(pipe, functools.partial(self._handle_output, stream=pipe_name),
+                                    functools.partial(self._flush_output, pipe_name))
+            return
+        for pipe, pipe_name in ((self.process.stdout, "stdout"), (self.process.stderr, "stderr")):
+            threading.Thread(
+                target=self._read_output,
+                args=(pipe, pipe_name),
+                daemon=True,
+                name=f"{pipe_name}-{self.session_id}"
+            ).start()
+
+    def is_alive(self) -> bool:
+        """Whether the aider process is running."""
+        return bool(self.process) and self.process.poll() is None
+
     def _read_output(self, pipe, pipe_name):
         try:
-            message_buffer = []
             while not self._stop_event.is_set() and self.process and self.process.poll() is None:
                 line = pipe.readline()
                 if not line:
                     sleep(0.1)
                     continue
-                if any(msg in line for msg in [
-                    "Can't initialize prompt toolkit",
-                    "Newer aider version",
-                    "Run this command to update:",
-                    "python.exe -m pip install aider",
-                    "cmd.exe?",
-                    "Aider v",
-                    "Model:",
-                    "Git repo:",
-                    "Repo-map:",
-                    "Use /help"
-                ]):
-                    continue
-                if line.strip():
-                    message_buffer.append(line.strip())
-                    if '>' in line or '?' in line:
-                        if message_buffer:
-                            message_buffer = []
-                with self._buffer_lock:
-                    self.output_buffer.seek(0, 2)
-                    self.output_buffer.write(line)
-                try:
-                    pipe.flush()
-                except ValueError:
-                    break
+                self._handle_output(line, pipe_name)
         except Exception as e:
             pass
+        finally:
+            self._flush_output(pipe_name)
+
+    def _handle_output(self, text: str, stream: str = "stdout") -> None:
+        """Write text from the aider process to the buffer, minus filtered noise."""
+        filtered = output_filter.filter(text, (self.session_id, stream))
+        if filtered:
+            self._parse_events(filtered, self.write_output(filtered))
+        elif text:
+            # A held or collapsed progress frame still means aider is busy
+            with self._buffer_lock:
+                self._touch_output()
+
+    def _flush_output(self, stream: str) -> None:
+        """Write out the progress frame the filter held back for a closed pipe."""
+        text = output_filter.flush((self.session_id, stream))
+        if text:
+            self._parse_events(text, self.write_output(text))
+
+    def _parse_events(self, text: str, offset: int) -> None:
+        """Turn aider output starting at offset into structured events."""
+        with self._events_lock:
+            events = self._event_parser.feed(text, offset)
+            self._pending_events.extend(events)
+        if self.agent_id:
+            for event in events:
+                event_bus.publish('aider_event', self.agent_id, event)
+
+    def take_events(self) -> List[Dict]:
+        """Return and forget the aider events parsed since the last call.
+
+        Event offsets are positions in this session's output, see read_since().
+        """
+        with self._events_lock:
+            events = list(self._pending_events)
+            self._pending_events.clear()
+        return events
 
     def get_output(self):
         try:
-            pos = self.output_buffer.tell()
-            self.output_buffer.seek(0)
-            output = self.output_buffer.read()
-            self.output_buffer.seek(pos)
-            return output
+            return self.output_buffer.getvalue()
         except Exception as e:
             pass
 
+    def read_since(self, offset: int) -> Tuple[str, int]:
+        """Return output written since offset and the offset to resume from."""
+        return self.output_buffer.read_since(offset)
+
+    @property
+    def output_offset(self) -> int:
+        return self.output_buffer.end_offset
+
     def _echo_message(self, message: str) -> None:
         try:
             echo_line = self._format_output_line(f"{message}")
             echo_line = echo_line.replace('class="output-line"', 'class="output-line user-message"')
-            with threading.Lock():
-                self.output_buffer.seek(0, 2)
-                self.output_buffer.write(echo_line)
+            self.write_output(echo_line)
         except Exception as e:
             pass
 
-    def is_ready(self) -> bool:
+    def write_output(self, text: str) -> int:
+        """Append text to the output buffer and publish it to live viewers.
+
+        Returns the output offset the text starts at.
+        """
+        with self._buffer_lock:
+            offset = self.output_buffer.end_offset
+            self.output_buffer.write(text)
+            self._touch_output()
+        if self.agent_id and text:
+            event_bus.publish('output', self.agent_id, {'text': text})
+        return offset
+
+    def _touch_output(self) -> None:
+        """Record output activity. Caller must hold the buffer lock."""
+        self._last_output_time = time.monotonic()
+        self._output_cond.notify_all()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until no output has arrived for stability_duration seconds.
+
+        Returns True as soon as the session goes quiet, or False if timeout expires
+        (or the session is stopped) first. A timeout of None waits indefinitely.
+        """
         try:
             stability_duration = self.config['stability_duration']
-            initial_output = self.get_output()
-            if not initial_output or initial_output.isspace():
-                return True
-            start_time = time.time()
-            while time.time() - start_time < stability_duration:
-                time.sleep(1)
-                current_output = self.get_output()
-                if current_output != initial_output:
-                    return False
-            return True
+            deadline = None if timeout is None else time.monotonic() + timeout
+            with self._output_cond:
+                while not self._stop_event.is_set():
+                    if self._last_output_time is None:
+                        return True
+                    now = time.monotonic()
+                    quiet_at = self._last_output_time + stability_duration
+                    if now >= quiet_at:
+                        return True
+                    if deadline is not None and now >= deadline:
+                        return False
+                    wake_at = quiet_at if deadline is None else min(quiet_at, deadline)
+                    self._output_cond.wait(wake_at - now)
+            return False
+        except Exception as e:
+            return False
+
+    def is_ready(self) -> bool:
+        try:
+            return self.wait_until_ready(self.config['stability_duration'])
         except Exception as e:
             return False
 
@@ -177,9 +253,7 @@ class AgentSession:
                 else:
                     return False
             sanitized_message = message.replace('"', '\\"')
-            with self._buffer_lock:
-                self.output_buffer.seek(0, 2)
-                self.output_buffer.write(self._format_output_line(f"Agent Action: {agent_action}\n"))
+            self.write_output(self._format_output_line(f"Agent Action: {agent_action}\n"))
             self.process.stdin.write(sanitized_message + "\n")
             self.process.stdin.flush()
             return True
@@ -203,7 +277,15 @@ class AgentSession:
     def cleanup(self) -> None:
         try:
             self._stop_event.set()
+            with self._output_cond:
+                self._output_cond.notify_all()
             if self.process:
+                if io_reactor.supported:
+                    for pipe in (self.process.stdout, self.process.stderr):
+                        if pipe:
+                            io_reactor.unregister(pipe)
+                for pipe_name in ("stdout", "stderr"):
+                    self._flush_output(pipe_name)
                 try:
                     if self.process.stdin:
                         self.process.stdin.close()
@@ -0,0 +1,158 @@
+import datetime
+import re
+from typing import Dict, List, Optional
+
+EVENT_TYPES = ('file_edited', 'commit', 'command', 'question', 'error')
+
+_FILE_EDITED = re.compile(r"^Applied edit to (?P<path>.+?)\s*$")
+_COMMIT = re.compile(r"^Commit (?P<hash>[0-9a-f]{7,40}) (?P<message>.*?)\s*$")
+_COMMAND = re.compile(r"^Running (?P<command>.+?)\s*$")
+_EXIT_STATUS = re.compile(r"(?:exit(?:ed)?(?: with)? (?:status|code)|return code)[:= ]+(?P<status>-?\d+)", re.IGNORECASE)
+_CONFIRM = re.compile(r"^(?P<question>.*?)\s*\(Y\)es/\(N\)o.*?(?:\[\w+\]:\s*(?P<answer>\S*))?\s*$")
+_ERROR = re.compile(
+    r"^(?:Error\b|ERROR\b|Did not apply edit|Failed to apply edit|The LLM did not conform"
+    r"|Unable to |litellm\.\w+|[A-Z]\w*(?:Error|Exception):)"
+)
+_TRACEBACK = "Traceback (most recent call last):"
+_PROMPT = re.compile(r"^(?:\w+ )?> ?$")
+# Lines inside fenced code and SEARCH/REPLACE blocks are file content, not aider messages
+_BLOCK_START = re.compile(r"^(?:```|<<<<<<< SEARCH)")
+_BLOCK_END = re.compile(r"^(?:```\s*$|>>>>>>> REPLACE)")
+
+class AiderEventParser:
+    """Incrementally turns aider output into typed events.
+
+    feed() takes output as it arrives along with the offset it starts at and
+    returns the events completed by it, each a dict with 'type' (one of
+    EVENT_TYPES), 'offset' (where the line that produced it starts), 'timestamp'
+    and type specific 'data':
+
+      file_edited  path
+      commit       hash, message
+      command      command, exit_status (None if aider did not report one), lines
+      question     question, answer (None unless auto-answered), confirm
+      error        message, traceback
+
+    A command is reported once its output ends, at the next prompt, question,
+    other event or exit status line.
+    """
+
+    def __init__(self):
+        self._partial = ''
+        self._partial_offset = 0
+        self._in_block = False
+        self._command: Optional[Dict] = None
+        self._traceback: Optional[Dict] = None
+
+    def feed(self, text: str, offset: int) -> List[Dict]:
+        events = []
+        if not text:
+            return events
+        if not self._partial:
+            self._partial_offset = offset
+        text = self._partial + text
+        pos = 0
+        while True:
+            end = text.find('\n', pos)
+            if end < 0:
+                break
+            self._parse_line(text[pos:end].rstrip('\r'), self._partial_offset + pos, events)
+            pos = end + 1
+        self._partial = text[pos:]
+        self._partial_offset += pos
+        # An input prompt never gets its newline until the user answers
+        if self._partial and _PROMPT.match(self._partial):
+            self._finish_pending(events)
+        return events
+
+    def flush(self) -> List[Dict]:
+        """Parse any unterminated last line and close pending events."""
+        events = []
+        if self._partial:
+            self._parse_line(self._partial, self._partial_offset, events)
+            self._partial_offset += len(self._partial)
+            self._partial = ''
+        self._finish_pending(events)
+        return events
+
+    def _parse_line(self, line: str, offset: int, events: List[Dict]) -> None:
+        if self._in_block:
+            if _BLOCK_END.match(line):
+                self._in_block = False
+            return
+        if self._traceback is not None:
+            if line.startswith((' ', '\t')) or not line:
+                return
+            self._traceback['data']['message'] = line.strip()
+            events.append(self._traceback)
+            self._traceback = None
+            return
+        if _BLOCK_START.match(line):
+            self._in_block = True
+            return
+
+        if _PROMPT.match(line):
+            # Ends a running command's output without being an event itself
+            self._finish_pending(events)
+            return
+        match = _EXIT_STATUS.search(line)
+        if match and self._command:
+            self._command['data']['exit_status'] = int(match.group('status'))
+            self._finish_pending(events)
+            return
+        event = self._classify(line, offset)
+        if event is None:
+            if self._command is not None and line.strip():
+                self._command['data']['lines'] += 1
+            return
+        self._finish_pending(events)
+        if event['type'] == 'command':
+            self._command = event
+        elif event['type'] == 'error' and line.startswith(_TRACEBACK):
+            self._traceback = event
+        else:
+            events.append(event)
+
+    def _classify(self, line: str, offset: int) -> Optional[Dict]:
+        stripped = line.strip()
+        if not stripped:
+            return None
+        match = _FILE_EDITED.match(stripped)
+        if match:
+            return _event('file_edited', offset, path=match.group('path'))
+        match = _COMMIT.match(stripped)
+        if match:
+            return _event('commit', offset, hash=match.group('hash'), message=match.group('message'))
+        match = _COMMAND.match(stripped)
+        if match:
+            return _event('command', offset, command=match.group('command'), exit_status=None, lines=0)
+        match = _CONFIRM.match(stripped)
+        if match:
+            return _event('question', offset, question=match.group('question'),
+                          answer=match.group('answer') or None, confirm=True)
+        if self._command is not None:
+            # Errors and questions printed by a running command are part of its output
+            return None
+        if stripped.startswith(_TRACEBACK):
+            return _event('error', offset, message=stripped, traceback=True)
+        if _ERROR.match(stripped):
+            return _event('error', offset, message=stripped, traceback=False)
+        if stripped.endswith('?'):
+            return _event('question', offset, question=stripped, answer=None, confirm=False)
+        return None
+
+    def _finish_pending(self, events: List[Dict]) -> None:
+        if self._command is not None:
+            events.append(self._command)
+            self._command = None
+        if self._traceback is not None:
+            events.append(self._traceback)
+            self._traceback = None
+
+def _event(event_type: str, offset: int, **data) -> Dict:
+    return {
+        'type': event_type,
+        'offset': offset,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'data': data
+    }
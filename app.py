@@ -1,7 +1,7 @@
 import logging
 import sqlite3
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context
 from werkzeug.serving import WSGIRequestHandler
 
 # Database configuration
@@ -13,18 +13,33 @@ class TasksJsonLogFilter(logging.Filter):
         # Suppress log messages for tasks.json requests
         return not ('/tasks/tasks.json' in record.getMessage())
 from orchestrator import (
-    initialiseCodingAgent, 
     main_loop, 
     load_tasks, 
+    load_tasks_since,
     save_tasks, 
     delete_agent,
     aider_sessions  # Add this import
 )
+from litellm_client import scheduler as llm_scheduler
+from response_cache import response_cache
+from llm_retry import circuit_breaker
+from event_bus import event_bus, COALESCE_INTERVAL
+from provisioning import provisioning_queue
+from output_filter import output_filter
+from aider_events import EVENT_TYPES
+from database import (
+    save_model_config, get_agent_history, HISTORY_KINDS, HISTORY_PAGE_SIZE,
+    get_agent_output, get_agent_output_length, get_change_version, get_agent_events
+)
 import os
 import threading
 import json
 from pathlib import Path
 import datetime
+import time
+
+# Seconds between keep-alive comments on an idle /events stream
+SSE_KEEPALIVE_INTERVAL = 15
 
 app = Flask(__name__)
 
@@ -47,9 +62,30 @@ def index():
 
 @app.route('/tasks/tasks.json')
 def serve_tasks_json():
-    """Serve tasks data in JSON format from database."""
-    tasks_data = load_tasks()
-    return jsonify(tasks_data)
+    """Serve tasks data in JSON format from database.
+
+    The ETag is the global change version, so an unchanged poll with
+    If-None-Match gets a 304. With ?since=<version> only the changes after that
+    version are returned ('full' tells the client which kind it got).
+    """
+    version = get_change_version()
+    etag = f"v{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    tasks_data = None
+    since = request.args.get('since', type=int)
+    if since is not None:
+        tasks_data = load_tasks_since(since)
+    if tasks_data is None:
+        tasks_data = dict(load_tasks(), version=version, full=True)
+    else:
+        tasks_data['full'] = False
+    response = jsonify(tasks_data)
+    # The body may include changes newer than the version read above, never older
+    response.set_etag(f"v{tasks_data['version']}")
+    return response
 
 @app.route('/agents')
 def agent_view():
@@ -79,6 +115,45 @@ def agent_view():
     return render_template('agent_view.html', 
                            agents=agents)
 
+def format_sse(event, with_id=True):
+    event_id = f"id: {event['id']}\n" if with_id else ''
+    return f"{event_id}event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@app.route('/events')
+def events():
+    """Stream agent output and state changes as server-sent events.
+
+    Reconnecting clients send Last-Event-ID and get the events they missed, or a
+    'reset' event when those are gone and they should reload tasks.json.
+    """
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', event_bus.last_id, type=int)
+
+    def stream(last_id):
+        yield "retry: 2000\n\n"
+        while True:
+            pending = event_bus.events_since(last_id, timeout=SSE_KEEPALIVE_INTERVAL)
+            if pending is None:
+                last_id = event_bus.last_id
+                yield format_sse({'id': last_id, 'event': 'reset', 'data': {}})
+            elif not pending:
+                yield ": keep-alive\n\n"
+            else:
+                # Coalesced output keeps its first id, so resume after the newest event merged in
+                last_id = max(event.get('last_id', event['id']) for event in pending)
+                for event in pending[:-1]:
+                    yield format_sse(event, with_id=False)
+                yield format_sse(dict(pending[-1], id=last_id))
+                # Give bursts time to pile up so they are coalesced into fewer events
+                time.sleep(COALESCE_INTERVAL)
+
+    return Response(
+        stream_with_context(stream(last_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/create_agent', methods=['POST'])
 def create_agent():
     try:
@@ -108,39 +183,27 @@ def create_agent():
         if isinstance(tasks, str):
             tasks = [tasks]
         
-        # Load existing tasks
-        tasks_data = load_tasks()
+        # Set environment variable for repo URL
+        os.environ['REPOSITORY_URL'] = repo_url
+        agent_config = load_tasks().get('config', {}).get('agent_session', {})
         
-        # Initialize agents for each task
-        created_agents = []
+        # Queue one provisioning job per agent; clients poll /jobs/<job_id>
+        job_ids = []
         for task_description in tasks:
-            # Set environment variable for repo URL
-            os.environ['REPOSITORY_URL'] = repo_url
-            
-            app.logger.info(f"Attempting to initialize agent for task: {task_description}")
-            
-            # Initialize agent with specified number of agents per task
-            try:
-                # task_text = f"{task_description['title']}\n\nDetails:\n{task_description['description']}"
+            if isinstance(task_description, str):
+                task_text = task_description
+            else:
                 task_text = task_description['title']
-                if (task_description['description']):
+                if (task_description.get('description')):
                     task_text += f"\n\n{task_description['description']}"
-                agent_ids = initialiseCodingAgent(
-                    repository_url=repo_url, 
-                    task_description=task_text,
-                    num_agents=num_agents,
-                    aider_commands=aider_commands # Pass aider commands
-                )
-                
-                if agent_ids:
-                    created_agents.extend(agent_ids)
-                    # Add task to tasks list if not already present
-                    if task_description not in tasks_data['tasks']:
-                        tasks_data['tasks'].append(task_description)
-                else:
-                    app.logger.warning(f"Failed to create agents for task: {task_description}")
-            except Exception as task_error:
-                app.logger.error(f"Error initializing agent for task {task_description}: {task_error}", exc_info=True)
+            app.logger.info(f"Queueing {num_agents} agent(s) for task: {task_text}")
+            job_ids.extend(provisioning_queue.submit(
+                repo_url,
+                task_text,
+                num_agents=num_agents,
+                aider_commands=aider_commands,
+                agent_config=agent_config
+            ))
         
         # Start main loop in a separate thread if not already running
         def check_and_start_main_loop():
@@ -156,19 +219,11 @@ def create_agent():
         
         check_and_start_main_loop()
         
-        if created_agents:
-            app.logger.info(f"Successfully created agents: {created_agents}")
-            return jsonify({
-                'success': True,
-                'agent_ids': created_agents,
-                'message': f'Agents {", ".join(created_agents)} created successfully'
-            })
-        else:
-            app.logger.error("Failed to create any agents")
-            return jsonify({
-                'success': False,
-                'error': 'Failed to create any agents'
-            }), 500
+        return jsonify({
+            'success': True,
+            'job_ids': job_ids,
+            'message': f'Queued {len(job_ids)} agent(s) for provisioning'
+        }), 202
             
     except Exception as e:
         # Log the full exception details
@@ -178,6 +233,24 @@ def create_agent():
             'error': str(e)
         }), 500
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Get the status of an agent provisioning job."""
+    job = provisioning_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': f'Job {job_id} not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/jobs')
+def list_jobs():
+    """Get provisioning jobs, optionally only those in ?ids=a,b."""
+    ids = request.args.get('ids')
+    jobs = provisioning_queue.list_jobs()
+    if ids:
+        wanted = set(ids.split(','))
+        jobs = [job for job in jobs if job['id'] in wanted]
+    return jsonify({'success': True, 'jobs': jobs})
+
 @app.route('/config/models', methods=['POST'])
 def update_model_config():
     """Update the model configuration for orchestrator, aider and agent."""
@@ -191,25 +264,16 @@ def update_model_config():
                 'error': 'Missing required fields. Need orchestrator_model, aider_model, and agent_model'
             }), 400
         
-        # Save to database
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            # Delete any existing config
-            cursor.execute("DELETE FROM model_config")
-            # Insert new config
-            cursor.execute("""
-                INSERT INTO model_config (
-                    orchestrator_model, aider_model, agent_model, 
-                    created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (
-                data['orchestrator_model'],
-                data['aider_model'],
-                data['agent_model'],
-                datetime.datetime.now().isoformat(),
-                datetime.datetime.now().isoformat()
-            ))
-            conn.commit()
+        # Save to database; this also invalidates the in-memory model config
+        if not save_model_config(
+            data['orchestrator_model'],
+            data['aider_model'],
+            data['agent_model']
+        ):
+            return jsonify({
+                'success': False,
+                'error': 'Failed to save model configuration'
+            }), 500
             
         return jsonify({
             'success': True,
@@ -262,6 +326,75 @@ def get_model_config():
             'error': str(e)
         }), 500
 
+MAX_PAGE_SIZE = 500  # Largest ?limit= the paged agent endpoints accept
+
+def page_limit():
+    """The ?limit= of a paged request, clamped to 1..MAX_PAGE_SIZE."""
+    return max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+@app.route('/agents/<agent_id>/history')
+def agent_history(agent_id):
+    """Page through an agent's progress or thought history, newest page first."""
+    kind = request.args.get('kind', 'progress')
+    if kind not in HISTORY_KINDS:
+        return jsonify({'success': False, 'error': f'Unknown history kind: {kind}'}), 400
+    limit = page_limit()
+    before = request.args.get('before', type=int)
+    entries = get_agent_history(agent_id, kind, limit=limit, before_id=before)
+    return jsonify({
+        'success': True,
+        'entries': entries,
+        # Pass as ?before= to fetch the previous page
+        'next_before': entries[0]['id'] if entries and len(entries) == limit else None
+    })
+
+@app.route('/agents/<agent_id>/events')
+def agent_events(agent_id):
+    """Page through an agent's parsed aider events (?type=&limit=&before=), newest page first."""
+    event_type = request.args.get('type')
+    if event_type is not None and event_type not in EVENT_TYPES:
+        return jsonify({'success': False, 'error': f'Unknown event type: {event_type}'}), 400
+    limit = page_limit()
+    before = request.args.get('before', type=int)
+    events = get_agent_events(agent_id, event_type, limit=limit, before_id=before)
+    return jsonify({
+        'success': True,
+        'events': events,
+        # Pass as ?before= to fetch the previous page
+        'next_before': events[0]['id'] if events and len(events) == limit else None
+    })
+
+@app.route('/agents/<agent_id>/output')
+def agent_output(agent_id):
+    """Get a character range of an agent's aider transcript (?start=&end=)."""
+    length = get_agent_output_length(agent_id)
+    start = min(max(0, request.args.get('start', 0, type=int)), length)
+    end = request.args.get('end', type=int)
+    end = length if end is None else min(max(end, start), length)
+    return jsonify({
+        'success': True,
+        'output': get_agent_output(agent_id, start, end),
+        'start': start,
+        'end': end,
+        'length': length
+    })
+
+@app.route('/llm/stats')
+def llm_stats():
+    """Get LLM scheduler queue depth, wait times and circuit breaker state per model."""
+    return jsonify({
+        'success': True,
+        'queue_depth': llm_scheduler.queue_depth(),
+        'models': llm_scheduler.get_stats(),
+        'cache': response_cache.stats(),
+        'circuits': circuit_breaker.get_stats()
+    })
+
+@app.route('/output_filter/stats')
+def output_filter_stats():
+    """Get per-rule counts of aider output lines dropped by the output filter."""
+    return jsonify({'success': True, **output_filter.stats()})
+
 @app.route('/config')
 def config_view():
     """Render the configuration view."""
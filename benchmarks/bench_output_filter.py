@@ -0,0 +1,105 @@
+"""Micro-benchmark for the aider output filter.
+
+Usage: python benchmarks/bench_output_filter.py [transcript.txt]
+
+Without a transcript a ~4 MB one is synthesised from typical aider output:
+edit blocks and diffs, startup banners, and scan/LLM spinner frames. The
+transcript is fed through the filter in 64 KiB chunks, as the I/O reactor
+delivers it, and compared with the per-line substring scan it replaced.
+That scan never collapsed spinners: "no collapse" does the same work as it,
+while "output_filter" is the shipped default, which also collapses progress
+frames. Compare legacy against both rows, not just the first. The
+"frame per call" row feeds the transcript a line per call with a stream key,
+the way a live progress bar reaches the filter.
+
+The synthesised transcript is not recorded aider output, so its timings only
+compare the implementations on that text; they say nothing about the cost on
+real sessions. Pass a transcript saved from a real session for that.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from io_reactor import READ_CHUNK_SIZE
+from output_filter import OutputFilter
+
+LEGACY_MESSAGES = [
+    "Can't initialize prompt toolkit",
+    "Newer aider version",
+    "Run this command to update:",
+    "python.exe -m pip install aider",
+    "cmd.exe?",
+    "Aider v",
+    "Model:",
+    "Git repo:",
+    "Repo-map:",
+    "Use /help"
+]
+
+def synthesize_transcript(target_bytes: int = 4 * 1024 * 1024, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    banner = (
+        "Aider v0.50.1\n"
+        "Model: openrouter/google/gemini-flash-1.5 with whole edit format\n"
+        "Git repo: .git with 212 files\n"
+        "Repo-map: using 2024 tokens\n"
+        "Use /help <question> for help, run \"aider --help\" to see cmd line args\n"
+    )
+    parts, size = [], 0
+    while size < target_bytes:
+        block = [banner] if rng.random() < 0.05 else []
+        block += [f"Scanning repo: {p}%|{'█' * (p // 10)}{' ' * (10 - p // 10)}| {p * 2}/200\n"
+                  for p in range(0, 101, 5)]
+        block += [f"Waiting for LLM {frame}\n" for frame in "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏" * 3]
+        block.append(f"src/module_{rng.randint(0, 99)}.py\n```python\n")
+        block += [f"    value_{i} = compute({i}, {rng.randint(0, 1000)})  # keep going\n"
+                  for i in range(rng.randint(20, 80))]
+        block.append("```\n\nApplied edit to src/module.py\n")
+        block.append(f"Commit {rng.getrandbits(28):07x} Refactor helpers\n> ")
+        text = ''.join(block)
+        parts.append(text)
+        size += len(text)
+    return ''.join(parts)
+
+def legacy_filter(text: str) -> str:
+    kept = []
+    for line in text.splitlines(keepends=True):
+        if any(msg in line for msg in LEGACY_MESSAGES):
+            continue
+        kept.append(line)
+    return ''.join(kept)
+
+def bench(name, func, chunks, lines, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for chunk in chunks:
+            func(chunk)
+        best = min(best, time.perf_counter() - start)
+    size = sum(len(chunk) for chunk in chunks)
+    print(f"{name:<14} {best * 1000:8.1f} ms  {best / lines * 1e9:8.1f} ns/line  {size / best / 1e6:8.1f} MB/s")
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding='utf-8', errors='replace') as f:
+            transcript = f.read()
+    else:
+        transcript = synthesize_transcript()
+    chunks = [transcript[i:i + READ_CHUNK_SIZE] for i in range(0, len(transcript), READ_CHUNK_SIZE)]
+    lines = transcript.count('\n') or 1
+    print(f"{len(transcript) / 1e6:.1f} MB, {lines} lines, {len(chunks)} chunks")
+    bench("legacy", legacy_filter, chunks, lines)
+    bench("no collapse", OutputFilter(progress_pattern=None).filter, chunks, lines)
+    bench("output_filter", OutputFilter().filter, chunks, lines)
+    stream_filter = OutputFilter()
+    bench("frame per call", lambda line: stream_filter.filter(line, 'stream'),
+          transcript.splitlines(keepends=True), lines, rounds=1)
+    output_filter = OutputFilter()
+    kept = sum(len(output_filter.filter(chunk)) for chunk in chunks)
+    print(f"kept {kept / len(transcript):.0%} of output; {output_filter.stats()}")
+
+if __name__ == '__main__':
+    main()
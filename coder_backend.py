@@ -0,0 +1,304 @@
+import importlib
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import uuid
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Dict, Optional
+
+from agent_session import AgentSession
+
+CODER_SPARE_WORKERS = 2  # Idle worker processes kept warm for new sessions
+CODER_MAX_WORKERS = 16  # Most worker processes the pool runs, spares included
+CODER_CREATE_TIMEOUT = 120  # Seconds to wait for a worker to build a Coder
+# Imported when a worker starts, so a spare worker's first Coder skips the import cost
+AIDER_MODULES = ('aider.coders', 'aider.io', 'aider.models', 'aider.repo')
+
+def _preload_aider() -> None:
+    for module in AIDER_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logging.warning(f"Could not preload {module} in coder worker: {e}")
+            return
+
+def _create_coder(workspace_path: str, model_name: str):
+    """Build a Coder for a workspace, as in scripting-agents.md."""
+    from aider.coders import Coder
+    from aider.io import InputOutput
+    from aider.models import Model
+    from aider.repo import GitRepo
+    aider_io = InputOutput(yes=True, pretty=False)
+    return Coder.create(
+        main_model=Model(model_name),
+        io=aider_io,
+        repo=GitRepo(aider_io, [], workspace_path),
+        fnames=[],
+        map_tokens=2024
+    )
+
+class _QueueWriter(io.TextIOBase):
+    """File-like object that forwards everything written to the parent process."""
+
+    def __init__(self, responses, session_id: str):
+        self.responses = responses
+        self.session_id = session_id
+
+    def write(self, text):
+        if text:
+            self.responses.put(('output', self.session_id, text))
+        return len(text)
+
+def _worker_main(requests, responses) -> None:
+    """Worker process loop: host Coders and run one instruction at a time."""
+    _preload_aider()
+    coders = {}
+    workspaces = {}
+    while True:
+        message = requests.get()
+        kind = message[0]
+        if kind == 'stop':
+            return
+        session_id = message[1]
+        if kind == 'create':
+            _, _, workspace_path, model_name = message
+            try:
+                os.chdir(workspace_path)
+                coders[session_id] = _create_coder(workspace_path, model_name)
+                workspaces[session_id] = workspace_path
+                responses.put(('created', session_id, True, None))
+            except Exception as e:
+                responses.put(('created', session_id, False, str(e)))
+        elif kind == 'run':
+            instruction = message[2]
+            try:
+                coder = coders[session_id]
+                # Coders in one worker may live in different repositories
+                os.chdir(workspaces[session_id])
+                writer = _QueueWriter(responses, session_id)
+                with redirect_stdout(writer), redirect_stderr(writer):
+                    coder.run(instruction)
+                responses.put(('done', session_id, True, None))
+            except Exception as e:
+                responses.put(('done', session_id, False, str(e)))
+        elif kind == 'close':
+            coders.pop(session_id, None)
+            workspaces.pop(session_id, None)
+
+class CoderWorkerPool:
+    """Pool of worker processes that host aider Coder instances.
+
+    Every session gets a worker process of its own, which keeps its Coder for
+    the session's lifetime, so one agent's long coder.run() never delays
+    another agent's instructions or Coder creation. Sessions do not share an
+    interpreter: each process holds its own copy of aider and litellm, so
+    memory grows with the number of sessions much as it does for CLI sessions.
+
+    The pool keeps `spare_workers` idle processes that imported aider when they
+    started, so a new session only pays for building its Coder. Closed
+    sessions hand their process back as a spare, and spares beyond
+    `spare_workers` are stopped. At most `max_workers` processes run at once;
+    creating a session when all of them are taken fails. A dispatcher thread
+    routes output and completion messages back to the owning CoderSession.
+    """
+
+    def __init__(self, spare_workers: int = CODER_SPARE_WORKERS, max_workers: int = CODER_MAX_WORKERS):
+        self.spare_workers = spare_workers
+        self.max_workers = max_workers
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []  # [process, requests queue, session ids]
+        self._responses = None
+        self._sessions: Dict[str, 'CoderSession'] = {}
+        self._session_workers: Dict[str, list] = {}
+        self._created: Dict[str, tuple] = {}
+        self._created_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+
+    def _start_worker(self) -> list:
+        # Caller must hold the lock
+        requests = self._context.Queue()
+        process = self._context.Process(target=_worker_main, args=(requests, self._responses), daemon=True)
+        process.start()
+        worker = [process, requests, set()]
+        self._workers.append(worker)
+        return worker
+
+    def _ensure_started(self) -> None:
+        """Start the dispatcher and top up the idle workers. Caller must hold the lock."""
+        if self._responses is None:
+            self._responses = self._context.Queue()
+            self._dispatcher = threading.Thread(target=self._dispatch, daemon=True, name='coder-dispatcher')
+            self._dispatcher.start()
+        self._workers = [w for w in self._workers if w[0].is_alive()]
+        spares = min(self.spare_workers - len(self._idle_workers()), self.max_workers - len(self._workers))
+        for _ in range(spares):
+            self._start_worker()
+
+    def _idle_workers(self) -> list:
+        return [w for w in self._workers if not w[2] and w[0].is_alive()]
+
+    def worker_count(self) -> int:
+        with self._lock:
+            return len(self._workers)
+
+    def create(self, session: 'CoderSession', workspace_path: str, model_name: str,
+               timeout: float = CODER_CREATE_TIMEOUT) -> bool:
+        with self._lock:
+            self._ensure_started()
+            idle = self._idle_workers()
+            if not idle and len(self._workers) >= self.max_workers:
+                logging.error(f"No coder worker free for session {session.session_id}: "
+                              f"all {self.max_workers} processes are in use")
+                return False
+            worker = idle[0] if idle else self._start_worker()
+            worker[2].add(session.session_id)
+            self._sessions[session.session_id] = session
+            self._session_workers[session.session_id] = worker
+            worker[1].put(('create', session.session_id, workspace_path, model_name))
+            # Replace the spare just taken so the next session finds one warm
+            self._ensure_started()
+        with self._created_cond:
+            if not self._created_cond.wait_for(lambda: session.session_id in self._created, timeout):
+                logging.error(f"Timed out creating coder for session {session.session_id}")
+                self.close(session.session_id)
+                return False
+            ok, error = self._created.pop(session.session_id)
+        if not ok:
+            logging.error(f"Failed to create coder for session {session.session_id}: {error}")
+            self.close(session.session_id)
+        return ok
+
+    def run(self, session_id: str, instruction: str) -> bool:
+        with self._lock:
+            worker = self._session_workers.get(session_id)
+            if not worker or not worker[0].is_alive():
+                return False
+            worker[1].put(('run', session_id, instruction))
+            return True
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            worker = self._session_workers.pop(session_id, None)
+            if worker:
+                worker[2].discard(session_id)
+                if worker[0].is_alive():
+                    worker[1].put(('close', session_id))
+                    if len(self._idle_workers()) > self.spare_workers:
+                        worker[1].put(('stop',))
+                        self._workers.remove(worker)
+
+    def _dispatch(self) -> None:
+        while True:
+            try:
+                kind, session_id, *payload = self._responses.get(timeout=1)
+            except queue.Empty:
+                self._reap_dead_workers()
+                continue
+            except (EOFError, OSError):
+                return
+            if kind == 'created':
+                with self._created_cond:
+                    self._created[session_id] = tuple(payload)
+                    self._created_cond.notify_all()
+                continue
+            session = self._sessions.get(session_id)
+            if not session:
+                continue
+            if kind == 'output':
+                session._handle_output(payload[0])
+            elif kind == 'done':
+                session._run_finished(*payload)
+
+    def _reap_dead_workers(self) -> None:
+        """Fail the sessions of workers that exited unexpectedly."""
+        with self._lock:
+            dead = [w for w in self._workers if not w[0].is_alive()]
+            sessions = [self._sessions.get(sid) for w in dead for sid in w[2]]
+            self._workers = [w for w in self._workers if w[0].is_alive()]
+        for session in sessions:
+            if session:
+                session._run_finished(False, "Coder worker process exited")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for process, requests, _ in workers:
+            if process.is_alive():
+                requests.put(('stop',))
+                process.join(timeout=5)
+
+# Shared by every CoderSession
+coder_pool = CoderWorkerPool()
+
+class CoderSession(AgentSession):
+    """AgentSession backed by an in-process aider Coder instead of the CLI.
+
+    Instructions are run with coder.run() on a CoderWorkerPool worker, so a turn
+    ends exactly when run() returns; readiness does not depend on the output
+    going quiet for stability_duration seconds. Custom aider command-line
+    arguments are not supported by this backend.
+    """
+
+    def __init__(self, workspace_path, task, config=None, aider_commands=None, agent_id=None, pool: Optional[CoderWorkerPool] = None):
+        super().__init__(workspace_path, task, config, aider_commands=aider_commands, agent_id=agent_id)
+        self.pool = pool or coder_pool
+        self.session_id = str(uuid.uuid4())
+        self._busy = False
+        self._alive = False
+
+    def start(self) -> bool:
+        try:
+            from database import get_model_config
+            config = get_model_config()
+            aider_model = (config.get('aider_model') if config else None) or 'openrouter/google/gemini-flash-1.5'
+            self._alive = self.pool.create(self, self.workspace_path, aider_model)
+            return self._alive
+        except Exception as e:
+            logging.error(f"Error starting coder session: {e}", exc_info=True)
+            return False
+
+    def is_alive(self) -> bool:
+        return self._alive and not self._stop_event.is_set()
+
+    def send_message(self, message: str, agent_action: str, timeout: int = 10) -> bool:
+        try:
+            if not self.is_alive() and not self.start():
+                return False
+            self.write_output(self._format_output_line(f"Agent Action: {agent_action}\n"))
+            with self._buffer_lock:
+                self._busy = True
+            if not self.pool.run(self.session_id, message):
+                self._run_finished(False, "Coder worker unavailable")
+                return False
+            return True
+        except Exception as e:
+            return False
+
+    def _run_finished(self, ok: bool, error: Optional[str] = None) -> None:
+        if not ok:
+            self.write_output(self._format_output_line(f"Coder error: {error}\n"))
+        with self._buffer_lock:
+            self._busy = False
+            self._touch_output()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the current instruction has finished running."""
+        try:
+            with self._output_cond:
+                return self._output_cond.wait_for(
+                    lambda: not self._busy or self._stop_event.is_set(), timeout
+                ) and not self._stop_event.is_set()
+        except Exception as e:
+            return False
+
+    def cleanup(self) -> None:
+        self._stop_event.set()
+        self._alive = False
+        with self._output_cond:
+            self._output_cond.notify_all()
+        self.pool.close(self.session_id)
@@ -0,0 +1,195 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import litellm
+
+# Default token budget for the per-turn user message sent to the agent model
+CONTEXT_TOKEN_BUDGET = 8000
+# Number of earlier turns listed individually in the rolling summary
+SUMMARY_TURNS = 20
+# Share of the budget the summary may use before it gets cut down
+SUMMARY_BUDGET_SHARE = 0.25
+CHARS_PER_TOKEN = 4
+# Cap on new aider output sent per turn, in tokens
+OUTPUT_TOKEN_BUDGET = 5000
+# Share of the output budget kept from the start of the new output; the rest goes to its tail
+HEAD_SHARE = 0.3
+# Output is tokenized in chunks aligned to these offsets so counts can be reused
+TOKEN_CHUNK_SIZE = 4096
+TOKEN_CACHE_SIZE = 4096  # Chunk token counts kept
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (roughly four characters per token)."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class TokenCounter:
+    """Counts tokens with a model's tokenizer, caching the count of each text.
+
+    Without a model, or if the tokenizer fails, falls back to estimate_tokens().
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        if not model:
+            return estimate_tokens(text)
+        key = (model, len(text), hash(text))
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return self._counts[key]
+            self.misses += 1
+        try:
+            tokens = litellm.token_counter(model=model, text=text)
+        except Exception as e:
+            logging.debug(f"Token counting for {model} failed, estimating: {e}")
+            tokens = estimate_tokens(text)
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+def _chunks(text: str, start_offset: int) -> List[str]:
+    """Split text, which starts at start_offset, on TOKEN_CHUNK_SIZE boundaries."""
+    first = TOKEN_CHUNK_SIZE - start_offset % TOKEN_CHUNK_SIZE
+    chunks = [text[:first]]
+    chunks.extend(text[i:i + TOKEN_CHUNK_SIZE] for i in range(first, len(text), TOKEN_CHUNK_SIZE))
+    return [c for c in chunks if c]
+
+def _cut(chunk: str, tokens: int, budget: int, from_end: bool) -> str:
+    """Keep roughly budget tokens of a chunk that holds tokens."""
+    keep = int(len(chunk) * budget / tokens) if tokens else 0
+    if keep <= 0:
+        return ''
+    return chunk[-keep:] if from_end else chunk[:keep]
+
+def trim_middle(text: str, budget: int, counter: TokenCounter, model: Optional[str] = None,
+                start_offset: int = 0, head_share: float = HEAD_SHARE) -> str:
+    """Fit text into budget tokens by keeping its head and tail and eliding the middle.
+
+    Only the chunks that are kept get tokenized, so the cost is bounded by the
+    budget rather than the length of text.
+    """
+    chunks = _chunks(text, start_offset)
+    head_budget = int(budget * head_share)
+    head, tail = [], []
+    head_used = used = 0
+    i, j = 0, len(chunks) - 1
+    # Whole chunks from the start up to the head's share, then from the end up to the budget
+    while i <= j:
+        tokens = counter.count(chunks[i], model)
+        if used + tokens > head_budget:
+            break
+        head.append(chunks[i])
+        used += tokens
+        i += 1
+    head_used = used
+    while i <= j:
+        tokens = counter.count(chunks[j], model)
+        if used + tokens > budget:
+            break
+        tail.append(chunks[j])
+        used += tokens
+        j -= 1
+    if i > j:
+        return text
+    # It does not all fit: hand the innermost tail chunks back until the head can have its share
+    while tail and budget - used < head_budget - head_used:
+        j += 1
+        used -= counter.count(tail.pop(), model)
+    # Spend what is left on the chunks either side of the elided middle
+    head_extra = min(budget - used, max(0, head_budget - head_used))
+    if head_extra > 0:
+        head.append(_cut(chunks[i], counter.count(chunks[i], model), head_extra, from_end=False))
+        used += head_extra
+    if budget - used > 0:
+        tail.append(_cut(chunks[j], counter.count(chunks[j], model), budget - used, from_end=True))
+    head_text, tail_text = ''.join(head), ''.join(reversed(tail))
+    # Chunks are cut at fixed offsets; elide the partial lines either side of the gap too
+    if '\n' in head_text:
+        head_text = head_text[:head_text.rfind('\n') + 1]
+    if tail_text and text[-len(tail_text) - 1] != '\n' and '\n' in tail_text:
+        tail_text = tail_text[tail_text.find('\n') + 1:]
+    omitted = len(text) - len(head_text) - len(tail_text)
+    logging.debug(f"Trimmed context output from {len(text)} characters, {omitted} omitted")
+    return f"{head_text}\n[... {omitted} characters omitted ...]\n{tail_text}"
+
+class ContextBuilder:
+    """Builds the per-turn user message for an agent.
+
+    Instead of resending the whole aider transcript every turn, the message holds
+    the output produced since the agent's last decision plus a compact summary of
+    earlier turns taken from the PromptProcessor response history, kept under a
+    token budget. New output over output_token_budget keeps its head and tail,
+    counted with the agent model's tokenizer.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, summary_turns: int = SUMMARY_TURNS,
+                 output_token_budget: int = OUTPUT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary_turns = summary_turns
+        self.output_token_budget = output_token_budget
+        self.offsets: Dict[str, int] = {}
+        self.token_counter = TokenCounter()
+        self._lock = threading.Lock()
+
+    def build(self, agent_id: str, session, history: List, model: Optional[str] = None) -> Tuple[str, int]:
+        """Return the user message for this turn and the output offset it covers.
+
+        Pass the offset to commit() once the decision has been made so the next
+        turn starts after it. model selects the tokenizer used for the budget.
+        """
+        with self._lock:
+            offset = self.offsets.get(agent_id, 0)
+        delta, end_offset = session.read_since(offset)
+        if not history and (not delta or delta.isspace()):
+            return "*aider started*", end_offset
+
+        summary = self._summarize(history, int(self.token_budget * SUMMARY_BUDGET_SHARE))
+        delta_budget = min(self.output_token_budget,
+                           self.token_budget - self.token_counter.count(summary, model))
+        sections = []
+        if summary:
+            sections.append(f"Summary of your earlier turns (oldest first):\n{summary}")
+        if delta and not delta.isspace():
+            trimmed = trim_middle(delta, max(delta_budget, 1), self.token_counter, model,
+                                  start_offset=end_offset - len(delta))
+            sections.append(f"New aider output since your last action:\n{trimmed}")
+        else:
+            sections.append("No new aider output since your last action.")
+        return "\n\n".join(sections), end_offset
+
+    def commit(self, agent_id: str, offset: int) -> None:
+        """Mark output up to offset as seen by the agent model."""
+        with self._lock:
+            self.offsets[agent_id] = max(offset, self.offsets.get(agent_id, 0))
+
+    def reset(self, agent_id: str) -> None:
+        with self._lock:
+            self.offsets.pop(agent_id, None)
+
+    def _summarize(self, history: List, budget: int) -> str:
+        if not history:
+            return ""
+        recent = history[-self.summary_turns:]
+        lines = [f"- {r.action.strip()} -> {r.progress.strip()}" for r in recent]
+        omitted = len(history) - len(recent)
+        # Drop the oldest listed turns until the summary fits its share of the budget
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+            lines.pop(0)
+            omitted += 1
+        if omitted:
+            lines.insert(0, f"({omitted} earlier turns omitted)")
+        return "\n".join(lines)
@@ -1,18 +1,103 @@
 import sqlite3
 from pathlib import Path
 import json
+import queue
+import time
+import threading
+from contextlib import closing, contextmanager
 from datetime import datetime
 from typing import Dict, List, Optional
 
 DATABASE_PATH = Path("tasks.db")
 
+# Connection pool settings
+POOL_SIZE = 8  # Idle connections kept per database file
+BUSY_TIMEOUT = 5.0  # Seconds to wait on a locked database before failing
+CACHED_STATEMENTS = 256  # Prepared statements cached per connection
+
+HISTORY_KINDS = ('progress', 'thought')
+HISTORY_PAGE_SIZE = 50  # History entries embedded in agent records and returned per page
+RECENT_EVENTS = 10  # Latest aider events embedded in agent records
+OUTPUT_TAIL_LENGTH = 100000  # Characters of aider output embedded in agent records
+CHANGE_LOG_RETENTION = 10000  # change_log rows kept for ?since= delta reads
+# Columns save_agent() may write; aider_output and the history columns are legacy,
+# see agent_output and agent_history
+AGENT_COLUMNS = (
+    'workspace', 'repo_path', 'task', 'status', 'created_at', 'last_updated',
+    'last_critique', 'progress', 'thought', 'future',
+    'last_action', 'pr_url', 'error', 'completed', 'agent_type'
+)
+
+_pools: Dict[str, queue.LifoQueue] = {}
+_pools_lock = threading.Lock()
+
+# In-memory copy of the latest model_config row. Writers bump the version, readers
+# reload only when the version (or database path) they cached no longer matches.
+_model_config_lock = threading.Lock()
+_model_config_version = 0
+_model_config_cache = {'version': -1, 'path': None, 'config': None}
+
+def _open_connection(path) -> sqlite3.Connection:
+    """Open a connection tuned for concurrent readers and writers."""
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL lets the UI read while the orchestrator writes; NORMAL sync is safe with WAL
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+    return conn
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection to DATABASE_PATH for the duration of the block.
+
+    Commits on success and rolls back on error, like using sqlite3.connect() as a
+    context manager, but the connection is handed back to the pool instead of
+    being thrown away.
+    """
+    path = str(DATABASE_PATH)
+    with _pools_lock:
+        pool = _pools.setdefault(path, queue.LifoQueue())
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(path)
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if pool.qsize() < POOL_SIZE:
+            pool.put(conn)
+        else:
+            conn.close()
+
+def close_all_connections() -> None:
+    """Close every idle pooled connection."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
 def init_db():
     """Initialize the SQLite database with required tables."""
     try:
         # Create database file if it doesn't exist
         DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
         
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with closing(_open_connection(DATABASE_PATH)) as conn:
             cursor = conn.cursor()
             
             # Create model_config table
@@ -70,6 +155,79 @@ def init_db():
                 )
             """)
             
+            # Create LLM response cache table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed
+                ON llm_cache (last_accessed)
+            """)
+            
+            # Create append-only agent history table (progress/thought entries)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agent_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    content TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agent_history_agent_kind
+                ON agent_history (agent_id, kind, id)
+            """)
+            _migrate_history_columns(cursor)
+            
+            # Create append-only log of structured aider events (edits, commits, commands, ...)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agent_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    output_offset INTEGER,
+                    data TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agent_events_agent_type
+                ON agent_events (agent_id, type, id)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agent_events_agent
+                ON agent_events (agent_id, id)
+            """)
+            
+            # Create change log; version is the global, monotonically increasing change counter
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS change_log (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT,
+                    agent_id TEXT,
+                    field TEXT NOT NULL,
+                    start_offset INTEGER
+                )
+            """)
+            
+            # Create append-only aider output table; each row is a chunk starting at start_offset
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agent_output (
+                    agent_id TEXT NOT NULL,
+                    start_offset INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (agent_id, start_offset)
+                )
+            """)
+            _migrate_output_column(cursor)
+            
             # Insert default model config if none exists
             cursor.execute("SELECT COUNT(*) FROM model_config")
             if cursor.fetchone()[0] == 0:
@@ -87,101 +245,436 @@ def init_db():
                 ))
             
             conn.commit()
+        invalidate_model_config_cache()
     except Exception as e:
         print(f"Error initializing database: {e}")
         raise
 
+def _migrate_history_columns(cursor) -> None:
+    """Move history stored as JSON blobs on the agents row into agent_history."""
+    cursor.execute("""
+        SELECT id, progress_history, thought_history FROM agents
+        WHERE (progress_history IS NOT NULL AND progress_history != '[]')
+           OR (thought_history IS NOT NULL AND thought_history != '[]')
+    """)
+    for agent_id, progress_history, thought_history in cursor.fetchall():
+        for kind, blob in (('progress', progress_history), ('thought', thought_history)):
+            try:
+                entries = json.loads(blob) if blob else []
+            except json.JSONDecodeError:
+                entries = []
+            for entry in entries:
+                if isinstance(entry, dict):
+                    ts, content = entry.get('timestamp'), entry.get('content')
+                else:
+                    ts, content = None, entry
+                cursor.execute(
+                    "INSERT INTO agent_history (agent_id, ts, kind, content) VALUES (?, ?, ?, ?)",
+                    (agent_id, ts or datetime.now().isoformat(), kind, content)
+                )
+        cursor.execute(
+            "UPDATE agents SET progress_history = NULL, thought_history = NULL WHERE id = ?",
+            (agent_id,)
+        )
+
+def _migrate_output_column(cursor) -> None:
+    """Move transcripts stored in agents.aider_output into agent_output."""
+    cursor.execute("SELECT id, aider_output FROM agents WHERE aider_output IS NOT NULL AND aider_output != ''")
+    for agent_id, output in cursor.fetchall():
+        _append_output(cursor, agent_id, output)
+        cursor.execute("UPDATE agents SET aider_output = NULL WHERE id = ?", (agent_id,))
+
+def _log_change(cursor, agent_id: Optional[str], field: str, start_offset: Optional[int] = None) -> None:
+    """Record a change for get_changes_since().
+
+    field is an agents column, '<kind>_history', 'events', 'aider_output' (with the offset
+    the appended text starts at), '*' for a full agent write, '-' for a deleted
+    agent, or for agent_id None, 'tasks' or a config key.
+    """
+    cursor.execute(
+        "INSERT INTO change_log (agent_id, field, start_offset) VALUES (?, ?, ?)",
+        (agent_id, field, start_offset)
+    )
+    version = cursor.lastrowid
+    if version % 500 == 0:
+        cursor.execute("DELETE FROM change_log WHERE version <= ?", (version - CHANGE_LOG_RETENTION,))
+
+class AgentRecord(dict):
+    """Agent row loaded from the database that remembers which columns changed.
+
+    Records returned by get_agent()/get_all_agents() are AgentRecords. Saving one
+    writes only its dirty columns with an UPDATE instead of rewriting the whole
+    row. Plain dicts are still saved in full.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dirty = set()
+
+    def __setitem__(self, key, value):
+        if key not in self or self[key] != value:
+            self._dirty.add(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._dirty.add(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key in self:
+            self._dirty.add(key)
+        return super().pop(key, *args)
+
+    def dirty_columns(self) -> List[str]:
+        """Changed keys that map to agents table columns."""
+        return [key for key in AGENT_COLUMNS if key in self._dirty]
+
+    def mark_clean(self) -> None:
+        self._dirty.clear()
+
+def _agent_row(agent_id: str, agent_data: Dict) -> Dict:
+    """Full agents row for agent_data, filling defaults for missing fields."""
+    return {
+        'id': agent_id,
+        'workspace': agent_data.get('workspace'),
+        'repo_path': agent_data.get('repo_path'),
+        'task': agent_data.get('task'),
+        'status': agent_data.get('status', 'pending'),
+        'created_at': agent_data.get('created_at', datetime.now().isoformat()),
+        'last_updated': agent_data.get('last_updated', datetime.now().isoformat()),
+        'aider_output': None,
+        'last_critique': agent_data.get('last_critique', ''),
+        'progress': agent_data.get('progress', ''),
+        'thought': agent_data.get('thought', ''),
+        'progress_history': None,
+        'thought_history': None,
+        'future': agent_data.get('future', ''),
+        'last_action': agent_data.get('last_action', ''),
+        'pr_url': agent_data.get('pr_url', ''),
+        'error': agent_data.get('error', ''),
+        'completed': agent_data.get('completed', 0),
+        'agent_type': agent_data.get('agent_type', 'default')
+    }
+
+def _write_agent(cursor, agent_id: str, agent_data: Dict) -> None:
+    if isinstance(agent_data, AgentRecord):
+        columns = agent_data.dirty_columns()
+        if not columns:
+            return
+        row = _agent_row(agent_id, agent_data)
+        # A record whose row has since been deleted updates nothing rather than resurrecting it
+        cursor.execute(
+            f"UPDATE agents SET {', '.join(f'{c} = :{c}' for c in columns)} WHERE id = :id",
+            {c: row[c] for c in columns + ['id']}
+        )
+        if cursor.rowcount:
+            for column in columns:
+                _log_change(cursor, agent_id, column)
+        return
+    # progress/thought history lives in agent_history, see append_agent_history()
+    cursor.execute("""
+        INSERT OR REPLACE INTO agents VALUES (
+            :id, :workspace, :repo_path, :task, :status, :created_at, 
+            :last_updated, :aider_output, :last_critique, :progress, 
+            :thought, :progress_history, :thought_history, :future, 
+            :last_action, :pr_url, :error, :completed, :agent_type
+        )
+    """, _agent_row(agent_id, agent_data))
+    _log_change(cursor, agent_id, '*')
+
 def save_agent(agent_id: str, agent_data: Dict) -> bool:
-    """Save or update an agent in the database."""
+    """Save or update an agent in the database.
+
+    An AgentRecord only has its changed columns written; a plain dict replaces
+    the whole row.
+    """
+    return save_agents({agent_id: agent_data})
+
+def save_agents(agents: Dict[str, Dict]) -> bool:
+    """Save several agents in a single transaction, see save_agent()."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Convert lists to JSON strings
-            progress_history = json.dumps(agent_data.get('progress_history', []))
-            thought_history = json.dumps(agent_data.get('thought_history', []))
-            
-            cursor.execute("""
-                INSERT OR REPLACE INTO agents VALUES (
-                    :id, :workspace, :repo_path, :task, :status, :created_at, 
-                    :last_updated, :aider_output, :last_critique, :progress, 
-                    :thought, :progress_history, :thought_history, :future, 
-                    :last_action, :pr_url, :error, :completed, :agent_type
-                )
-            """, {
-                'id': agent_id,
-                'workspace': agent_data.get('workspace'),
-                'repo_path': agent_data.get('repo_path'),
-                'task': agent_data.get('task'),
-                'status': agent_data.get('status', 'pending'),
-                'created_at': agent_data.get('created_at', datetime.now().isoformat()),
-                'last_updated': agent_data.get('last_updated', datetime.now().isoformat()),
-                'aider_output': agent_data.get('aider_output', ''),
-                'last_critique': agent_data.get('last_critique', ''),
-                'progress': agent_data.get('progress', ''),
-                'thought': agent_data.get('thought', ''),
-                'progress_history': progress_history,
-                'thought_history': thought_history,
-                'future': agent_data.get('future', ''),
-                'last_action': agent_data.get('last_action', ''),
-                'pr_url': agent_data.get('pr_url', ''),
-                'error': agent_data.get('error', ''),
-                'completed': agent_data.get('completed', 0),
-                'agent_type': agent_data.get('agent_type', 'default')
-            })
+            for agent_id, agent_data in agents.items():
+                _write_agent(cursor, agent_id, agent_data)
             conn.commit()
-            return True
+        for agent_data in agents.values():
+            if isinstance(agent_data, AgentRecord):
+                agent_data.mark_clean()
+        return True
     except Exception as e:
         print(f"Error saving agent: {e}")
         return False
 
-def get_agent(agent_id: str) -> Optional[Dict]:
-    """Get an agent by ID."""
+def get_agent(agent_id: str, full: bool = True) -> Optional[Dict]:
+    """Get an agent by ID.
+
+    With full=False only the agents columns are read, without the output tail,
+    history pages and events that views of the agent need; use it on hot paths.
+    """
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM agents WHERE id = ?", (agent_id,))
+            if full:
+                cursor.execute("SELECT * FROM agents WHERE id = ?", (agent_id,))
+            else:
+                cursor.execute(f"SELECT id, {', '.join(AGENT_COLUMNS)} FROM agents WHERE id = ?", (agent_id,))
             row = cursor.fetchone()
             if row:
-                agent_data = dict(row)
-                # Convert JSON strings back to lists
-                agent_data['progress_history'] = json.loads(agent_data['progress_history'])
-                agent_data['thought_history'] = json.loads(agent_data['thought_history'])
+                agent_data = AgentRecord(row)
+                if full:
+                    _attach_history(cursor, agent_data)
+                agent_data.mark_clean()
                 return agent_data
             return None
     except Exception as e:
         print(f"Error getting agent: {e}")
         return None
 
+def get_agent_fields(agent_id: str, fields: List[str]) -> Optional[Dict]:
+    """Get just the given fields of an agent, for change deltas.
+
+    fields are change_log field names: agents columns, '<kind>_history',
+    'events', 'aider_output' (which reads only aider_output_length) or '*' for
+    all of them. The output tail is never included. Returns None if the agent
+    does not exist.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            every = '*' in fields
+            columns = ['id'] + [c for c in AGENT_COLUMNS if every or c in fields]
+            cursor.execute(f"SELECT {', '.join(columns)} FROM agents WHERE id = ?", (agent_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            agent_data = dict(row)
+            for kind in HISTORY_KINDS:
+                if every or f'{kind}_history' in fields:
+                    agent_data[f'{kind}_history'] = _history_page(cursor, agent_id, kind, HISTORY_PAGE_SIZE)
+            if every or 'events' in fields:
+                agent_data['events'] = {
+                    'recent': _event_page(cursor, agent_id, None, RECENT_EVENTS),
+                    'counts': _event_counts(cursor, agent_id)
+                }
+            if every or 'aider_output' in fields:
+                agent_data['aider_output_length'] = _output_length(cursor, agent_id)
+            return agent_data
+    except Exception as e:
+        print(f"Error getting agent fields: {e}")
+        return None
+
 def get_all_agents() -> Dict[str, Dict]:
     """Get all agents."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM agents")
             rows = cursor.fetchall()
             agents = {}
             for row in rows:
-                agent_data = dict(row)
-                # Convert JSON strings back to lists
-                agent_data['progress_history'] = json.loads(agent_data['progress_history'])
-                agent_data['thought_history'] = json.loads(agent_data['thought_history'])
+                agent_data = AgentRecord(row)
+                _attach_history(cursor, agent_data)
+                agent_data.mark_clean()
                 agents[agent_data['id']] = agent_data
             return agents
     except Exception as e:
         print(f"Error getting all agents: {e}")
         return {}
 
+def _history_page(cursor, agent_id: str, kind: str, limit: int, before_id: Optional[int] = None) -> List[Dict]:
+    if before_id is None:
+        cursor.execute("""
+            SELECT id, ts, content FROM agent_history
+            WHERE agent_id = ? AND kind = ?
+            ORDER BY id DESC LIMIT ?
+        """, (agent_id, kind, limit))
+    else:
+        cursor.execute("""
+            SELECT id, ts, content FROM agent_history
+            WHERE agent_id = ? AND kind = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        """, (agent_id, kind, before_id, limit))
+    rows = cursor.fetchall()
+    return [{'id': r[0], 'timestamp': r[1], 'content': r[2]} for r in reversed(rows)]
+
+def _attach_history(cursor, agent_data: Dict) -> None:
+    """Add the most recent page of each history kind and the output tail to an agent record."""
+    for kind in HISTORY_KINDS:
+        agent_data[f'{kind}_history'] = _history_page(cursor, agent_data['id'], kind, HISTORY_PAGE_SIZE)
+    agent_data['events'] = {
+        'recent': _event_page(cursor, agent_data['id'], None, RECENT_EVENTS),
+        'counts': _event_counts(cursor, agent_data['id'])
+    }
+    length = _output_length(cursor, agent_data['id'])
+    agent_data['aider_output'] = _output_range(cursor, agent_data['id'], max(0, length - OUTPUT_TAIL_LENGTH), length)
+    agent_data['aider_output_length'] = length
+
+def append_agent_history(agent_id: str, kind: str, content: str, timestamp: Optional[str] = None) -> Optional[int]:
+    """Append a progress/thought entry for an agent; returns the new entry id."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO agent_history (agent_id, ts, kind, content) VALUES (?, ?, ?, ?)",
+                (agent_id, timestamp or datetime.now().isoformat(), kind, content)
+            )
+            entry_id = cursor.lastrowid
+            _log_change(cursor, agent_id, f'{kind}_history')
+            return entry_id
+    except Exception as e:
+        print(f"Error appending agent history: {e}")
+        return None
+
+def get_agent_history(agent_id: str, kind: str, limit: int = HISTORY_PAGE_SIZE, before_id: Optional[int] = None) -> List[Dict]:
+    """Get a page of history entries, oldest first, ending just before before_id."""
+    try:
+        with get_connection() as conn:
+            return _history_page(conn.cursor(), agent_id, kind, limit, before_id)
+    except Exception as e:
+        print(f"Error getting agent history: {e}")
+        return []
+
+def _event_page(cursor, agent_id: str, event_type: Optional[str], limit: int, before_id: Optional[int] = None) -> List[Dict]:
+    where, params = ["agent_id = ?"], [agent_id]
+    if event_type is not None:
+        where.append("type = ?")
+        params.append(event_type)
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    cursor.execute(f"""
+        SELECT id, ts, type, output_offset, data FROM agent_events
+        WHERE {' AND '.join(where)}
+        ORDER BY id DESC LIMIT ?
+    """, params + [limit])
+    rows = cursor.fetchall()
+    return [
+        {'id': r[0], 'timestamp': r[1], 'type': r[2], 'offset': r[3], 'data': json.loads(r[4]) if r[4] else {}}
+        for r in reversed(rows)
+    ]
+
+def _event_counts(cursor, agent_id: str) -> Dict[str, int]:
+    cursor.execute("SELECT type, COUNT(*) FROM agent_events WHERE agent_id = ? GROUP BY type", (agent_id,))
+    return dict(cursor.fetchall())
+
+def append_agent_events(agent_id: str, events: List[Dict]) -> Optional[int]:
+    """Append parsed aider events for an agent; returns the id of the last one."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            last_id = None
+            for event in events:
+                cursor.execute(
+                    "INSERT INTO agent_events (agent_id, ts, type, output_offset, data) VALUES (?, ?, ?, ?, ?)",
+                    (agent_id, event.get('timestamp') or datetime.now().isoformat(), event['type'],
+                     event.get('offset'), json.dumps(event.get('data') or {}))
+                )
+                last_id = cursor.lastrowid
+            if last_id is not None:
+                _log_change(cursor, agent_id, 'events')
+            return last_id
+    except Exception as e:
+        print(f"Error appending agent events: {e}")
+        return None
+
+def get_agent_events(agent_id: str, event_type: Optional[str] = None, limit: int = HISTORY_PAGE_SIZE,
+                     before_id: Optional[int] = None) -> List[Dict]:
+    """Get a page of aider events, oldest first, ending just before before_id."""
+    try:
+        with get_connection() as conn:
+            return _event_page(conn.cursor(), agent_id, event_type, limit, before_id)
+    except Exception as e:
+        print(f"Error getting agent events: {e}")
+        return []
+
+def _output_length(cursor, agent_id: str) -> int:
+    cursor.execute("""
+        SELECT start_offset + length(content) FROM agent_output
+        WHERE agent_id = ? ORDER BY start_offset DESC LIMIT 1
+    """, (agent_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def _output_range(cursor, agent_id: str, start: int, end: Optional[int]) -> str:
+    # The chunk containing start is the last one that begins at or before it
+    cursor.execute("""
+        SELECT start_offset, content FROM agent_output
+        WHERE agent_id = ? AND start_offset >= COALESCE(
+            (SELECT MAX(start_offset) FROM agent_output WHERE agent_id = ? AND start_offset <= ?), 0)
+        AND (? IS NULL OR start_offset < ?)
+        ORDER BY start_offset
+    """, (agent_id, agent_id, start, end, end))
+    parts = []
+    for chunk_start, content in cursor.fetchall():
+        lo = max(0, start - chunk_start)
+        hi = len(content) if end is None else min(len(content), end - chunk_start)
+        if hi > lo:
+            parts.append(content[lo:hi])
+    return ''.join(parts)
+
+def _append_output(cursor, agent_id: str, text: str) -> int:
+    end = _output_length(cursor, agent_id)
+    cursor.execute(
+        "INSERT INTO agent_output (agent_id, start_offset, content) VALUES (?, ?, ?)",
+        (agent_id, end, text)
+    )
+    _log_change(cursor, agent_id, 'aider_output', end)
+    return end + len(text)
+
+def append_agent_output(agent_id: str, text: str) -> Optional[int]:
+    """Append text to an agent's stored transcript; returns the new transcript length."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if not text:
+                return _output_length(cursor, agent_id)
+            return _append_output(cursor, agent_id, text)
+    except Exception as e:
+        print(f"Error appending agent output: {e}")
+        return None
+
+def get_agent_output(agent_id: str, start: int = 0, end: Optional[int] = None) -> str:
+    """Get the characters [start, end) of an agent's stored transcript."""
+    try:
+        with get_connection() as conn:
+            return _output_range(conn.cursor(), agent_id, max(0, start), end)
+    except Exception as e:
+        print(f"Error getting agent output: {e}")
+        return ''
+
+def get_agent_output_length(agent_id: str) -> int:
+    """Get the length of an agent's stored transcript."""
+    try:
+        with get_connection() as conn:
+            return _output_length(conn.cursor(), agent_id)
+    except Exception as e:
+        print(f"Error getting agent output length: {e}")
+        return 0
+
 def delete_agent(agent_id: str) -> bool:
     """Delete an agent from the database."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM agents WHERE id = ?", (agent_id,))
+            deleted = cursor.rowcount > 0
+            cursor.execute("DELETE FROM agent_history WHERE agent_id = ?", (agent_id,))
+            cursor.execute("DELETE FROM agent_events WHERE agent_id = ?", (agent_id,))
+            cursor.execute("DELETE FROM agent_output WHERE agent_id = ?", (agent_id,))
+            if deleted:
+                _log_change(cursor, agent_id, '-')
             conn.commit()
-            return cursor.rowcount > 0
+            return deleted
     except Exception as e:
         print(f"Error deleting agent: {e}")
         return False
@@ -189,7 +682,7 @@ def delete_agent(agent_id: str) -> bool:
 def save_task(task_data: Dict) -> int:
     """Save a task to the database."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO tasks (title, description, created_at)
@@ -199,8 +692,10 @@ def save_task(task_data: Dict) -> int:
                 'description': task_data.get('description'),
                 'created_at': datetime.now().isoformat()
             })
+            task_id = cursor.lastrowid
+            _log_change(cursor, None, 'tasks')
             conn.commit()
-            return cursor.lastrowid
+            return task_id
     except Exception as e:
         print(f"Error saving task: {e}")
         return -1
@@ -208,8 +703,7 @@ def save_task(task_data: Dict) -> int:
 def get_all_tasks() -> List[Dict]:
     """Get all tasks."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM tasks")
             return [dict(row) for row in cursor.fetchall()]
@@ -220,7 +714,7 @@ def get_all_tasks() -> List[Dict]:
 def get_config(key: str) -> Optional[str]:
     """Get a config value."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT value FROM config WHERE key = ?", (key,))
             row = cursor.fetchone()
@@ -232,30 +726,181 @@ def get_config(key: str) -> Optional[str]:
 def save_config(key: str, value: str) -> bool:
     """Save a config value."""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT value FROM config WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            if row and row[0] == value:
+                return True
             cursor.execute("""
                 INSERT OR REPLACE INTO config (key, value)
                 VALUES (:key, :value)
             """, {'key': key, 'value': value})
+            _log_change(cursor, None, key)
             conn.commit()
             return True
     except Exception as e:
         print(f"Error saving config: {e}")
         return False
 
+def get_change_version() -> int:
+    """Get the current global change version (0 before any change)."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(version) FROM change_log")
+            return cursor.fetchone()[0] or 0
+    except Exception as e:
+        print(f"Error getting change version: {e}")
+        return 0
+
+def get_changes_since(version: int) -> Optional[Dict]:
+    """Summarize the changes made after version.
+
+    Returns {'version', 'agents': {agent_id: {'fields', 'output_start'}},
+    'deleted', 'tasks', 'config'}, or None when version is unknown or older than
+    the retained change log and the caller needs a full reload.
+    """
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(version), MAX(version) FROM change_log")
+            oldest, current = cursor.fetchone()
+            current = current or 0
+            if version < 0 or version > current or (oldest is not None and version < oldest - 1):
+                return None
+            cursor.execute("""
+                SELECT agent_id, field, start_offset FROM change_log
+                WHERE version > ? AND version <= ? ORDER BY version
+            """, (version, current))
+            changes = {'version': current, 'agents': {}, 'deleted': [], 'tasks': False, 'config': []}
+            for agent_id, field, start_offset in cursor.fetchall():
+                if agent_id is None:
+                    if field == 'tasks':
+                        changes['tasks'] = True
+                    elif field not in changes['config']:
+                        changes['config'].append(field)
+                elif field == '-':
+                    changes['agents'].pop(agent_id, None)
+                    if agent_id not in changes['deleted']:
+                        changes['deleted'].append(agent_id)
+                else:
+                    if agent_id in changes['deleted']:
+                        changes['deleted'].remove(agent_id)
+                    agent = changes['agents'].setdefault(agent_id, {'fields': [], 'output_start': None})
+                    if field not in agent['fields']:
+                        agent['fields'].append(field)
+                    if field == 'aider_output' and agent['output_start'] is None:
+                        agent['output_start'] = start_offset
+            return changes
+    except Exception as e:
+        print(f"Error getting changes: {e}")
+        return None
+
+def invalidate_model_config_cache() -> int:
+    """Drop the cached model config so the next lookup reads it again."""
+    global _model_config_version
+    with _model_config_lock:
+        _model_config_version += 1
+        return _model_config_version
+
+def get_model_config_version() -> int:
+    return _model_config_version
+
 def get_model_config() -> Optional[Dict]:
-    """Get the current model configuration."""
+    """Get the current model configuration (served from memory until it changes)."""
+    with _model_config_lock:
+        version = _model_config_version
+        if _model_config_cache['version'] == version and _model_config_cache['path'] == DATABASE_PATH:
+            config = _model_config_cache['config']
+            return dict(config) if config else None
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
+        with get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM model_config ORDER BY id DESC LIMIT 1")
             config = cursor.fetchone()
-            return dict(config) if config else None
+            config = dict(config) if config else None
     except Exception as e:
         print(f"Error getting model config: {e}")
         return None
+    with _model_config_lock:
+        # Only cache if nobody wrote a new config while we were reading
+        if _model_config_version == version:
+            _model_config_cache.update({'version': version, 'path': DATABASE_PATH, 'config': config})
+    return dict(config) if config else None
+
+def save_model_config(orchestrator_model: str, aider_model: str, agent_model: str) -> bool:
+    """Replace the model configuration and invalidate the cached copy."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            # Delete any existing config
+            cursor.execute("DELETE FROM model_config")
+            cursor.execute("""
+                INSERT INTO model_config (
+                    orchestrator_model, aider_model, agent_model,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?)
+            """, (
+                orchestrator_model,
+                aider_model,
+                agent_model,
+                datetime.now().isoformat(),
+                datetime.now().isoformat()
+            ))
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error saving model config: {e}")
+        return False
+    finally:
+        invalidate_model_config_cache()
+
+def get_cached_response(key: str, ttl: float) -> Optional[str]:
+    """Get a cached LLM response that is younger than ttl seconds."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            now = time.time()
+            cursor.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, now - ttl)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute(
+                "UPDATE llm_cache SET last_accessed = ?, hits = hits + 1 WHERE key = ?",
+                (now, key)
+            )
+            conn.commit()
+            return row[0]
+    except Exception as e:
+        print(f"Error getting cached response: {e}")
+        return None
+
+def save_cached_response(key: str, model: str, response: str, max_entries: int, ttl: float) -> bool:
+    """Cache an LLM response, evicting expired and least recently used entries."""
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            now = time.time()
+            cursor.execute("""
+                INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_accessed, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+            """, (key, model, response, now, now))
+            cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - ttl,))
+            cursor.execute("""
+                DELETE FROM llm_cache WHERE last_accessed < (
+                    SELECT last_accessed FROM llm_cache
+                    ORDER BY last_accessed DESC LIMIT 1 OFFSET ?
+                )
+            """, (max(max_entries - 1, 0),))
+            conn.commit()
+            return True
+    except Exception as e:
+        print(f"Error saving cached response: {e}")
+        return False
 
 # Initialize the database when this module is imported
 init_db()
@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+EVENT_HISTORY_SIZE = 5000  # Events kept for Last-Event-ID resume
+COALESCE_INTERVAL = 0.2  # Seconds an SSE stream waits after a wake-up to batch bursts
+
+class EventBus:
+    """In-process fan-out of agent events for the /events stream.
+
+    Events get increasing ids and are kept in a bounded history, so a client that
+    reconnects with the id of the last event it saw receives what it missed.
+    Readers get bursts coalesced: consecutive output events for an agent are
+    joined at the position of the first and state events are merged, keeping
+    the latest value per field.
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self._events = deque(maxlen=history_size)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, agent_id: str, data: Optional[Dict] = None) -> int:
+        with self._cond:
+            self._last_id += 1
+            self._events.append({
+                'id': self._last_id,
+                'event': event_type,
+                'data': dict(data or {}, agent_id=agent_id)
+            })
+            self._cond.notify_all()
+            return self._last_id
+
+    def events_since(self, last_id: int, timeout: Optional[float] = None) -> Optional[List[Dict]]:
+        """Wait up to timeout for events after last_id and return them coalesced.
+
+        Returns [] on timeout, or None if events after last_id are no longer held
+        (or last_id is from another process) and the client has to resync.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._last_id != last_id, timeout):
+                return []
+            if last_id > self._last_id or (self._events and last_id < self._events[0]['id'] - 1):
+                return None
+            pending = [e for e in self._events if e['id'] > last_id]
+        return coalesce(pending)
+
+def coalesce(events: List[Dict]) -> List[Dict]:
+    """Merge output and state events per agent, ordered by id.
+
+    Joined output keeps the id of its first event so it is not moved past the
+    events that followed it; 'last_id' records the newest id merged into it.
+    """
+    merged = {}
+    for event in events:
+        agent_id = event['data'].get('agent_id')
+        if event['event'] == 'output':
+            key = ('output', agent_id)
+            if key in merged:
+                text = merged[key]['data']['text'] + event['data'].get('text', '')
+                merged[key] = dict(merged[key], data=dict(merged[key]['data'], text=text), last_id=event['id'])
+                continue
+        elif event['event'] == 'state':
+            key = ('state', agent_id)
+            if key in merged:
+                merged[key] = dict(event, data={**merged[key]['data'], **event['data']})
+                continue
+        else:
+            key = ('event', event['id'])
+        merged[key] = event
+    return sorted(merged.values(), key=lambda e: e['id'])
+
+# Shared by AgentSession reader threads, the orchestrator and the /events route
+event_bus = EventBus()
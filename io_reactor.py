@@ -0,0 +1,208 @@
+import codecs
+import logging
+import os
+import selectors
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+READ_CHUNK_SIZE = 65536
+PARTIAL_LINE_DELAY = 0.05  # Seconds an unterminated line is held back waiting for its newline
+
+class _Stream:
+    """Read state for one registered pipe."""
+
+    def __init__(self, fd: int, on_data: Callable[[str], None], on_close: Optional[Callable[[], None]]):
+        self.fd = fd
+        self.on_data = on_data
+        self.on_close = on_close
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.partial = ''
+        self.partial_since = None
+
+def _translate_newlines(text: str) -> str:
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+class IOReactor:
+    """Reads every registered subprocess pipe from a single thread.
+
+    Pipes are switched to non-blocking mode and watched with a selector; whenever
+    one is readable up to chunk_size bytes are read, decoded incrementally as
+    UTF-8 and passed to the pipe's on_data callback as text ending on a line
+    boundary, with newlines normalised as in text mode. An unterminated trailing
+    line is held back for partial_line_delay seconds in case the rest arrives, so
+    prompts that never get a newline are still delivered. on_close is called once
+    the pipe reaches EOF.
+
+    Selectors cannot watch pipes on Windows, where `supported` is False and
+    callers fall back to a reader thread per pipe.
+    """
+
+    supported = os.name != 'nt'
+
+    def __init__(self, chunk_size: int = READ_CHUNK_SIZE, partial_line_delay: float = PARTIAL_LINE_DELAY):
+        self.chunk_size = chunk_size
+        self.partial_line_delay = partial_line_delay
+        self._streams: Dict[int, _Stream] = {}
+        self._lock = threading.Lock()
+        self._selector = None
+        self._thread = None
+        self._wake_r = self._wake_w = None
+        self._closed = False
+
+    def register(self, pipe, on_data: Callable[[str], None], on_close: Optional[Callable[[], None]] = None) -> None:
+        fd = pipe.fileno()
+        os.set_blocking(fd, False)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("IOReactor has been shut down")
+            self._ensure_started()
+            stream = _Stream(fd, on_data, on_close)
+            self._streams[fd] = stream
+            self._selector.register(fd, selectors.EVENT_READ, stream)
+        self._wake()
+
+    def unregister(self, pipe) -> None:
+        """Stop reading pipe; call before closing it. on_close is not called."""
+        try:
+            fd = pipe.fileno()
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            stream = self._streams.get(fd)
+            if stream:
+                self._remove(stream)
+
+    def stream_count(self) -> int:
+        with self._lock:
+            return len(self._streams)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        self._wake()
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def _ensure_started(self) -> None:
+        """Create the selector and start the reactor thread. Caller must hold the lock."""
+        if self._thread:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="io-reactor")
+        self._thread.start()
+
+    def _wake(self) -> None:
+        if self._wake_w is None:
+            return
+        try:
+            os.write(self._wake_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass  # A wake-up is already pending, or the reactor is gone
+
+    def _remove(self, stream: _Stream) -> None:
+        """Forget stream. Caller must hold the lock."""
+        if self._streams.get(stream.fd) is stream:
+            del self._streams[stream.fd]
+            try:
+                self._selector.unregister(stream.fd)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed:
+                    break
+                timeout = self._flush_timeout()
+            try:
+                events = self._selector.select(timeout)
+            except OSError as e:
+                # A pipe was closed without being unregistered first
+                logging.error(f"IOReactor select failed: {e}")
+                self._drop_closed_streams()
+                continue
+            for key, _ in events:
+                if key.data is None:
+                    try:
+                        while os.read(self._wake_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._read(key.data)
+            self._flush_partials()
+        with self._lock:
+            for stream in list(self._streams.values()):
+                self._remove(stream)
+            self._selector.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+
+    def _read(self, stream: _Stream) -> None:
+        with self._lock:
+            if self._streams.get(stream.fd) is not stream:
+                return
+            try:
+                data = os.read(stream.fd, self.chunk_size)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logging.error(f"IOReactor read from fd {stream.fd} failed: {e}")
+                data = b''
+            eof = not data
+            if eof:
+                self._remove(stream)
+        self._deliver(stream, stream.decoder.decode(data, final=eof), eof)
+
+    def _deliver(self, stream: _Stream, text: str, eof: bool) -> None:
+        text = stream.partial + text
+        end = len(text) if eof else text.rfind('\n') + 1
+        complete, stream.partial = text[:end], text[end:]
+        if not stream.partial:
+            stream.partial_since = None
+        elif stream.partial_since is None:
+            stream.partial_since = time.monotonic()
+        try:
+            if complete:
+                stream.on_data(_translate_newlines(complete))
+            if eof and stream.on_close:
+                stream.on_close()
+        except Exception as e:
+            logging.error(f"IOReactor callback for fd {stream.fd} failed: {e}")
+
+    def _flush_timeout(self) -> Optional[float]:
+        """Seconds until the oldest held partial line is due. Caller must hold the lock."""
+        pending = [s.partial_since for s in self._streams.values() if s.partial_since is not None]
+        if not pending:
+            return None
+        return max(0.0, min(pending) + self.partial_line_delay - time.monotonic())
+
+    def _flush_partials(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [s for s in self._streams.values()
+                   if s.partial_since is not None and now - s.partial_since >= self.partial_line_delay]
+        for stream in due:
+            text, stream.partial, stream.partial_since = stream.partial, '', None
+            try:
+                stream.on_data(_translate_newlines(text))
+            except Exception as e:
+                logging.error(f"IOReactor callback for fd {stream.fd} failed: {e}")
+
+    def _drop_closed_streams(self) -> None:
+        with self._lock:
+            for stream in list(self._streams.values()):
+                try:
+                    os.fstat(stream.fd)
+                except OSError:
+                    self._remove(stream)
+
+# Shared by every AgentSession
+io_reactor = IOReactor()
@@ -1,15 +1,386 @@
 import os
 import json
 import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
 import litellm
 from pathlib import Path
 from dotenv import load_dotenv
 from litellm import completion
+from response_cache import response_cache, load_cache_settings
+from llm_retry import (
+    FATAL, circuit_breaker, classify_error, load_retry_settings, model_chain, retry_policy
+)
+
+class TokenBucket:
+    """Budget of `per_minute` units that refills continuously.
+
+    The level may go negative when a request turns out to cost more than was
+    reserved; later requests then wait until the debt has refilled.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill(now)
+        # Requests larger than the whole bucket only need a full bucket
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge (negative) units after the fact."""
+        self._refill(time.monotonic())
+        self.level = min(self.capacity, self.level + amount)
+
+class LLMScheduler:
+    """Shared FIFO queue that paces LLM requests to per-model budgets.
+
+    Each model can have a requests/min and a tokens/min budget. Callers block in
+    acquire() until both budgets allow the request, in arrival order per model, so
+    bursts are smoothed out instead of turning into provider 429s. Models without
+    configured limits pass straight through.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._limits: Dict[str, Dict] = {}
+        self._buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self._queues: Dict[str, deque] = {}
+        self._stats: Dict[str, Dict] = {}
+
+    def set_limits(self, model: str, rpm: Optional[float] = None, tpm: Optional[float] = None) -> None:
+        """Set the budgets for a model; use model '*' for the default.
+
+        Only buckets whose limit actually changes are rebuilt, the others keep
+        what they have already spent.
+        """
+        with self._cond:
+            limit = {'rpm': rpm, 'tpm': tpm}
+            if self._limits.get(model) == limit:
+                return
+            self._limits[model] = limit
+            self._refresh_buckets(model)
+            self._cond.notify_all()
+
+    def clear_limits(self, model: str) -> None:
+        """Drop a model's own budgets so it falls back to the default."""
+        with self._cond:
+            if self._limits.pop(model, None) is not None:
+                self._refresh_buckets(model)
+                self._cond.notify_all()
+
+    def load_limits(self, limits: Dict) -> None:
+        """Load limits shaped like {"model": {"rpm": 60, "tpm": 100000}}, replacing earlier ones."""
+        limits = limits or {}
+        for model in [m for m in self._limits if m not in limits]:
+            self.clear_limits(model)
+        for model, limit in limits.items():
+            self.set_limits(model, limit.get('rpm'), limit.get('tpm'))
+
+    def _limit_for(self, model: str) -> Dict:
+        return self._limits.get(model) or self._limits.get('*') or {}
+
+    def _refresh_buckets(self, changed: str) -> None:
+        """Rebuild the buckets that the limits of `changed` govern where rpm/tpm differ. Caller must hold the lock."""
+        for model, buckets in self._buckets.items():
+            if model != changed and (changed != '*' or model in self._limits):
+                continue
+            limit = self._limit_for(model)
+            for kind, key in (('requests', 'rpm'), ('tokens', 'tpm')):
+                per_minute = limit.get(key)
+                bucket = buckets.get(kind)
+                if not per_minute:
+                    buckets.pop(kind, None)
+                elif bucket is None or bucket.capacity != float(per_minute):
+                    buckets[kind] = TokenBucket(per_minute)
+
+    def _get_buckets(self, model: str) -> Dict[str, TokenBucket]:
+        if model not in self._buckets:
+            limit = self._limit_for(model)
+            buckets = {}
+            if limit.get('rpm'):
+                buckets['requests'] = TokenBucket(limit['rpm'])
+            if limit.get('tpm'):
+                buckets['tokens'] = TokenBucket(limit['tpm'])
+            self._buckets[model] = buckets
+        return self._buckets[model]
+
+    def _model_stats(self, model: str) -> Dict:
+        return self._stats.setdefault(model, {
+            'requests': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'last_wait': 0.0, 'tokens': 0,
+            'prompt_tokens': 0, 'cached_tokens': 0, 'first_token_total': 0.0, 'first_token_count': 0
+        })
+
+    def acquire(self, model: str, estimated_tokens: int = 0) -> float:
+        """Block until the request fits the model's budgets; returns seconds waited."""
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            queue = self._queues.setdefault(model, deque())
+            queue.append(ticket)
+            try:
+                while True:
+                    delay = None
+                    if queue[0] is ticket:
+                        now = time.monotonic()
+                        buckets = self._get_buckets(model)
+                        needs = {'requests': 1, 'tokens': estimated_tokens}
+                        delay = max([b.time_until(needs[k], now) for k, b in buckets.items()] or [0.0])
+                        if delay <= 0:
+                            for kind, bucket in buckets.items():
+                                bucket.consume(needs[kind], now)
+                            break
+                    self._cond.wait(delay)
+            finally:
+                queue.remove(ticket)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            stats = self._model_stats(model)
+            stats['requests'] += 1
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            stats['last_wait'] = waited
+        if waited > 1:
+            logging.info(f"LLM request for {model} waited {waited:.1f}s for rate limit budget")
+        return waited
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int,
+                     prompt_tokens: int = 0, cached_tokens: int = 0) -> None:
+        """Settle the token budget once the real usage of a request is known.
+
+        cached_tokens is the part of prompt_tokens the provider served from its
+        prompt cache.
+        """
+        with self._cond:
+            bucket = self._get_buckets(model).get('tokens')
+            if bucket:
+                bucket.adjust(estimated_tokens - actual_tokens)
+            stats = self._model_stats(model)
+            stats['tokens'] += actual_tokens
+            stats['prompt_tokens'] += prompt_tokens
+            stats['cached_tokens'] += cached_tokens
+            self._cond.notify_all()
+
+    def record_first_token(self, model: str, latency: float) -> None:
+        """Record how long a streamed request took to produce its first token."""
+        with self._cond:
+            stats = self._model_stats(model)
+            stats['first_token_total'] += latency
+            stats['first_token_count'] += 1
+
+    def queue_depth(self, model: Optional[str] = None) -> int:
+        with self._cond:
+            if model:
+                return len(self._queues.get(model, ()))
+            return sum(len(q) for q in self._queues.values())
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Per-model queue depth, request count, tokens used, prompt cache hits and latencies."""
+        with self._cond:
+            result = {}
+            for model in set(self._stats) | set(self._queues):
+                stats = self._model_stats(model)
+                result[model] = {
+                    'queue_depth': len(self._queues.get(model, ())),
+                    'requests': stats['requests'],
+                    'tokens': stats['tokens'],
+                    'avg_wait': stats['total_wait'] / stats['requests'] if stats['requests'] else 0.0,
+                    'max_wait': stats['max_wait'],
+                    'last_wait': stats['last_wait'],
+                    'prompt_tokens': stats['prompt_tokens'],
+                    'cached_tokens': stats['cached_tokens'],
+                    'cache_hit_rate': (stats['cached_tokens'] / stats['prompt_tokens']
+                                       if stats['prompt_tokens'] else 0.0),
+                    'avg_first_token': (stats['first_token_total'] / stats['first_token_count']
+                                        if stats['first_token_count'] else None)
+                }
+            return result
+
+# Shared by every LiteLLMClient in the process so all agents draw from one budget
+scheduler = LLMScheduler()
+
+# Model name fragments of providers that only cache prompts at explicit cache_control
+# breakpoints; others (OpenAI, DeepSeek, Gemini through OpenRouter) cache a repeated
+# prompt prefix on their own, and older Gemini models reject the breakpoints
+CACHE_HINT_MODELS = ['anthropic', 'claude']
+cache_hint_models = list(CACHE_HINT_MODELS)
+
+def _message_text(content) -> str:
+    if isinstance(content, list):
+        return ''.join(part.get('text') or '' for part in content)
+    return content or ''
+
+def estimate_message_tokens(messages) -> int:
+    """Rough prompt size used to reserve token budget before a request."""
+    return sum(len(_message_text(m.get('content'))) for m in messages) // 4 + 1
+
+def build_messages(model: str, system_message: str, user_message: str, prefix_message: str = "") -> list:
+    """Chat messages with the stable parts of the prompt first, so providers can cache them.
+
+    system_message is expected to be the same for every request and
+    prefix_message (such as an agent's task) the same across an agent's turns;
+    user_message is what changes. For models matching cache_hint_models both
+    stable parts are marked as cache_control breakpoints.
+    """
+    if not any(fragment in model.lower() for fragment in cache_hint_models):
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prefix_message + user_message}
+        ]
+    cached = {"cache_control": {"type": "ephemeral"}}
+    user_content = []
+    if prefix_message:
+        user_content.append({"type": "text", "text": prefix_message, **cached})
+    if user_message or not user_content:
+        user_content.append({"type": "text", "text": user_message})
+    return [
+        {"role": "system", "content": [{"type": "text", "text": system_message, **cached}]},
+        {"role": "user", "content": user_content}
+    ]
+
+def prompt_cache_usage(usage) -> Tuple[int, int]:
+    """Prompt tokens of a response and how many of them were read from the provider's cache."""
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None)
+    if not isinstance(cached_tokens, int):
+        cached_tokens = getattr(usage, 'cache_read_input_tokens', None)
+    return (
+        prompt_tokens if isinstance(prompt_tokens, int) else 0,
+        cached_tokens if isinstance(cached_tokens, int) else 0
+    )
+
+class JsonFieldStream:
+    """Scans a JSON object as it streams in and reports each top-level field once complete.
+
+    feed() takes text in arbitrary pieces; on_field(name, value) is called as
+    soon as a field's value has fully arrived, with the value decoded. Text
+    before the opening brace (such as a markdown code fence) is skipped.
+    """
+
+    def __init__(self, on_field: Callable[[str, object], None]):
+        self.on_field = on_field
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = None  # 'key' or 'value' while at the top level of the object
+        self._key = None
+        self._token_start = None
+
+    def feed(self, text: str) -> None:
+        self._text += text
+        while self._pos < len(self._text):
+            self._step(self._text[self._pos], self._pos)
+            self._pos += 1
+
+    def _step(self, ch: str, pos: int) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._depth == 1 and self._expect == 'key':
+                    self._key = json.loads(self._text[self._token_start:pos + 1])
+                    self._expect = None
+                    self._token_start = None
+                elif self._depth == 1 and self._expect == 'value':
+                    self._emit(pos + 1)
+            return
+        if self._depth == 0:
+            if ch == '{':
+                self._depth = 1
+                self._expect = 'key'
+            return
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect in ('key', 'value'):
+                self._token_start = pos
+        elif ch in '{[':
+            if self._depth == 1 and self._expect == 'value':
+                self._token_start = pos
+            self._depth += 1
+        elif ch in '}]':
+            self._depth -= 1
+            if self._depth == 1 and self._token_start is not None:
+                self._emit(pos + 1)
+            elif self._depth == 0 and self._token_start is not None:
+                self._emit(pos)
+        elif self._depth == 1:
+            if ch == ':':
+                self._expect = 'value'
+            elif ch == ',':
+                if self._token_start is not None:
+                    self._emit(pos)
+                self._expect = 'key'
+            elif self._expect == 'value' and self._token_start is None and not ch.isspace():
+                self._token_start = pos  # number, true, false or null
+
+    def _emit(self, end: int) -> None:
+        raw = self._text[self._token_start:end]
+        key = self._key
+        self._token_start = None
+        self._expect = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            logging.warning(f"Could not decode streamed JSON field {key}: {raw[:100]}")
+            return
+        try:
+            self.on_field(key, value)
+        except Exception as e:
+            logging.error(f"Error handling streamed JSON field {key}: {e}", exc_info=True)
+
+# llm_rate_limits value the scheduler was last loaded from
+_loaded_rate_limits = None
+
+def load_rate_limits() -> None:
+    """Load per-model limits from the llm_rate_limits config key (JSON) if it changed since the last load."""
+    global _loaded_rate_limits
+    try:
+        from database import get_config
+        raw = get_config('llm_rate_limits')
+        if raw == _loaded_rate_limits:
+            return
+        scheduler.load_limits(json.loads(raw) if raw else {})
+        _loaded_rate_limits = raw
+    except Exception as e:
+        logging.warning(f"Could not load LLM rate limits: {e}")
+
+def load_cache_hint_models() -> None:
+    """Load the prompt_cache_hint_models config key, a JSON list of model name fragments."""
+    try:
+        from database import get_config
+        raw = get_config('prompt_cache_hint_models')
+        if raw:
+            cache_hint_models[:] = [fragment.lower() for fragment in json.loads(raw)]
+    except Exception as e:
+        logging.warning(f"Could not load prompt cache hint models: {e}")
 
 class LiteLLMClient:
     """Client for interacting with LLMs to get summaries with JSON mode"""
     
-    def __init__(self):
+    def __init__(self, use_cache: Optional[bool] = None):
         # Load environment variables from ~/.env
         env_path = Path.home() / '.env'
         if not load_dotenv(env_path):
@@ -21,9 +392,22 @@ class LiteLLMClient:
             raise ValueError(f"OPENROUTER_API_KEY not found in {env_path}")
 
         litellm.success_callback=["helicone"]
+        load_rate_limits()
+        load_retry_settings()
+        load_cache_hint_models()
+        # Response caching is opt-in, either per client or via the llm_cache_enabled config key
+        cache_enabled = load_cache_settings()
+        self.cache = response_cache if (cache_enabled if use_cache is None else use_cache) else None
         
-    def chat_completion(self, system_message: str = "", user_message: str = "", model_type="orchestrator", agent_id=0):
-        """Get a summary of the coding session logs using JSON mode"""
+    def chat_completion(self, system_message: str = "", user_message: str = "", model_type="orchestrator", agent_id=0,
+                        on_field: Optional[Callable[[str, object], None]] = None, prefix_message: str = ""):
+        """Get a summary of the coding session logs using JSON mode
+
+        prefix_message is sent ahead of user_message for content that stays the
+        same across turns, see build_messages. With on_field the response is streamed and on_field(name, value) is called
+        for each top-level field of the JSON object as soon as it is complete.
+        The full response is still returned at the end.
+        """
         # Get the appropriate model based on type
         from database import get_model_config
         config = get_model_config()
@@ -41,26 +425,34 @@ class LiteLLMClient:
         logging.info(f"Using {model_type} model: {model}")
         """Get a summary of the coding session logs using JSON mode"""
         try:
-            response = completion(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-                api_key=self.api_key,
-                metadata={
-                    "agent_id": agent_id
-                },
-                response_format={"type": "json_object"}
+            response_format = {"type": "json_object"}
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.make_key(model, system_message, prefix_message + user_message, response_format)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logging.info(f"LLM cache hit for {model_type} model {model}")
+                    if on_field:
+                        JsonFieldStream(on_field).feed(cached)
+                    return cached
+            prompt = (system_message, user_message, prefix_message)
+            estimated_tokens = estimate_message_tokens(build_messages(model, *prompt))
+            content = self._complete_with_retries(
+                model_type, model, prompt, estimated_tokens, agent_id, response_format, on_field
             )
             
             # Strip markdown code blocks if present
-            content = response.choices[0].message.content
             if content.startswith('```json') and content.endswith('```'):
                 content = content[7:-3].strip()  # Remove ```json and trailing ```
             elif content.startswith('```') and content.endswith('```'):
                 content = content[3:-3].strip()  # Remove ``` and trailing ```
             
+            if cache_key:
+                try:
+                    json.loads(content)
+                    self.cache.set(cache_key, model, content)
+                except json.JSONDecodeError:
+                    pass  # Never cache responses the callers will reject anyway
             return content
             
         except Exception as e:
@@ -74,3 +466,112 @@ class LiteLLMClient:
                 "model": model,
                 "model_type": model_type
             })
+
+    def _complete_with_retries(self, model_type: str, model: str, prompt: Tuple[str, str, str],
+                               estimated_tokens: int, agent_id,
+                               response_format: Dict, on_field: Optional[Callable[[str, object], None]]) -> str:
+        """Run the completion, retrying rate limits and transient errors with backoff.
+
+        Each model in the chain gets up to retry_policy.max_retries retries before
+        the next fallback is tried; models whose circuit is open are skipped.
+        Raises the last error once every model has failed.
+        """
+        last_error = None
+        emitted = []
+        if on_field:
+            callback = on_field
+            def on_field(name, value):
+                emitted.append(name)
+                callback(name, value)
+        for candidate in model_chain(model_type, model):
+            if not circuit_breaker.allow(candidate):
+                logging.warning(f"Skipping {candidate}, its circuit is open")
+                last_error = last_error or RuntimeError(f"Circuit open for {candidate}")
+                continue
+            for attempt in range(retry_policy.max_retries + 1):
+                try:
+                    content = self._complete(candidate, prompt, estimated_tokens, agent_id, response_format, on_field)
+                except Exception as e:
+                    last_error = e
+                    kind = classify_error(e)
+                    if kind == FATAL:
+                        circuit_breaker.release(candidate)
+                    else:
+                        circuit_breaker.record_failure(candidate)
+                    if emitted:
+                        # Part of the response already reached the caller, retrying would repeat it
+                        raise
+                    if kind == FATAL or attempt == retry_policy.max_retries or not circuit_breaker.allow(candidate):
+                        logging.warning(f"LLM call to {candidate} failed ({kind}): {e}")
+                        break
+                    delay = retry_policy.delay(attempt, e)
+                    logging.warning(f"LLM call to {candidate} failed ({kind}): {e}; retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                circuit_breaker.record_success(candidate)
+                if candidate != model:
+                    logging.info(f"Used fallback model {candidate} for {model_type}")
+                return content
+        raise last_error
+
+    def _complete(self, model: str, prompt: Tuple[str, str, str], estimated_tokens: int, agent_id,
+                  response_format: Dict, on_field: Optional[Callable[[str, object], None]]) -> str:
+        """One paced completion call against one model."""
+        messages = build_messages(model, *prompt)
+        scheduler.acquire(model, estimated_tokens)
+        if on_field:
+            content, usage = self._stream_completion(model, messages, agent_id, response_format, on_field)
+        else:
+            response = completion(
+                model=model,
+                messages=messages,
+                api_key=self.api_key,
+                metadata={
+                    "agent_id": agent_id
+                },
+                response_format=response_format
+            )
+            usage = getattr(response, 'usage', None)
+            content = response.choices[0].message.content
+        total_tokens = getattr(usage, 'total_tokens', None)
+        prompt_tokens, cached_tokens = prompt_cache_usage(usage)
+        scheduler.record_usage(
+            model,
+            estimated_tokens,
+            total_tokens if isinstance(total_tokens, int) else estimated_tokens,
+            prompt_tokens,
+            cached_tokens
+        )
+        return content
+
+    def _stream_completion(self, model: str, messages, agent_id, response_format: Dict,
+                           on_field: Callable[[str, object], None]) -> Tuple[str, object]:
+        """Stream a completion, feeding it to on_field; returns the content and usage."""
+        start = time.monotonic()
+        response = completion(
+            model=model,
+            messages=messages,
+            api_key=self.api_key,
+            metadata={
+                "agent_id": agent_id
+            },
+            response_format=response_format,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        fields = JsonFieldStream(on_field)
+        parts = []
+        usage = None
+        for chunk in response:
+            choices = getattr(chunk, 'choices', None) or []
+            delta = getattr(choices[0], 'delta', None) if choices else None
+            text = getattr(delta, 'content', None) if delta else None
+            if text:
+                if not parts:
+                    scheduler.record_first_token(model, time.monotonic() - start)
+                parts.append(text)
+                fields.feed(text)
+            chunk_usage = getattr(chunk, 'usage', None)
+            if isinstance(getattr(chunk_usage, 'total_tokens', None), int):
+                usage = chunk_usage
+        return ''.join(parts), usage
@@ -0,0 +1,184 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_MAX_RETRIES = 3  # Retries per model after the first attempt
+DEFAULT_BACKOFF_BASE = 1.0  # Seconds
+DEFAULT_BACKOFF_MAX = 30.0  # Seconds
+DEFAULT_BREAKER_THRESHOLD = 5  # Consecutive failures before a model's circuit opens
+DEFAULT_BREAKER_COOLDOWN = 60.0  # Seconds an open circuit waits before letting a probe through
+
+# Error classes returned by classify_error
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+FATAL = 'fatal'
+
+def classify_error(error: Exception) -> str:
+    """Whether an LLM call failure is worth retrying.
+
+    429s are RATE_LIMITED, timeouts, connection errors and 5xx responses are
+    TRANSIENT, and anything else (bad requests, auth, context length) is FATAL.
+    """
+    status = getattr(error, 'status_code', None)
+    if status == 429:
+        return RATE_LIMITED
+    if isinstance(error, (TimeoutError, ConnectionError)) or status in (408, 409):
+        return TRANSIENT
+    if isinstance(status, int) and status >= 500:
+        return TRANSIENT
+    name = type(error).__name__
+    if name in ('Timeout', 'APIConnectionError', 'ServiceUnavailableError', 'InternalServerError', 'BadGatewayError'):
+        return TRANSIENT
+    if name == 'RateLimitError':
+        return RATE_LIMITED
+    return FATAL
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from a Retry-After header."""
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+class RetryPolicy:
+    """Jittered exponential backoff between attempts on the same model."""
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_BACKOFF_BASE,
+                 max_delay: float = DEFAULT_BACKOFF_MAX):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Seconds to wait before retry number `attempt` (0 based).
+
+        Uses full jitter so agents that failed together do not retry together,
+        but never less than a Retry-After the provider sent with a 429.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        wait = retry_after(error) if error is not None else None
+        if wait is not None:
+            delay = max(delay, min(wait, self.max_delay))
+        return delay
+
+class CircuitBreaker:
+    """Per-model circuit breaker so calls fail fast while a provider is down.
+
+    After `threshold` consecutive retryable failures a model's circuit opens and
+    allow() refuses it for `cooldown` seconds. Then a single probe call is let
+    through (half open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_BREAKER_THRESHOLD, cooldown: float = DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict] = {}
+
+    def _model(self, model: str) -> Dict:
+        return self._models.setdefault(model, {
+            'failures': 0, 'opened_at': None, 'probing': False, 'trips': 0, 'rejected': 0
+        })
+
+    def allow(self, model: str) -> bool:
+        with self._lock:
+            state = self._model(model)
+            if state['opened_at'] is None:
+                return True
+            if state['probing'] or time.monotonic() - state['opened_at'] < self.cooldown:
+                state['rejected'] += 1
+                return False
+            state['probing'] = True
+            return True
+
+    def record_success(self, model: str) -> None:
+        with self._lock:
+            state = self._model(model)
+            if state['opened_at'] is not None:
+                logging.info(f"Circuit for {model} closed")
+            state.update(failures=0, opened_at=None, probing=False)
+
+    def record_failure(self, model: str) -> None:
+        with self._lock:
+            state = self._model(model)
+            state['failures'] += 1
+            if state['probing'] or (state['opened_at'] is None and state['failures'] >= self.threshold):
+                if state['opened_at'] is None:
+                    state['trips'] += 1
+                    logging.warning(f"Circuit for {model} opened after {state['failures']} failures")
+                state['opened_at'] = time.monotonic()
+            state['probing'] = False
+
+    def release(self, model: str) -> None:
+        """End a probe that neither succeeded nor failed retryably."""
+        with self._lock:
+            self._model(model)['probing'] = False
+
+    def state(self, model: str) -> str:
+        with self._lock:
+            state = self._models.get(model)
+            if not state or state['opened_at'] is None:
+                return 'closed'
+            if state['probing'] or time.monotonic() - state['opened_at'] >= self.cooldown:
+                return 'half_open'
+            return 'open'
+
+    def get_stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            models = list(self._models.items())
+        return {
+            model: {
+                'state': self.state(model),
+                'failures': state['failures'],
+                'trips': state['trips'],
+                'rejected': state['rejected']
+            }
+            for model, state in models
+        }
+
+# Shared by every LiteLLMClient so all agents see the same provider health
+retry_policy = RetryPolicy()
+circuit_breaker = CircuitBreaker()
+fallback_models: Dict[str, List[str]] = {}
+
+def model_chain(model_type: str, model: str) -> List[str]:
+    """The configured model followed by its fallbacks, without duplicates."""
+    chain = [model]
+    for fallback in fallback_models.get(model_type) or fallback_models.get('*') or []:
+        if fallback not in chain:
+            chain.append(fallback)
+    return chain
+
+def load_retry_settings() -> None:
+    """Apply the llm_max_retries, llm_backoff_*, llm_breaker_* and llm_fallback_models config keys.
+
+    llm_fallback_models is JSON, either a list of models tried in order after
+    any model fails or an object of model type ("agent", "orchestrator", or "*"
+    for the rest) to such a list.
+    """
+    try:
+        from database import get_config
+        if get_config('llm_max_retries'):
+            retry_policy.max_retries = int(get_config('llm_max_retries'))
+        if get_config('llm_backoff_base'):
+            retry_policy.base_delay = float(get_config('llm_backoff_base'))
+        if get_config('llm_backoff_max'):
+            retry_policy.max_delay = float(get_config('llm_backoff_max'))
+        if get_config('llm_breaker_threshold'):
+            circuit_breaker.threshold = int(get_config('llm_breaker_threshold'))
+        if get_config('llm_breaker_cooldown'):
+            circuit_breaker.cooldown = float(get_config('llm_breaker_cooldown'))
+        raw = get_config('llm_fallback_models')
+        if raw:
+            chains = json.loads(raw)
+            fallback_models.clear()
+            fallback_models.update({'*': chains} if isinstance(chains, list) else chains)
+    except Exception as e:
+        logging.warning(f"Could not load LLM retry settings: {e}")
@@ -1,12 +1,19 @@
 import os, json, traceback, subprocess, sys, uuid
 from pull_request import PullRequestManager
-from prompts import PROMPT_AIDER
+from prompts import PROMPT_AIDER_SYSTEM, PROMPT_AIDER_TASK, PROMPT_AIDER_BATCH
 from litellm_client import LiteLLMClient
 from prompt_processor import PromptProcessor
+from context_builder import ContextBuilder, CONTEXT_TOKEN_BUDGET
+from event_bus import event_bus
+from repo_cache import repo_cache
+from warm_pool import warm_pool
 from pathlib import Path
 import shutil
 import tempfile
-from time import sleep
+import threading
+from contextlib import nullcontext
+from time import sleep, monotonic
+from typing import Dict
 import datetime
 import logging
 from github import Github
@@ -14,21 +21,34 @@ from dotenv import load_dotenv
 
 # Import the new AgentSession class
 from agent_session import AgentSession, normalize_path
+from coder_backend import CoderSession
 
 from database import (
-    save_agent, get_agent, get_all_agents, delete_agent as db_delete_agent,
-    save_task, get_all_tasks, save_config, get_config
+    save_agent, save_agents, get_agent, get_agent_fields, get_all_agents, delete_agent as db_delete_agent,
+    save_task, get_all_tasks, save_config, get_config, append_agent_history, get_model_config,
+    append_agent_output, get_agent_output, get_agent_output_length, get_changes_since,
+    append_agent_events
 )
 
 # Configuration
 DEFAULT_AGENTS_PER_TASK = 2
 tools, available_functions = [], {}
-MAX_TOOL_OUTPUT_LENGTH = 5000  # Adjust as needed
+MAX_TOOL_OUTPUT_LENGTH = 5000  # Tokens of new aider output sent to the agent model per turn
 CHECK_INTERVAL = 5  # Reduced to 30 seconds for more frequent updates
+AIDER_BACKEND = 'cli'  # 'cli' (aider subprocess) or 'coder' (Coder API in worker processes)
+SUPERVISOR_MODE = 'concurrent'  # 'concurrent' (one worker per agent), 'serial' or 'batch'
+MAX_CONCURRENT_LLM_CALLS = 4  # Global cap on in-flight LLM calls across agent workers
+BATCH_WINDOW = 2.0  # Seconds batch mode waits for more agents to become ready
+BATCH_POLL_INTERVAL = 0.25
+MAX_BATCH_SIZE = 8  # Agents decided per batched request
 
 # Global dictionaries to store sessions and processors
 aider_sessions = {}
 prompt_processors = {}
+# Tracks how much of each agent's output the agent model has already seen
+context_builder = ContextBuilder(output_token_budget=MAX_TOOL_OUTPUT_LENGTH)
+# Session output offset up to which each agent's transcript has been persisted
+persisted_output_offsets = {}
 
 def load_tasks():
     """Load tasks and agents from database."""
@@ -38,6 +58,35 @@ def load_tasks():
         'repository_url': get_config('repository_url') or ''
     }
 
+def load_tasks_since(version):
+    """Load only what changed after a change version.
+
+    Changed agents carry just their changed fields, read without loading the
+    rest of the record; appended aider output comes as aider_output_append
+    ({'start', 'text'}) plus aider_output_length. The output tail of a full
+    record is left out, live viewers get output from the event stream. Returns
+    None if the version is too old or unknown and a full load_tasks() is needed.
+    """
+    changes = get_changes_since(version)
+    if changes is None:
+        return None
+    delta = {'version': changes['version'], 'agents': {}, 'deleted': changes['deleted']}
+    if changes['tasks']:
+        delta['tasks'] = get_all_tasks()
+    if 'repository_url' in changes['config']:
+        delta['repository_url'] = get_config('repository_url') or ''
+    for agent_id, changed in changes['agents'].items():
+        fields = get_agent_fields(agent_id, changed['fields'])
+        if not fields:
+            continue
+        if 'aider_output' in changed['fields']:
+            fields['aider_output_append'] = {
+                'start': changed['output_start'],
+                'text': get_agent_output(agent_id, changed['output_start'])
+            }
+        delta['agents'][agent_id] = fields
+    return delta
+
 def save_tasks(tasks_data):
     """Save tasks and agents to database."""
     try:
@@ -45,9 +94,9 @@ def save_tasks(tasks_data):
         if 'repository_url' in tasks_data:
             save_config('repository_url', tasks_data['repository_url'])
         
-        # Save agents
-        for agent_id, agent_data in tasks_data.get('agents', {}).items():
-            save_agent(agent_id, agent_data)
+        # Save agents in one transaction; records loaded by load_tasks() only
+        # write the columns that changed, so unchanged agents cost nothing
+        save_agents(tasks_data.get('agents', {}))
     except Exception as e:
         logging.error(f"Error saving tasks: {e}", exc_info=True)
 
@@ -64,6 +113,9 @@ def delete_agent(agent_id):
                 logging.info(f"Cleaned up session for agent {agent_id}")
             except Exception as e:
                 logging.error(f"Error cleaning up session: {e}", exc_info=True)
+        context_builder.reset(agent_id)
+        persisted_output_offsets.pop(agent_id, None)
+        event_bus.publish('deleted', agent_id)
         
         # Remove from database
         success = db_delete_agent(agent_id)
@@ -107,85 +159,130 @@ def initialiseCodingAgent(repository_url: str = None, task_description: str = No
         tasks_data = load_tasks()
         agent_config = tasks_data.get('config', {}).get('agent_session', {})
         for i in range(num_agents):
-            agent_id = str(uuid.uuid4())
-            logging.debug(f"Creating new agent with ID: {agent_id}")
-            agent_workspace = Path(tempfile.mkdtemp(prefix=f"agent_{agent_id}_")).resolve()
-            workspace_dirs = {
-                "src": agent_workspace / "src",
-                "tests": agent_workspace / "tests", 
-                "docs": agent_workspace / "docs", 
-                "config": agent_workspace / "config", 
-                "repo": agent_workspace / "repo"
-            }
-            for dir_path in workspace_dirs.values():
-                dir_path.mkdir(parents=True, exist_ok=True)
-            task_file = agent_workspace / "current_task.txt"
-            task_file.write_text(task_description)
-            original_dir = Path.cwd()
-            repo_dir = None
-            full_repo_path = None
-            try:
-                os.chdir(workspace_dirs["repo"])
-                if not repository_url:
-                    logging.error("No repository URL provided")
-                    shutil.rmtree(agent_workspace)
-                    continue
-                repo_name = repository_url.rstrip('/').split('/')[-1]
-                if repo_name.endswith('.git'):
-                    repo_name = repo_name[:-4]
-                if not cloneRepository(repository_url):
-                    logging.error("Failed to clone repository")
-                    shutil.rmtree(agent_workspace)
-                    continue
-                if not os.path.exists(repo_name) or not os.path.isdir(os.path.join(repo_name, '.git')):
-                    logging.error(f"Repo dir {repo_name} not found or not a git repository")
-                    shutil.rmtree(agent_workspace)
-                    continue
-                repo_dir = repo_name
-                full_repo_path = workspace_dirs["repo"] / repo_dir
-                full_repo_path = full_repo_path.resolve()
-                os.chdir(full_repo_path)
-                branch_name = f"agent-{agent_id[:8]}"
-                try:
-                    subprocess.check_call(f"git checkout -b {branch_name}", shell=True)
-                except subprocess.CalledProcessError:
-                    logging.error("Failed to create new branch", exc_info=True)
-                    shutil.rmtree(agent_workspace)
-                    continue
-                aider_session = AgentSession(str(full_repo_path), task_description, agent_config, aider_commands=aider_commands)
-                prompt_processor = PromptProcessor()
-                if not aider_session.start():
-                    logging.error("Failed to start aider session")
-                    shutil.rmtree(agent_workspace)
-                    continue
-                aider_sessions[agent_id] = aider_session
-                prompt_processors[agent_id] = prompt_processor
-            finally:
-                os.chdir(original_dir)
-            logging.debug(f"Storing agent {agent_id} in tasks data")
-            tasks_data['agents'][agent_id] = {
-                'workspace': normalize_path(agent_workspace),
-                'repo_path': normalize_path(full_repo_path) if full_repo_path else None,
-                'task': task_description,
-                'status': 'pending',
-                'created_at': datetime.datetime.now().isoformat(),
-                'last_updated': datetime.datetime.now().isoformat(),
-                'aider_output': '',
-                'progress': '',
-                'thought': '',
-                'progress_history': [],
-                'thought_history': [],
-                'future': '',
-                'last_action': ''
-            }
-            tasks_data['repository_url'] = repository_url
-            save_tasks(tasks_data)
-            created_agent_ids.append(agent_id)
+            agent_id = provision_agent(repository_url, task_description, agent_config, aider_commands)
+            if agent_id:
+                created_agent_ids.append(agent_id)
         return created_agent_ids
     except Exception as e:
         logging.error(f"Error initializing coding agents: {e}", exc_info=True)
         return None
 
+def provision_agent(repository_url: str, task_description: str, agent_config: Dict = None, aider_commands: str = None):
+    """Create one agent: workspace, clone, branch and aider session.
+
+    A ready workspace with an idle aider session is taken from the warm pool
+    when there is one (only for the default aider commands), so all that is left
+    is assigning the branch and task. Only absolute paths and per-command cwd
+    are used, never os.chdir(), so several agents can be provisioned in
+    parallel. Returns the new agent id, or None if any step failed (the
+    workspace is removed again).
+    """
+    if not repository_url:
+        logging.error("No repository URL provided")
+        return None
+    agent_id = str(uuid.uuid4())
+    logging.debug(f"Creating new agent with ID: {agent_id}")
+    warm = None if aider_commands else warm_pool.take(repository_url)
+    warm_pool.refill(repository_url)
+    if warm:
+        logging.info(f"Using warm workspace {warm.workspace} for agent {agent_id}")
+        agent_workspace, full_repo_path, aider_session = warm.workspace, warm.repo_path, warm.session
+        aider_session.config.update(agent_config or {})
+    else:
+        workspace = prepare_workspace(repository_url, f"agent_{agent_id}_")
+        if not workspace:
+            return None
+        agent_workspace, full_repo_path = workspace
+        aider_session = None
+    provisioned = False
+    try:
+        (agent_workspace / "current_task.txt").write_text(task_description)
+        branch_name = f"agent-{agent_id[:8]}"
+        try:
+            subprocess.check_call(['git', 'checkout', '-b', branch_name], cwd=str(full_repo_path))
+        except subprocess.CalledProcessError:
+            logging.error("Failed to create new branch", exc_info=True)
+            return None
+        if aider_session:
+            aider_session.task = task_description
+            aider_session.agent_id = agent_id
+        else:
+            aider_session = create_session(str(full_repo_path), task_description, agent_config, aider_commands=aider_commands, agent_id=agent_id)
+            if not aider_session.start():
+                logging.error("Failed to start aider session")
+                return None
+        aider_sessions[agent_id] = aider_session
+        prompt_processors[agent_id] = PromptProcessor()
+        logging.debug(f"Storing agent {agent_id} in tasks data")
+        save_agent(agent_id, {
+            'workspace': normalize_path(agent_workspace),
+            'repo_path': normalize_path(full_repo_path),
+            'task': task_description,
+            'status': 'pending',
+            'created_at': datetime.datetime.now().isoformat(),
+            'last_updated': datetime.datetime.now().isoformat(),
+            'progress': '',
+            'thought': '',
+            'future': '',
+            'last_action': ''
+        })
+        save_config('repository_url', repository_url)
+        provisioned = True
+        return agent_id
+    except Exception as e:
+        logging.error(f"Error provisioning agent: {e}", exc_info=True)
+        return None
+    finally:
+        if not provisioned:
+            aider_sessions.pop(agent_id, None)
+            prompt_processors.pop(agent_id, None)
+            if aider_session:
+                aider_session.cleanup()
+            shutil.rmtree(agent_workspace, ignore_errors=True)
+
+def create_session(workspace_path, task, config=None, aider_commands=None, agent_id=None) -> AgentSession:
+    """Create an aider session using the configured backend (config aider_backend).
+
+    The Coder backend cannot take custom aider command-line arguments, so those
+    sessions always use the CLI.
+    """
+    backend = get_config('aider_backend') or AIDER_BACKEND
+    if backend == 'coder' and not aider_commands:
+        return CoderSession(workspace_path, task, config, agent_id=agent_id)
+    return AgentSession(workspace_path, task, config, aider_commands=aider_commands, agent_id=agent_id)
+
+def prepare_workspace(repository_url: str, prefix: str):
+    """Create an agent workspace directory and clone the repository into it.
+
+    Returns (workspace, repo_path) as resolved Paths, or None on failure (the
+    workspace is removed again).
+    """
+    agent_workspace = Path(tempfile.mkdtemp(prefix=prefix)).resolve()
+    try:
+        workspace_dirs = {
+            "src": agent_workspace / "src",
+            "tests": agent_workspace / "tests", 
+            "docs": agent_workspace / "docs", 
+            "config": agent_workspace / "config", 
+            "repo": agent_workspace / "repo"
+        }
+        for dir_path in workspace_dirs.values():
+            dir_path.mkdir(parents=True, exist_ok=True)
+        repo_name = repository_url.rstrip('/').split('/')[-1]
+        if repo_name.endswith('.git'):
+            repo_name = repo_name[:-4]
+        full_repo_path = (workspace_dirs["repo"] / repo_name).resolve()
+        if not cloneRepository(repository_url, full_repo_path):
+            logging.error("Failed to clone repository")
+        elif not os.path.exists(full_repo_path) or not os.path.isdir(os.path.join(full_repo_path, '.git')):
+            logging.error(f"Repo dir {full_repo_path} not found or not a git repository")
+        else:
+            return agent_workspace, full_repo_path
+    except Exception as e:
+        logging.error(f"Error preparing workspace: {e}", exc_info=True)
+    shutil.rmtree(agent_workspace, ignore_errors=True)
+    return None
+
 def get_github_token():
     """Retrieve GitHub token from environment variables."""
     load_dotenv()
@@ -201,16 +298,30 @@ def get_github_token():
         logging.error(f"Invalid GitHub token: {e}")
         return None
 
-def cloneRepository(repository_url: str) -> bool:
-    """Clone git repository using subprocess."""
+def cloneRepository(repository_url: str, target_dir=None) -> bool:
+    """Clone git repository using subprocess.
+
+    Clones into target_dir when given, otherwise into the current directory.
+    Clones into target_dir are made from the shared local mirror (see
+    repo_cache) unless repo_cache_enabled is off, falling back to a full clone
+    if the mirror cannot be used.
+    """
     try:
         if not repository_url:
             logging.error("No repository URL provided")
             return False
+        if target_dir and (get_config('repo_cache_enabled') or 'true').lower() not in ('0', 'false', 'no', 'off'):
+            logging.info(f"Creating workspace for {repository_url} from local mirror")
+            if repo_cache.clone(repository_url, target_dir):
+                return True
+            logging.warning(f"Mirror clone of {repository_url} failed, cloning directly")
+            shutil.rmtree(target_dir, ignore_errors=True)
         logging.info(f"Cloning {repository_url}")
+        cmd = ['git', 'clone', '--quiet', repository_url]
+        if target_dir:
+            cmd.append(str(target_dir))
         result = subprocess.run(
-            f"git clone --quiet {repository_url}",
-            shell=True,
+            cmd,
             capture_output=True,
             text=True
         )
@@ -228,124 +339,400 @@ def cloneRepository(repository_url: str) -> bool:
 def update_agent_output(agent_id):
     """Update the output for a specific agent."""
     try:
-        tasks_data = load_tasks()
-        agent_data = tasks_data['agents'].get(agent_id)
+        # Only touch this agent's record so concurrent workers don't clobber each other
+        agent_data = get_agent(agent_id, full=False)
         if not agent_data:
             logging.error(f"No agent found with ID {agent_id}")
             return False
         if agent_id in aider_sessions:
-            output = aider_sessions[agent_id].get_output()
-            agent_data['aider_output'] = output
-            agent_data['last_updated'] = datetime.datetime.now().isoformat()
-            save_tasks(tasks_data)
+            session = aider_sessions[agent_id]
+            # Taken before reading so every event's line is inside the output persisted below
+            events = session.take_events()
+            # Only append what the session produced since the last persist
+            persisted_offset = persisted_output_offsets.get(agent_id, 0)
+            delta, end_offset = session.read_since(persisted_offset)
+            # Later than persisted_offset if the session's buffer evicted unread output
+            chunk_start = end_offset - len(delta)
+            transcript_length = None
+            if delta:
+                transcript_length = append_agent_output(agent_id, delta)
+                if transcript_length is None:
+                    return False
+                agent_data['last_updated'] = datetime.datetime.now().isoformat()
+                save_agent(agent_id, agent_data)
+            persisted_output_offsets[agent_id] = end_offset
+            if events:
+                if transcript_length is None:
+                    transcript_length = get_agent_output_length(agent_id)
+                # Where the stored transcript stood before this chunk was appended
+                chunk_position = transcript_length - len(delta)
+                stored_events = []
+                for event in events:
+                    if event['offset'] >= chunk_start:
+                        event['offset'] = chunk_position + event['offset'] - chunk_start
+                    elif event['offset'] < persisted_offset:
+                        event['offset'] = chunk_position - (persisted_offset - event['offset'])
+                    else:
+                        continue  # Its output was evicted before it was persisted
+                    stored_events.append(event)
+                if stored_events:
+                    append_agent_events(agent_id, stored_events)
             return True
         return False
     except Exception as e:
         logging.error(f"Error updating agent output: {e}", exc_info=True)
         return False
 
-def main_loop():
+# Agent fields pushed to /events viewers when they change
+STATE_EVENT_FIELDS = ('status', 'progress', 'thought', 'future', 'last_action', 'pr_url')
+
+def publish_agent_state(agent_id, agent_data):
+    """Push an agent's displayed state fields to live viewers."""
+    event_bus.publish('state', agent_id, {f: agent_data.get(f) for f in STATE_EVENT_FIELDS if f in agent_data})
+
+def dispatch_to_session(agent_id, agent_session, action, log=True) -> bool:
+    """Send an agent's action to its aider session, logging it to the transcript first."""
+    if log and agent_id in aider_sessions:
+        aider_sessions[agent_id].write_output(f'\n\n [AGENT ACTION]: {action} \n\n')
+    if agent_session.send_message(action, "instruct"):
+        logging.info(f"Sending action: {action} to {agent_id}")
+        return True
+    logging.error(f"Failed to send action to agent {agent_id}")
+    return False
+
+def prepare_turn(agent_id, wait: bool = True):
+    """Gather what the agent model needs for an agent's next decision.
+
+    Returns False once the agent no longer needs supervising (finished or gone),
+    None while aider is busy, and otherwise a dict with the agent record,
+    session, processor, the context to send and the output offset it covers.
+    With wait=False a busy session is reported straight away instead of being
+    given up to stability_duration to go quiet.
+    """
+    agent_data = get_agent(agent_id, full=False)
+    if not agent_data:
+        return False
+    # Skip processing if agent has completed PR
+    if agent_data.get('pr_url'):
+        return False
+
+    update_agent_output(agent_id)
+    if agent_id not in aider_sessions:
+        return False
+    agent_session: AgentSession = aider_sessions[agent_id]
+    if not (agent_session.is_ready() if wait else agent_session.wait_until_ready(0)):
+        return None
+    try:
+        # Send only the output since the last decision plus a summary of earlier turns
+        processor = prompt_processors.get(agent_id)
+        history = processor.get_response_history(agent_id) if processor else []
+        model_config = get_model_config() or {}
+        session_logs, output_offset = context_builder.build(
+            agent_id, agent_session, history, model=model_config.get('agent_model')
+        )
+    except Exception as e:
+        logging.error(f"Error building context for agent {agent_id}:", exc_info=True)
+        return None
+    return {
+        'agent_data': agent_data,
+        'session': agent_session,
+        'processor': processor,
+        'session_logs': session_logs,
+        'output_offset': output_offset
+    }
+
+def apply_decision(agent_id, turn, follow_up_message, pr_manager, dispatched=None) -> bool:
+    """Persist an agent model response and carry out its action.
+
+    dispatched holds the action already sent while the response streamed in.
+    Returns False once the agent no longer needs supervising.
+    """
+    agent_session = turn['session']
+    processor = turn['processor']
+    output_offset = turn['output_offset']
+    logging.info(f"Agent {agent_id} response: {follow_up_message}")
+    # Re-read the record, the output may have been saved while we waited on the LLM
+    agent_data = get_agent(agent_id, full=False) or turn['agent_data']
+    try:
+        follow_up_data = json.loads(follow_up_message)
+        current_time = datetime.datetime.now().isoformat()
+        if follow_up_data.get('progress'):
+            agent_data['progress'] = follow_up_data['progress']
+            append_agent_history(agent_id, 'progress', follow_up_data['progress'], current_time)
+        if follow_up_data.get('thought'):
+            agent_data['thought'] = follow_up_data['thought']
+            append_agent_history(agent_id, 'thought', follow_up_data['thought'], current_time)
+        agent_data.update({
+            'future': follow_up_data.get('future', ''),
+            'last_action': follow_up_data.get('action', ''),
+            'last_updated': current_time
+        })
+        save_agent(agent_id, agent_data)
+        publish_agent_state(agent_id, agent_data)
+    except json.JSONDecodeError:
+        logging.error(f"Invalid JSON in follow_up_message: {follow_up_message}")
+    if not processor:
+        logging.error(f"No prompt processor found for agent {agent_id}")
+        return True
+    action = processor.process_response(agent_id, follow_up_message)
+    if dispatched:
+        # Already sent while streaming, even if the rest of the response was unusable
+        context_builder.commit(agent_id, output_offset)
+        if action != dispatched['action']:
+            logging.error(f"Agent {agent_id} response did not match the streamed action {dispatched['action']}")
+        return True
+    if action:
+        context_builder.commit(agent_id, output_offset)
+    if agent_id in aider_sessions:
+        action_message = f'\n\n [AGENT ACTION]: {action} \n\n'
+        aider_sessions[agent_id].write_output(action_message)
+    if action == "/finish":
+        pr_info = processor.get_agent_state(agent_id).get('pr_info')
+        if pr_info:
+            try:
+                branch_name = f"agent-{agent_id[:8]}"
+                pr = pr_manager.create_pull_request(
+                        agent_id,
+                        branch_name,
+                        pr_info
+                    )
+                if pr:
+                    logging.info(f"Created PR: {pr.html_url}")
+                    agent_data['pr_url'] = pr.html_url
+                    agent_data['status'] = 'completed'
+                    agent_data['completed_at'] = datetime.datetime.now().isoformat()
+                    # Clean up the session
+                    if agent_id in aider_sessions:
+                        aider_sessions[agent_id].cleanup()
+                        del aider_sessions[agent_id]
+                    save_agent(agent_id, agent_data)
+                    publish_agent_state(agent_id, agent_data)
+                    return False
+                else:
+                    logging.error("Failed to create PR")
+            except Exception as e:
+                logging.error(f"Error creating PR: {e}")
+        else:
+            logging.error("No PR info found in agent state")
+    elif action:
+        dispatch_to_session(agent_id, agent_session, action, log=False)
+    else:
+        logging.error(f"Failed to process response from OpenRouter")
+    return True
+
+def supervise_agent(agent_id, litellm_client, pr_manager, llm_slots=None) -> bool:
+    """Run one supervise step for an agent.
+
+    Returns False once the agent no longer needs supervising (finished or gone).
+    """
+    turn = prepare_turn(agent_id)
+    if not turn:
+        return turn is None
+    return request_decision(agent_id, turn, litellm_client, pr_manager, llm_slots)
+
+def request_decision(agent_id, turn, litellm_client, pr_manager, llm_slots=None) -> bool:
+    """Ask the agent model for one agent's next step and carry it out."""
+    agent_session = turn['session']
+    processor = turn['processor']
+    try:
+        # Stream the response and send the action to aider as soon as it is complete;
+        # progress, thought and future are saved once the whole response has arrived
+        dispatched = {}
+        def dispatch_action(field, value):
+            if field != 'action' or dispatched or not processor or not isinstance(value, str):
+                return
+            action = processor.parse_action(value)
+            if not action or action == '/finish':
+                return
+            dispatched['action'] = action
+            dispatch_to_session(agent_id, agent_session, action)
+        streaming = (get_config('stream_actions') or 'true').lower() not in ('0', 'false', 'no', 'off')
+        with llm_slots or nullcontext():
+            # The static system prompt and the agent's task lead so providers can cache them
+            follow_up_message = litellm_client.chat_completion(
+                PROMPT_AIDER_SYSTEM,
+                turn['session_logs'],
+                model_type="agent",
+                agent_id=agent_id,
+                on_field=dispatch_action if streaming else None,
+                prefix_message=PROMPT_AIDER_TASK(agent_session.task)
+            )
+        return apply_decision(agent_id, turn, follow_up_message, pr_manager, dispatched)
+    except Exception as e:
+        logging.error(f"Error processing session summary for agent {agent_id}:", exc_info=True)
+        logging.error(f"Session logs length: {len(turn['session_logs'] or '')}")
+        logging.error(f"Task description: {agent_session.task[:200]}...")
+    return True
+
+class AgentSupervisor:
+    """Runs an independent supervise worker per agent.
+
+    Workers share a global cap on in-flight LLM calls, so a slow agent (or a slow
+    completion) only holds up itself.
+    """
+
+    def __init__(self, litellm_client, pr_manager, max_llm_calls: int = MAX_CONCURRENT_LLM_CALLS):
+        self.litellm_client = litellm_client
+        self.pr_manager = pr_manager
+        self.llm_slots = threading.BoundedSemaphore(max(1, max_llm_calls))
+        self.workers: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def sync_workers(self) -> None:
+        """Start a worker for every live session that does not have one yet."""
+        with self._lock:
+            for agent_id, thread in list(self.workers.items()):
+                if not thread.is_alive():
+                    del self.workers[agent_id]
+            for agent_id in list(aider_sessions.keys()):
+                if agent_id in self.workers:
+                    continue
+                thread = threading.Thread(
+                    target=self._run_agent,
+                    args=(agent_id,),
+                    daemon=True,
+                    name=f"AgentSupervisor-{agent_id[:8]}"
+                )
+                self.workers[agent_id] = thread
+                thread.start()
+
+    def _run_agent(self, agent_id: str) -> None:
+        logging.info(f"Starting supervisor worker for agent {agent_id}")
+        while agent_id in aider_sessions:
+            try:
+                if not supervise_agent(agent_id, self.litellm_client, self.pr_manager, self.llm_slots):
+                    break
+            except Exception as e:
+                logging.error(f"Error in supervisor worker for agent {agent_id}: {e}", exc_info=True)
+            sleep(CHECK_INTERVAL)
+        logging.info(f"Supervisor worker for agent {agent_id} stopped")
+
+class DecisionBatcher:
+    """Asks for the decisions of agents that are ready together in one LLM request.
+
+    Each run collects the agents that are ready right now, without waiting on
+    busy ones, then polls for up to `window` seconds for more to become ready, and sends them in groups of at most
+    `max_batch` under one shared PROMPT_AIDER_BATCH system prompt. Every
+    decision in the response goes through apply_decision as if it had been
+    requested alone. Lone agents, and agents the response has no decision for,
+    get an ordinary single request.
+    """
+
+    def __init__(self, litellm_client, pr_manager, window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH_SIZE):
+        self.litellm_client = litellm_client
+        self.pr_manager = pr_manager
+        self.window = window
+        self.max_batch = max(1, max_batch)
+
+    def run_once(self) -> None:
+        turns = {}
+        busy = set()
+        for agent_id in list(aider_sessions.keys()):
+            turn = prepare_turn(agent_id, wait=False)
+            if turn:
+                turns[agent_id] = turn
+            elif turn is None:
+                busy.add(agent_id)
+        deadline = monotonic() + self.window
+        while turns and busy and len(turns) < self.max_batch and monotonic() < deadline:
+            sleep(BATCH_POLL_INTERVAL)
+            for agent_id in list(busy):
+                session = aider_sessions.get(agent_id)
+                if session and not session.wait_until_ready(0):
+                    continue
+                busy.discard(agent_id)
+                turn = prepare_turn(agent_id, wait=False)
+                if turn:
+                    turns[agent_id] = turn
+        agent_ids = list(turns)
+        for i in range(0, len(agent_ids), self.max_batch):
+            self.decide({agent_id: turns[agent_id] for agent_id in agent_ids[i:i + self.max_batch]})
+
+    def decide(self, turns: Dict[str, Dict]) -> None:
+        if len(turns) == 1:
+            agent_id, turn = next(iter(turns.items()))
+            request_decision(agent_id, turn, self.litellm_client, self.pr_manager)
+            return
+        user_message = "\n\n".join(
+            f"### Agent {agent_id}\nGoal: {turn['session'].task}\n\n{turn['session_logs']}"
+            for agent_id, turn in turns.items()
+        )
+        response = self.litellm_client.chat_completion(
+            PROMPT_AIDER_BATCH(),
+            user_message,
+            model_type="agent",
+            agent_id="batch"
+        )
+        try:
+            decisions = json.loads(response).get('decisions')
+        except (json.JSONDecodeError, AttributeError):
+            decisions = None
+        if not isinstance(decisions, dict):
+            logging.error(f"Invalid batch response for {len(turns)} agents: {response}")
+            decisions = {}
+        logging.info(f"Batch request decided {len(decisions)} of {len(turns)} agents")
+        for agent_id, turn in turns.items():
+            decision = decisions.get(agent_id)
+            try:
+                if isinstance(decision, dict):
+                    apply_decision(agent_id, turn, json.dumps(decision), self.pr_manager)
+                else:
+                    logging.warning(f"No decision for agent {agent_id} in batch response, requesting it alone")
+                    request_decision(agent_id, turn, self.litellm_client, self.pr_manager)
+            except Exception as e:
+                logging.error(f"Error applying batched decision for agent {agent_id}: {e}", exc_info=True)
+
+def _get_int_config(key: str, default: int) -> int:
+    try:
+        value = get_config(key)
+        return int(value) if value else default
+    except (TypeError, ValueError):
+        logging.warning(f"Invalid value for config {key}, using {default}")
+        return default
+
+def main_loop(mode: str = None):
+    """Main orchestration loop to manage agents.
+
+    In 'concurrent' mode every agent gets its own supervise worker; 'serial' mode
+    walks the agents one after another on each tick, and 'batch' mode asks for
+    the decisions of agents that are ready together in a single request.
+    """
     pr_manager = PullRequestManager()
-    """Main orchestration loop to manage agents."""
-    logging.info("Starting main loop")
+    mode = mode or get_config('supervisor_mode') or SUPERVISOR_MODE
+    logging.info(f"Starting main loop ({mode} mode)")
     litellm_client = LiteLLMClient()  # Create LiteLLM client instance
+    context_builder.token_budget = _get_int_config('context_token_budget', CONTEXT_TOKEN_BUDGET)
+    context_builder.output_token_budget = _get_int_config('max_tool_output_tokens', MAX_TOOL_OUTPUT_LENGTH)
+    if mode == 'concurrent':
+        supervisor = AgentSupervisor(
+            litellm_client,
+            pr_manager,
+            _get_int_config('max_concurrent_llm_calls', MAX_CONCURRENT_LLM_CALLS)
+        )
+        while True:
+            try:
+                supervisor.sync_workers()
+            except Exception as e:
+                logging.error(f"Error in main loop: {e}", exc_info=True)
+            sleep(CHECK_INTERVAL)
+    if mode == 'batch':
+        batcher = DecisionBatcher(
+            litellm_client,
+            pr_manager,
+            _get_int_config('batch_window_ms', int(BATCH_WINDOW * 1000)) / 1000,
+            _get_int_config('max_batch_size', MAX_BATCH_SIZE)
+        )
+        while True:
+            try:
+                batcher.run_once()
+            except Exception as e:
+                logging.error(f"Error in main loop: {e}", exc_info=True)
+            sleep(CHECK_INTERVAL)
     while True:
         try:
             tasks_data = load_tasks()
             for agent_id in list(tasks_data['agents'].keys()):
-                # Skip processing if agent has completed PR
-                if tasks_data['agents'][agent_id].get('pr_url'):
-                    continue
-                    
-                update_agent_output(agent_id)
-                if agent_id in aider_sessions:
-                    agent_session: AgentSession = aider_sessions[agent_id]
-                    if agent_session.is_ready():
-                        session_logs = agent_session.get_output()
-                        try:
-                            #if session_logs is empty or only newlines. replace it with "*aider started*"
-                            if not session_logs or session_logs.isspace():
-                                session_logs = "*aider started*"
-                            follow_up_message = litellm_client.chat_completion(
-                                PROMPT_AIDER(agent_session.task),
-                                session_logs,
-                                model_type="agent",
-                                agent_id=agent_id
-                            )
-                            logging.info(f"Agent {agent_id} response: {follow_up_message}")
-                            if agent_id in tasks_data['agents']:
-                                try:
-                                    follow_up_data = json.loads(follow_up_message)
-                                    current_time = datetime.datetime.now().isoformat()
-                                    if 'progress_history' not in tasks_data['agents'][agent_id]:
-                                        tasks_data['agents'][agent_id]['progress_history'] = []
-                                    if 'thought_history' not in tasks_data['agents'][agent_id]:
-                                        tasks_data['agents'][agent_id]['thought_history'] = []
-                                    if follow_up_data.get('progress'):
-                                        tasks_data['agents'][agent_id]['progress'] = follow_up_data['progress']
-                                        tasks_data['agents'][agent_id]['progress_history'].append({
-                                            'timestamp': current_time,
-                                            'content': follow_up_data['progress']
-                                        })
-                                    if follow_up_data.get('thought'):
-                                        tasks_data['agents'][agent_id]['thought'] = follow_up_data['thought']
-                                        tasks_data['agents'][agent_id]['thought_history'].append({
-                                            'timestamp': current_time,
-                                            'content': follow_up_data['thought']
-                                        })
-                                    tasks_data['agents'][agent_id].update({
-                                        'future': follow_up_data.get('future', ''),
-                                        'last_action': follow_up_data.get('action', ''),
-                                        'last_updated': current_time
-                                    })
-                                    save_tasks(tasks_data)
-                                except json.JSONDecodeError:
-                                    logging.error(f"Invalid JSON in follow_up_message: {follow_up_message}")
-                            if agent_id in prompt_processors:
-                                processor = prompt_processors[agent_id]
-                                action = processor.process_response(agent_id, follow_up_message)
-                                if agent_id in aider_sessions:
-                                    action_message = f'\n\n [AGENT ACTION]: {action} \n\n'
-                                    aider_sessions[agent_id].output_buffer.write(action_message)
-                                if action == "/finish":
-                                    pr_info = processor.get_agent_state(agent_id).get('pr_info')
-                                    if pr_info:
-                                        try:
-                                            branch_name = f"agent-{agent_id[:8]}"
-                                            pr = pr_manager.create_pull_request(
-                                                    agent_id,
-                                                    branch_name,
-                                                    pr_info
-                                                )
-                                            if pr:
-                                                logging.info(f"Created PR: {pr.html_url}")
-                                                tasks_data['agents'][agent_id]['pr_url'] = pr.html_url
-                                                tasks_data['agents'][agent_id]['status'] = 'completed'
-                                                tasks_data['agents'][agent_id]['completed_at'] = datetime.datetime.now().isoformat()
-                                                # Clean up the session
-                                                if agent_id in aider_sessions:
-                                                    aider_sessions[agent_id].cleanup()
-                                                    del aider_sessions[agent_id]
-                                                save_tasks(tasks_data)
-                                            else:
-                                                logging.error("Failed to create PR")
-                                        except Exception as e:
-                                            logging.error(f"Error creating PR: {e}")
-                                    else:
-                                        logging.error("No PR info found in agent state")
-                                elif action:
-                                    if agent_session.send_message(action, "instruct"):
-                                        logging.info(f"Sending action: {action} to {agent_id}")
-                                    else:
-                                        logging.error(f"Failed to send action to agent {agent_id}")
-                                else:
-                                    logging.error(f"Failed to process response from OpenRouter")
-                            else:
-                                logging.error(f"No prompt processor found for agent {agent_id}")
-                        except Exception as e:
-                            logging.error(f"Error processing session summary for agent {agent_id}:", exc_info=True)
-                            logging.error(f"Session logs length: {len(session_logs) if session_logs else 0}")
-                            logging.error(f"Task description: {agent_session.task[:200]}...")
+                supervise_agent(agent_id, litellm_client, pr_manager)
             sleep(CHECK_INTERVAL)
         except Exception as e:
             logging.error(f"Error in main loop: {e}", exc_info=True)
@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+from typing import Tuple
+
+class OutputRingBuffer:
+    """Bounded, chunked text buffer addressed by absolute offsets.
+
+    Offsets count characters written since the buffer was created and only ever
+    grow, so a consumer can remember where it stopped reading and later pull just
+    the new text with read_since(). Once more than max_length characters are held
+    the oldest text is dropped.
+    """
+
+    def __init__(self, max_length: int = 1000000, chunk_size: int = 4096):
+        self.max_length = max(1, int(max_length))
+        self.chunk_size = max(1, int(chunk_size))
+        self._chunks = deque()  # [start_offset, text] pairs, oldest first
+        self._start_offset = 0
+        self._end_offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def start_offset(self) -> int:
+        """Offset of the oldest character still held."""
+        return self._start_offset
+
+    @property
+    def end_offset(self) -> int:
+        """Offset just past the newest character written."""
+        return self._end_offset
+
+    def __len__(self) -> int:
+        return self._end_offset - self._start_offset
+
+    def write(self, text: str) -> int:
+        if not text:
+            return 0
+        with self._lock:
+            if self._chunks and len(self._chunks[-1][1]) < self.chunk_size:
+                self._chunks[-1][1] += text
+            else:
+                self._chunks.append([self._end_offset, text])
+            self._end_offset += len(text)
+            self._evict()
+        return len(text)
+
+    def _evict(self) -> None:
+        excess = (self._end_offset - self._start_offset) - self.max_length
+        while excess > 0 and self._chunks:
+            start, text = self._chunks[0]
+            if len(text) <= excess:
+                self._chunks.popleft()
+                excess -= len(text)
+                self._start_offset = start + len(text)
+            else:
+                self._chunks[0] = [start + excess, text[excess:]]
+                self._start_offset = start + excess
+                excess = 0
+
+    def read_since(self, offset: int) -> Tuple[str, int]:
+        """Return the text written at or after offset and the new end offset.
+
+        If offset points at text that has already been evicted, reading starts at
+        start_offset; callers can detect the gap by comparing the two.
+        """
+        with self._lock:
+            offset = max(offset, self._start_offset)
+            if offset >= self._end_offset:
+                return '', self._end_offset
+            parts = []
+            for start, text in reversed(self._chunks):
+                if start + len(text) <= offset:
+                    break
+                parts.append(text[max(0, offset - start):])
+            parts.reverse()
+            return ''.join(parts), self._end_offset
+
+    def getvalue(self) -> str:
+        return self.read_since(self._start_offset)[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chunks.clear()
+            self._start_offset = self._end_offset
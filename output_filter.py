@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+import threading
+from collections import Counter
+from typing import Dict, Hashable, Optional, Tuple
+
+# Lines of aider output that are never shown to the agent, by rule name
+DEFAULT_FILTER_RULES = {
+    'prompt_toolkit': r"Can't initialize prompt toolkit",
+    'update_notice': r"Newer aider version|Run this command to update:|python\.exe -m pip install aider",
+    'windows_shell': r"cmd\.exe\?",
+    'banner': r"Aider v|Model:|Git repo:|Repo-map:|Use /help",
+}
+# Progress bars and spinner frames; consecutive frames of the same line are collapsed to the last
+PROGRESS_PATTERN = r"%\||[⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏░▏▎▍▌▋▊▉█][ \t]*$"
+
+def _line_span(text: str, match) -> Tuple[int, int]:
+    """Start and end (past the newline) of the line holding match."""
+    start = text.rfind('\n', 0, match.start()) + 1
+    end = text.find('\n', match.end())
+    return start, len(text) if end < 0 else end + 1
+
+class OutputFilter:
+    """Drops noise lines from aider output and collapses progress spinners.
+
+    All rules are joined into a single regex that is searched across the whole
+    chunk, so only matching lines are visited in Python and a chunk with nothing
+    to filter is returned untouched. Progress frames are handled a run at a
+    time: one regex match covers every consecutive frame of the same line, so
+    Python only sees the start of each run, not each frame. Text is expected with '\\n' line endings,
+    as the I/O reactor delivers it. Counts of dropped lines per rule and of
+    collapsed progress frames are kept for stats().
+
+    A live progress bar usually arrives one frame per chunk. Filtering with a
+    stream key holds back a progress frame that ends a chunk until the next
+    chunk of that stream shows whether more frames of the same line follow, so
+    those collapse too; flush() releases the held frame when the stream ends.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, str]] = None, progress_pattern: Optional[str] = PROGRESS_PATTERN):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._collapsed = 0
+        self._held: Dict[Hashable, str] = {}  # Trailing progress frame per stream
+        self.configure(DEFAULT_FILTER_RULES if rules is None else rules, progress_pattern)
+
+    def configure(self, rules: Dict[str, str], progress_pattern: Optional[str] = PROGRESS_PATTERN) -> None:
+        rules = {name: re.compile(pattern, re.MULTILINE) for name, pattern in rules.items() if pattern}
+        # A flat alternation lets re use its fast prefix scan; named groups per rule defeat it
+        combined = '|'.join(rule.pattern for rule in rules.values())
+        regex = re.compile(combined, re.MULTILINE) if combined else None
+        progress = progress_run = None
+        if progress_pattern:
+            progress = re.compile(progress_pattern, re.MULTILINE)
+            # Frames of one progress line share the label before the percentage or spinner
+            frame = rf"[\d. ]*(?:{progress_pattern})[^\n]*"
+            progress_run = re.compile(rf"(?P<label>[^\n]*?){frame}(?:\n(?P=label){frame})*", re.MULTILINE)
+        with self._lock:
+            self._rules = rules
+            self._regex = regex
+            self._progress = progress
+            self._progress_run = progress_run
+
+    def filter(self, text: str, stream: Optional[Hashable] = None) -> str:
+        regex, progress, progress_run, rules = self._regex, self._progress, self._progress_run, self._rules
+        if stream is not None:
+            with self._lock:
+                text = self._held.pop(stream, '') + text
+            text = self._filter(text, regex, progress, progress_run, rules)
+            if text and progress:
+                last = text.rfind('\n', 0, len(text) - 1) + 1
+                if progress.search(text, last):
+                    with self._lock:
+                        self._held[stream] = text[last:]
+                    text = text[:last]
+            return text
+        return self._filter(text, regex, progress, progress_run, rules)
+
+    def flush(self, stream: Hashable) -> str:
+        """Return and forget the progress frame held back for stream."""
+        with self._lock:
+            return self._held.pop(stream, '')
+
+    def _filter(self, text: str, regex, progress, progress_run, rules) -> str:
+        if not text:
+            return text
+        hits = Counter()
+        collapsed = 0
+        drops = []  # (start, end) spans of whole lines to remove
+        if regex:
+            pos = 0
+            while True:
+                match = regex.search(text, pos)
+                if not match:
+                    break
+                start, pos = _line_span(text, match)
+                drops.append((start, pos))
+                line = text[start:pos]
+                hits[next((name for name, rule in rules.items() if rule.search(line)), 'unknown')] += 1
+        if progress:
+            pos, frames = 0, []
+            while True:
+                match = progress.search(text, pos)
+                if not match:
+                    break
+                start = text.rfind('\n', 0, match.start()) + 1
+                run = progress_run.match(text, start)
+                end = run.end() if run else match.end()
+                # Keep only the last frame of the run
+                last = text.rfind('\n', start, end) + 1
+                if last > start:
+                    frames.append((start, last))
+                    collapsed += text.count('\n', start, last)
+                pos = max(end, match.end())
+            if frames:
+                drops = sorted(drops + frames)
+        if not drops:
+            return text
+        kept, pos = [], 0
+        for start, end in drops:
+            if start > pos:
+                kept.append(text[pos:start])
+            pos = max(pos, end)
+        kept.append(text[pos:])
+        with self._lock:
+            self._hits.update(hits)
+            self._collapsed += collapsed
+        return ''.join(kept)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'rules': sorted(self._rules),
+                'hits': dict(self._hits),
+                'collapsed': self._collapsed
+            }
+
+# Shared by every AgentSession
+output_filter = OutputFilter()
+
+def load_output_filter() -> None:
+    """Apply the output_filter_rules and output_filter_progress config keys.
+
+    output_filter_rules is a JSON object of rule name to regex merged over the
+    defaults; a null or empty regex disables that rule. An empty
+    output_filter_progress turns off spinner collapsing.
+    """
+    try:
+        from database import get_config
+        rules = dict(DEFAULT_FILTER_RULES)
+        raw = get_config('output_filter_rules')
+        if raw:
+            rules.update(json.loads(raw))
+        progress = get_config('output_filter_progress')
+        output_filter.configure(rules, PROGRESS_PATTERN if progress is None else progress)
+    except Exception as e:
+        logging.warning(f"Could not load output filter rules: {e}")
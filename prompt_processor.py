@@ -7,6 +7,8 @@ from datetime import datetime
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
+ALLOWED_COMMANDS = ['/instruct', '/ls', '/git', '/add', '/finish', '/run', '/map', '/test']
+
 @dataclass
 class AgentResponse:
     """Store individual agent responses"""
@@ -23,6 +25,16 @@ class PromptProcessor:
         self.agent_states: Dict[str, Dict] = {}
         self.response_history: Dict[str, List[AgentResponse]] = {}
         
+    def parse_action(self, action: str) -> Optional[str]:
+        """Validate an action and return what to send to aider, or None if it is not an allowed command"""
+        action = action.strip()
+        if not any(action.startswith(cmd) for cmd in ALLOWED_COMMANDS):
+            return None
+        if action.startswith('/instruct '):
+            # Just the instruction without the command
+            return action[10:].strip()
+        return action
+
     def process_response(self, agent_id: str, response: str) -> Optional[str]:
         """Process a JSON response and return the action to execute"""
         try:
@@ -36,10 +48,9 @@ class PromptProcessor:
                 return None
             
             # Validate action is an allowed command
-            action = data['action'].strip()
-            allowed_commands = ['/instruct', '/ls', '/git', '/add', '/finish', '/run', '/map', '/test']
-            if not any(action.startswith(cmd) for cmd in allowed_commands):
-                logger.error(f"Invalid command in action: {action}")
+            action = self.parse_action(data['action'])
+            if action is None:
+                logger.error(f"Invalid command in action: {data['action'].strip()}")
                 return None
             
             # Create and store response object
@@ -68,7 +79,6 @@ class PromptProcessor:
             }
             
             # Process action
-            action = agent_response.action.strip()
             if action == '/finish':
                 from pull_request import PullRequestManager
                 
@@ -85,13 +95,7 @@ class PromptProcessor:
                     # Store PR info in agent state
                     self.agent_states[agent_id]['pr_info'] = pr_data
                     self.agent_states[agent_id]['status'] = 'creating_pr'
-                return action
-                
-            elif action.startswith('/instruct '):
-                # Return just the instruction without the command
-                return action[10:].strip()
-            else:
-                return action
+            return action
                 
         except json.JSONDecodeError:
             logger.error(f"Invalid JSON response: {response}")
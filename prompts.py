@@ -1,6 +1,5 @@
 #TODO: do not hardcode powershell, the LLM should be able to determine which Terminal is being used
-def PROMPT_AIDER(task_description: str) -> str:
-    return """You are an expert software developer manager.
+AIDER_INSTRUCTIONS = """You are an expert software developer manager.
 You are talking to Aider, an AI programming assistant.
 Do not write code. 
 Only give instructions and commands.
@@ -9,15 +8,37 @@ You need to make decisions and assumptions yourself.
 You can give aider file structure and context using '/ls' and '/add <file>'.
 For your own context run /map first to get a sense of the project.
 It is recommended to do some analysis with /ls , /map and /run other commands first before starting to instruct code changes.
-The response should be in this JSON schema:
-{{
+"""
+
+AIDER_DECISION_SCHEMA = """{
     "progress": "one sentence update on progress so far",
     "thought": "one sentence rationale",
     "action":  "/instruct <message>" | "/ls" | "/git <git command>" | "/add <file>" | "/finish" | "/run <shell_command>" | "/map" | "/test",
     "future": "one sentence prediction",
+}"""
+
+# Identical for every agent and turn, so providers can cache it as the prompt prefix
+PROMPT_AIDER_SYSTEM = AIDER_INSTRUCTIONS + """The response should be in this JSON schema:
+{schema}
+""".format(schema=AIDER_DECISION_SCHEMA)
+
+def PROMPT_AIDER_TASK(task_description: str) -> str:
+    return "The overall goal is: {task_description}\n".format(task_description=task_description)
+
+def PROMPT_AIDER(task_description: str) -> str:
+    return PROMPT_AIDER_SYSTEM + PROMPT_AIDER_TASK(task_description)
+
+def PROMPT_AIDER_BATCH() -> str:
+    return AIDER_INSTRUCTIONS + """You are managing several Aider sessions at once, each with its own goal.
+The message has a section per agent, headed "### Agent <agent id>", with its goal and latest Aider output.
+Decide the next step for every agent on its own.
+The response should be in this JSON schema, with an entry for every agent id:
+{{
+    "decisions": {{
+        "<agent id>": {schema}
+    }}
 }}
-The overall goal is: {task_description}
-""".format(task_description=task_description)
+""".format(schema=AIDER_DECISION_SCHEMA.replace('\n', '\n        '))
 
 def PROMPT_PR() -> str:
     return """Generate a pull request description based on the changes made.
@@ -0,0 +1,93 @@
+import datetime
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+PROVISIONING_WORKERS = 4  # Agents provisioned in parallel
+MAX_FINISHED_JOBS = 500  # Finished jobs kept for status polling
+
+class ProvisioningQueue:
+    """Runs agent provisioning (clone, branch, start aider) on a worker pool.
+
+    Each requested agent becomes a job with its own id and status
+    ('queued', 'running', 'succeeded' or 'failed') that clients poll, so
+    POST /create_agent can return straight away.
+    """
+
+    def __init__(self, max_workers: int = PROVISIONING_WORKERS):
+        self.max_workers = max_workers
+        self.jobs: Dict[str, Dict] = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, repository_url: str, task_description: str, num_agents: int = 1,
+               aider_commands: Optional[str] = None, agent_config: Optional[Dict] = None) -> List[str]:
+        """Queue one job per agent and return the job ids."""
+        job_ids = []
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='provision')
+            for _ in range(num_agents):
+                job_id = str(uuid.uuid4())
+                self.jobs[job_id] = {
+                    'id': job_id,
+                    'status': 'queued',
+                    'task': task_description,
+                    'repository_url': repository_url,
+                    'agent_id': None,
+                    'error': None,
+                    'created_at': datetime.datetime.now().isoformat(),
+                    'started_at': None,
+                    'finished_at': None
+                }
+                self._executor.submit(self._run, job_id, repository_url, task_description, aider_commands, agent_config)
+                job_ids.append(job_id)
+            self._prune()
+        return job_ids
+
+    def _run(self, job_id: str, repository_url: str, task_description: str,
+             aider_commands: Optional[str], agent_config: Optional[Dict]) -> None:
+        from orchestrator import provision_agent
+        self._update(job_id, status='running', started_at=datetime.datetime.now().isoformat())
+        try:
+            agent_id = provision_agent(repository_url, task_description, agent_config, aider_commands)
+            if agent_id:
+                self._update(job_id, status='succeeded', agent_id=agent_id)
+            else:
+                self._update(job_id, status='failed', error='Failed to provision agent')
+        except Exception as e:
+            logging.error(f"Provisioning job {job_id} failed: {e}", exc_info=True)
+            self._update(job_id, status='failed', error=str(e))
+        finally:
+            self._update(job_id, finished_at=datetime.datetime.now().isoformat())
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs. Caller must hold the lock."""
+        finished = [j['id'] for j in self.jobs.values() if j['finished_at']]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait)
+
+# Shared by the /create_agent and /jobs routes
+provisioning_queue = ProvisioningQueue()
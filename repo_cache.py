@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+REPO_CACHE_DIR = Path(tempfile.gettempdir()) / "agent_repo_cache"
+MIRROR_FETCH_INTERVAL = 30  # Seconds a mirror is considered fresh after a fetch
+
+class RepoCache:
+    """Local bare mirrors of remote repositories, one per URL.
+
+    The first agent on a repository pays for a full `git clone --mirror`; later
+    agents only fetch what changed upstream (at most every fetch_interval
+    seconds) and get their workspace as a `git clone --shared` of the mirror,
+    which borrows the mirror's object store instead of copying it. The
+    workspace's origin is pointed back at the real remote so pushes and PR
+    branches never go to the mirror. Automatic gc is disabled in mirrors so
+    objects shared workspaces rely on are not pruned.
+    """
+
+    def __init__(self, cache_dir: Path = REPO_CACHE_DIR, fetch_interval: float = MIRROR_FETCH_INTERVAL):
+        self.cache_dir = Path(cache_dir)
+        self.fetch_interval = fetch_interval
+        self._last_fetch: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def mirror_path(self, repository_url: str) -> Path:
+        name = repository_url.rstrip('/').split('/')[-1]
+        if name.endswith('.git'):
+            name = name[:-4]
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', name) or 'repo'
+        digest = hashlib.sha1(repository_url.encode('utf-8')).hexdigest()[:12]
+        return self.cache_dir / f"{name}-{digest}.git"
+
+    def _lock_for(self, repository_url: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(repository_url, threading.Lock())
+
+    def ensure_mirror(self, repository_url: str) -> Optional[Path]:
+        """Create or refresh the mirror for repository_url; returns its path or None."""
+        mirror = self.mirror_path(repository_url)
+        # Concurrent provisioning jobs for one repository share a single clone/fetch
+        with self._lock_for(repository_url):
+            if (mirror / 'HEAD').exists():
+                if time.monotonic() - self._last_fetch.get(repository_url, float('-inf')) < self.fetch_interval:
+                    return mirror
+                logging.info(f"Fetching updates into mirror {mirror}")
+                if not _git(['remote', 'update', '--prune'], cwd=mirror):
+                    # A stale mirror is still usable; the workspace just starts a little behind
+                    logging.warning(f"Could not update mirror of {repository_url}, using cached copy")
+            else:
+                logging.info(f"Creating mirror of {repository_url} at {mirror}")
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                if not _git(['clone', '--mirror', '--quiet', repository_url, str(mirror)]):
+                    return None
+                _git(['config', 'gc.auto', '0'], cwd=mirror)
+            self._last_fetch[repository_url] = time.monotonic()
+            return mirror
+
+    def clone(self, repository_url: str, target_dir) -> bool:
+        """Create a workspace checkout of repository_url at target_dir from the mirror."""
+        mirror = self.ensure_mirror(repository_url)
+        if not mirror:
+            return False
+        target_dir = Path(target_dir)
+        if not _git(['clone', '--shared', '--quiet', str(mirror), str(target_dir)]):
+            return False
+        return _git(['remote', 'set-url', 'origin', repository_url], cwd=target_dir)
+
+def _git(args, cwd=None) -> bool:
+    try:
+        result = subprocess.run(
+            ['git'] + args,
+            cwd=str(cwd) if cwd else None,
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            logging.error(f"git {args[0]} failed: {result.stderr}")
+            return False
+        return True
+    except Exception as e:
+        logging.error(f"git {args[0]} failed: {e}", exc_info=True)
+        return False
+
+# Shared by every provisioning job
+repo_cache = RepoCache()
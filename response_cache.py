@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+DEFAULT_CACHE_TTL = 24 * 60 * 60  # seconds
+
+class ResponseCache:
+    """Persistent cache of LLM responses stored in the llm_cache table.
+
+    Entries are keyed on a hash of (model, system_message, user_message,
+    response_format), expire after `ttl` seconds and are evicted least recently
+    used first once more than `max_entries` are stored.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES, ttl: float = DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, system_message: str, user_message: str, response_format: Optional[Dict] = None) -> str:
+        payload = json.dumps([model, system_message, user_message, response_format], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        from database import get_cached_response
+        response = get_cached_response(key, self.ttl)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def set(self, key: str, model: str, response: str) -> None:
+        from database import save_cached_response
+        if not save_cached_response(key, model, response, self.max_entries, self.ttl):
+            logging.warning("Could not store LLM response in cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+# Shared by every LiteLLMClient that has caching enabled
+response_cache = ResponseCache()
+
+def load_cache_settings() -> bool:
+    """Apply llm_cache_* config keys and return whether caching is enabled."""
+    try:
+        from database import get_config
+        if get_config('llm_cache_max_entries'):
+            response_cache.max_entries = int(get_config('llm_cache_max_entries'))
+        if get_config('llm_cache_ttl'):
+            response_cache.ttl = float(get_config('llm_cache_ttl'))
+        return (get_config('llm_cache_enabled') or '').lower() in ('1', 'true', 'yes', 'on')
+    except Exception as e:
+        logging.warning(f"Could not load LLM cache settings: {e}")
+        return False
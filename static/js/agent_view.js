@@ -1,171 +1,165 @@
 // Global variables and state management
 const lastOutputLengths = {};
 let updateInterval;
+// Change version and ETag of the last tasks.json response; null until the first full load
+let tasksVersion = null;
+let tasksEtag = null;
+// Tail of each agent's transcript held by the page: {start, text}
+const agentOutputs = {};
+// Live output nodes kept per card; older ones are trimmed from the top
+const MAX_OUTPUT_NODES = 5000;
 
-// Helper function to get output length from debug info
-function getOutputLength(debugElement) {
-    const lengthElement = debugElement.querySelector('.label');
-    if (lengthElement && lengthElement.textContent.includes('Output Length')) {
-        const lengthText = lengthElement.parentElement.textContent;
-        return parseInt(lengthText.split(':')[1].trim());
+// Merge full or appended aider output into agentOutputs; returns true if it changed
+function mergeOutput(agentId, agentData) {
+    if ('aider_output' in agentData) {
+        const text = agentData.aider_output || '';
+        agentOutputs[agentId] = {start: (agentData.aider_output_length || text.length) - text.length, text: text};
+        return true;
     }
-    return 0;
+    const append = agentData.aider_output_append;
+    if (!append) return false;
+    const held = agentOutputs[agentId];
+    if (!held || append.start < held.start || append.start > held.start + held.text.length) {
+        agentOutputs[agentId] = {start: append.start, text: append.text};
+    } else {
+        // Appends are keyed by offset, so replaying one is harmless
+        held.text = held.text.slice(0, append.start - held.start) + append.text;
+    }
+    return true;
 }
 
-// Function to fetch updates via AJAX
-async function fetchUpdates() {
-    try {
-        const response = await fetch('/tasks/tasks.json');
-        const responseClone = response.clone(); // Clone the response
-        const tasksData = await response.json();
-        // Update each agent's output
-        for (const [agentId, agentData] of Object.entries(tasksData.agents)) {
-            const agentCard = document.getElementById(`agent-${agentId}`);
-            if (!agentCard) continue;
-
-            // Find agent state container
-            const agentState = agentCard.querySelector('.agent-state');
-            if (agentState) {
-                // Update all fields using data attributes
-                const fields = {
-                    'thought': agentData.thought || '',
-                    'progress': agentData.progress || '',
-                    'future': agentData.future || '',
-                    'action': agentData.last_action || ''
-                };
-
-                // Update each field
-                Object.entries(fields).forEach(([field, value]) => {
-                    // Update all elements with this data-field, both in agent state and footer
-                    const elements = agentCard.querySelectorAll(`[data-field="${field}"]`);
-                    elements.forEach(element => {
-                        element.innerHTML = value || (field === 'thought' ? 'Thinking...' : 'Planning...');
-                    });
-                
-                    // Also update header progress if this is the progress field
-                    if (field === 'task') {
-                        const headerProgress = agentCard.querySelector('[data-field="header-task"]');
-                        if (headerProgress) {
-                            headerProgress.innerHTML = value;
-                        }
-                    }
-                });
-
-                // Toggle visibility based on thought
-                agentState.style.display = agentData.thought ? 'block' : 'none';
-            }
+// Apply a full or partial agent record to its card
+function applyAgentUpdate(agentId, agentData) {
+    const agentCard = document.getElementById(`agent-${agentId}`);
+    if (!agentCard) return;
 
-            // Update CLI output if it has changed
-            const outputElement = agentCard.querySelector('.cli-output');
+    // Find agent state container
+    const agentState = agentCard.querySelector('.agent-state');
+    if (agentState) {
+        // Update all fields using data attributes; deltas only carry changed fields
+        const fields = {};
+        if ('thought' in agentData) fields['thought'] = agentData.thought || '';
+        if ('progress' in agentData) fields['progress'] = agentData.progress || '';
+        if ('future' in agentData) fields['future'] = agentData.future || '';
+        if ('last_action' in agentData) fields['action'] = agentData.last_action || '';
 
-            if (outputElement && agentData.aider_output) {
-                const currentText = outputElement.textContent || '';
-                
-                // Only update if output has changed
-                if (agentData.aider_output !== currentText) {
-                    outputElement.innerHTML = agentData.aider_output;
-                    outputElement.scrollTop = outputElement.scrollHeight;
-                    
-                    // Flash effect for new content
-                    outputElement.style.transition = 'background-color 0.5s';
-                    outputElement.style.backgroundColor = '#2e4052';
-                    setTimeout(() => {
-                        outputElement.style.backgroundColor = '#1e1e1e';
-                    }, 500);
+        // Update each field
+        Object.entries(fields).forEach(([field, value]) => {
+            // Update all elements with this data-field, both in agent state and footer
+            const elements = agentCard.querySelectorAll(`[data-field="${field}"]`);
+            elements.forEach(element => {
+                element.innerHTML = value || (field === 'thought' ? 'Thinking...' : 'Planning...');
+            });
+        
+            // Also update header progress if this is the progress field
+            if (field === 'task') {
+                const headerProgress = agentCard.querySelector('[data-field="header-task"]');
+                if (headerProgress) {
+                    headerProgress.innerHTML = value;
                 }
             }
+        });
 
-            // Update status and timestamps
-            const statusBadge = agentCard.querySelector('.badge');
-            if (statusBadge && agentData.status) {
-                statusBadge.textContent = agentData.status;
-                statusBadge.className = `badge ${agentData.status === 'in_progress' ? 'bg-primary' : 
-                                    agentData.status === 'pending' ? 'bg-warning' : 'bg-success'}`;
-            }
+        // Toggle visibility based on thought
+        if ('thought' in agentData) {
+            agentState.style.display = agentData.thought ? 'block' : 'none';
+        }
+    }
 
-            // Update PR info if it exists
-            const prInfoSection = agentCard.querySelector('#pr-info-' + agentId);
-            if (prInfoSection && agentData.pr_url) {
-                prInfoSection.style.display = 'block';
-                const prLink = prInfoSection.querySelector('a.alert-link');
-                if (prLink) {
-                    prLink.href = agentData.pr_url;
-                    prLink.textContent = 'View on GitHub';
-                }
-            }
+    // Update CLI output if it has changed
+    const outputElement = agentCard.querySelector('.cli-output');
 
-        }
+    if (outputElement && mergeOutput(agentId, agentData)) {
+        const newOutput = agentOutputs[agentId].text;
         
-        // Create temporary div to parse HTML
-        const tempDiv = document.createElement('div');
-        tempDiv.innerHTML = await responseClone.text(); // Use cloned response
-        
-        // Update each agent's output
-        const agents = document.querySelectorAll('.agent-card');
-        agents.forEach(agent => {
-            const agentId = agent.id.replace('agent-', '');
-            const newAgentCard = tempDiv.querySelector(`#agent-${agentId}`);
+        // Only update if output has changed
+        if (newOutput && newOutput !== outputElement.innerHTML) {
+            outputElement.innerHTML = newOutput;
+            outputElement.scrollTop = outputElement.scrollHeight;
             
-            if (newAgentCard) {
-                // Update CLI output if it has changed
-                const currentOutput = agent.querySelector('.cli-output');
-                const newOutput = newAgentCard.querySelector('.cli-output');
-                
-                if (currentOutput && newOutput) {
-                    const currentText = currentOutput.textContent || '';
-                    const newText = newOutput.textContent || '';
-                    
-                    // Initialize last output length if not exists
-                    if (!(agentId in lastOutputLengths)) {
-                        lastOutputLengths[agentId] = currentText.length;
-                    }
-                    
-                    // Check if output has changed
-                    if (newText.length > lastOutputLengths[agentId]) {
-                        // Update the output
-                        currentOutput.innerHTML = newOutput.innerHTML;
-                        lastOutputLengths[agentId] = newText.length;
-                        
-                        // Auto-scroll to bottom of output
-                        currentOutput.scrollTop = currentOutput.scrollHeight;
-                        
-                        // Flash the output box to indicate new content
-                        currentOutput.style.transition = 'background-color 0.5s';
-                        currentOutput.style.backgroundColor = '#2e4052';
-                        setTimeout(() => {
-                            currentOutput.style.backgroundColor = '#1e1e1e';
-                        }, 500);
-                    }
-                }
-                
-                // Update status badge
-                const currentStatus = agent.querySelector('.badge');
-                const newStatus = newAgentCard.querySelector('.badge');
-                if (currentStatus && newStatus) {
-                    currentStatus.className = newStatus.className;
-                    currentStatus.textContent = newStatus.textContent;
-                }
-                
-                // Update debug info
-                const currentDebug = agent.querySelector('.debug-info');
-                const newDebug = newAgentCard.querySelector('.debug-info');
-                if (currentDebug && newDebug) {
-                    const currentLength = getOutputLength(currentDebug);
-                    const newLength = getOutputLength(newDebug);
-                    
-                    if (currentLength !== newLength) {
-                        currentDebug.innerHTML = newDebug.innerHTML;
-                    }
-                }
-                
-                // Update last critique if it exists
-                const currentCritique = agent.querySelector('.progress-section:last-child');
-                const newCritique = newAgentCard.querySelector('.progress-section:last-child');
-                if (currentCritique && newCritique && currentCritique.innerHTML !== newCritique.innerHTML) {
-                    currentCritique.innerHTML = newCritique.innerHTML;
-                }
-            }
-        });
+            // Flash effect for new content
+            outputElement.style.transition = 'background-color 0.5s';
+            outputElement.style.backgroundColor = '#2e4052';
+            setTimeout(() => {
+                outputElement.style.backgroundColor = '#1e1e1e';
+            }, 500);
+        }
+    }
+
+    if (agentData.events) {
+        const recent = agentData.events.recent || [];
+        applyAgentEvents(agentId, agentData.events.counts, recent[recent.length - 1]);
+    }
+
+    // Update status and timestamps
+    const statusBadge = agentCard.querySelector('.badge');
+    if (statusBadge && agentData.status) {
+        statusBadge.textContent = agentData.status;
+        statusBadge.className = `badge ${agentData.status === 'in_progress' ? 'bg-primary' : 
+                            agentData.status === 'pending' ? 'bg-warning' : 'bg-success'}`;
+    }
+
+    // Update PR info if it exists
+    const prInfoSection = agentCard.querySelector('#pr-info-' + agentId);
+    if (prInfoSection && agentData.pr_url) {
+        prInfoSection.style.display = 'block';
+        const prLink = prInfoSection.querySelector('a.alert-link');
+        if (prLink) {
+            prLink.href = agentData.pr_url;
+            prLink.textContent = 'View on GitHub';
+        }
+    }
+}
+
+// One-line description of a parsed aider event
+function describeEvent(event) {
+    const data = event.data || {};
+    switch (event.type) {
+        case 'file_edited': return `Edited ${data.path}`;
+        case 'commit': return `Committed ${data.hash}: ${data.message}`;
+        case 'command': return `Ran ${data.command}` + (data.exit_status === null ? '' : ` (exit ${data.exit_status})`);
+        case 'question': return `Asked: ${data.question}`;
+        case 'error': return `Error: ${data.message}`;
+        default: return '';
+    }
+}
+
+// Show event counts and the latest event; counts are replaced, or bumped for a single pushed event
+function applyAgentEvents(agentId, counts, latest, increment = false) {
+    const agentCard = document.getElementById(`agent-${agentId}`);
+    if (!agentCard) return;
+    agentCard.querySelectorAll('[data-event-count]').forEach(element => {
+        const type = element.getAttribute('data-event-count');
+        if (increment) {
+            if (latest && latest.type === type) element.textContent = parseInt(element.textContent || '0', 10) + 1;
+        } else {
+            element.textContent = (counts && counts[type]) || 0;
+        }
+    });
+    const latestElement = agentCard.querySelector('[data-field="last-event"]');
+    if (latestElement && latest) latestElement.textContent = describeEvent(latest);
+}
+
+// Function to fetch updates via AJAX
+async function fetchUpdates() {
+    try {
+        const url = tasksVersion === null ? '/tasks/tasks.json' : `/tasks/tasks.json?since=${tasksVersion}`;
+        const headers = tasksEtag ? {'If-None-Match': tasksEtag} : {};
+        const response = await fetch(url, {headers: headers, cache: 'no-store'});
+        if (response.status === 304) return;  // Nothing changed since the last poll
+        tasksEtag = response.headers.get('ETag');
+        const tasksData = await response.json();
+        tasksVersion = tasksData.version;
+
+        // Drop cards of agents deleted since the last poll
+        for (const agentId of tasksData.deleted || []) {
+            removeAgentCard(agentId);
+        }
+
+        // Update each agent's output
+        for (const [agentId, agentData] of Object.entries(tasksData.agents)) {
+            applyAgentUpdate(agentId, agentData);
+        }
     } catch (error) {
         console.error('Error fetching updates:', error);
     }
@@ -176,6 +170,70 @@ function forceUpdate() {
     fetchUpdates();
 }
 
+function removeAgentCard(agentId) {
+    const agentCard = document.getElementById(`agent-${agentId}`);
+    if (agentCard) agentCard.remove();
+    delete agentOutputs[agentId];
+}
+
+// Append output pushed over /events; it is not offset-keyed like tasks.json output
+function appendLiveOutput(agentId, text) {
+    const agentCard = document.getElementById(`agent-${agentId}`);
+    const outputElement = agentCard ? agentCard.querySelector('.cli-output') : null;
+    if (!outputElement || !text) return;
+    outputElement.insertAdjacentHTML('beforeend', text);
+    let excess = outputElement.childNodes.length - MAX_OUTPUT_NODES;
+    while (excess-- > 0) {
+        outputElement.removeChild(outputElement.firstChild);
+    }
+    outputElement.scrollTop = outputElement.scrollHeight;
+    delete agentOutputs[agentId];
+}
+
+// Subscribe to pushed updates, falling back to polling while the stream is down
+function connectEvents() {
+    if (!window.EventSource) {
+        updateInterval = setInterval(forceUpdate, 5000);
+        return;
+    }
+    const source = new EventSource('/events');
+    source.onopen = () => {
+        if (updateInterval) {
+            clearInterval(updateInterval);
+            updateInterval = null;
+        }
+    };
+    source.onerror = () => {
+        if (!updateInterval) {
+            // Live output has no offsets, so resync from a full load when polling resumes
+            tasksVersion = null;
+            tasksEtag = null;
+            updateInterval = setInterval(forceUpdate, 5000);
+        }
+    };
+    source.addEventListener('output', event => {
+        const data = JSON.parse(event.data);
+        appendLiveOutput(data.agent_id, data.text);
+    });
+    source.addEventListener('state', event => {
+        const data = JSON.parse(event.data);
+        applyAgentUpdate(data.agent_id, data);
+    });
+    source.addEventListener('aider_event', event => {
+        const data = JSON.parse(event.data);
+        applyAgentEvents(data.agent_id, null, data, true);
+    });
+    source.addEventListener('deleted', event => {
+        removeAgentCard(JSON.parse(event.data).agent_id);
+    });
+    source.addEventListener('reset', () => {
+        // Missed events that can no longer be replayed
+        tasksVersion = null;
+        tasksEtag = null;
+        fetchUpdates();
+    });
+}
+
 // Update toast show function
 function showToast(message, type = 'success') {
     const toastEl = document.getElementById('deleteToast');
@@ -228,8 +286,8 @@ document.addEventListener('DOMContentLoaded', () => {
         lastOutputLengths[agentId] = output.textContent.length;
     });
 
-    // Set up updates for CLI output with a reasonable interval
-    setInterval(forceUpdate, 5000); // Check for updates every 5 seconds
+    // Push updates over server-sent events; polls every 5 seconds only while the stream is down
+    connectEvents();
 
     // Hide loader
     const loader = document.querySelector('.page-loader');
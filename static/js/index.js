@@ -1,3 +1,18 @@
+// Poll provisioning jobs until all of them have finished
+async function waitForJobs(jobIds, onProgress) {
+    while (true) {
+        const response = await fetch(`/jobs?ids=${jobIds.join(',')}`);
+        const data = await response.json();
+        const jobs = data.jobs || [];
+        if (onProgress) onProgress(jobs);
+        // Jobs the server no longer knows about are treated as finished
+        if (jobs.every(job => job.finished_at)) {
+            return jobs;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Function to update overview statistics
 async function updateOverview() {
     try {
@@ -329,8 +344,20 @@ document.addEventListener('DOMContentLoaded', async () => {
 
             resultDiv.style.display = 'block';
             if (data.success) {
+                alertDiv.className = 'alert alert-info';
+                alertDiv.textContent = `Provisioning ${data.job_ids.length} agent(s)...`;
+                const jobs = await waitForJobs(data.job_ids, jobs => {
+                    const done = jobs.filter(job => job.finished_at).length;
+                    alertDiv.textContent = `Provisioning agents: ${done}/${data.job_ids.length} done...`;
+                });
+                const agentIds = jobs.filter(job => job.status === 'succeeded').map(job => job.agent_id);
+                if (agentIds.length === 0) {
+                    alertDiv.className = 'alert alert-danger';
+                    alertDiv.textContent = `Error: ${jobs.map(job => job.error).find(Boolean) || 'Failed to create any agents'}`;
+                    return;
+                }
                 alertDiv.className = 'alert alert-success';
-                alertDiv.textContent = `Success! Agents ${data.agent_ids.join(', ')} created. Redirecting to Agent View...`;
+                alertDiv.textContent = `Success! Agents ${agentIds.join(', ')} created. Redirecting to Agent View...`;
 
                 // Redirect to agents view after a short delay
                 setTimeout(() => {
@@ -1,10 +1,13 @@
 import pytest
 from unittest.mock import patch, MagicMock, call
 import subprocess
+import sys
 import threading
+import time
 import io
 from pathlib import Path
 from agent_session import AgentSession, normalize_path
+from io_reactor import io_reactor
 
 def test_normalize_path():
     """Test path normalization function."""
@@ -94,18 +97,50 @@ def test_agent_session_send_message(mock_popen, agent_session, mock_process):
 
 def test_agent_session_is_ready(agent_session):
     """Test checking if agent session is ready."""
-    # Test with empty output
+    # Test with no output yet
     agent_session.output_buffer = io.StringIO()
     assert agent_session.is_ready() is True
     
-    # Test with stable output
+    # Test with output that has been quiet for the stability duration
     agent_session.output_buffer = io.StringIO("Stable output")
+    agent_session._last_output_time = time.monotonic() - 2
     assert agent_session.is_ready() is True
     
     # Test with error
-    agent_session.get_output = MagicMock(side_effect=Exception())
+    agent_session.config = {}
     assert agent_session.is_ready() is False
 
+def test_wait_until_ready_timeout(agent_session):
+    """Test readiness times out while output keeps arriving."""
+    with agent_session._buffer_lock:
+        agent_session._touch_output()
+    assert agent_session.wait_until_ready(timeout=0.1) is False
+
+def test_wait_until_ready_wakes_when_quiet(agent_session):
+    """Test readiness returns once output stops, without waiting out the timeout."""
+    def write_output():
+        for _ in range(3):
+            with agent_session._buffer_lock:
+                agent_session.output_buffer.write("line\n")
+                agent_session._touch_output()
+            time.sleep(0.1)
+
+    writer = threading.Thread(target=write_output)
+    writer.start()
+    start = time.monotonic()
+    assert agent_session.wait_until_ready(timeout=10) is True
+    elapsed = time.monotonic() - start
+    writer.join()
+    # Last write lands ~0.2s in, plus the 1s stability window
+    assert 1.0 <= elapsed < 3.0
+
+def test_wait_until_ready_stopped(agent_session):
+    """Test cleanup wakes up waiters."""
+    with agent_session._buffer_lock:
+        agent_session._touch_output()
+    threading.Timer(0.1, agent_session.cleanup).start()
+    assert agent_session.wait_until_ready(timeout=10) is False
+
 def test_format_output_line(agent_session):
     """Test output line formatting."""
     # Test agent response
@@ -188,4 +223,79 @@ def test_echo_message(agent_session):
     
     # Test with error
     agent_session.output_buffer = None
-    agent_session._echo_message(test_message)  # Should not raise exception
\ No newline at end of file
+    agent_session._echo_message(test_message)  # Should not raise exception
+
+def test_output_buffer_bounded():
+    """Test output_buffer_max_length caps the session output."""
+    session = AgentSession(
+        workspace_path="test/workspace",
+        task="Test task",
+        config={'output_buffer_max_length': 10}
+    )
+    session.output_buffer.write("0123456789abcdef")
+    assert session.get_output() == "6789abcdef"
+
+def test_read_since(agent_session):
+    """Test reading session output incrementally."""
+    agent_session.output_buffer.write("first\n")
+    offset = agent_session.output_offset
+    agent_session.output_buffer.write("second\n")
+    text, new_offset = agent_session.read_since(offset)
+    assert text == "second\n"
+    assert new_offset == agent_session.output_offset
+
+
+def test_write_output_publishes_event():
+    """Test output of a session with an agent id is pushed to the event bus."""
+    from event_bus import event_bus
+    session = AgentSession("test/workspace", "Test task", agent_id="agent1")
+    last_id = event_bus.last_id
+    session.write_output("new line\n")
+    assert session.get_output() == "new line\n"
+    events = event_bus.events_since(last_id, timeout=0)
+    assert events[-1]['event'] == 'output'
+    assert events[-1]['data'] == {'agent_id': 'agent1', 'text': 'new line\n'}
+
+def test_handle_output_filters_noise(agent_session):
+    """Test startup noise is dropped from chunks of aider output."""
+    agent_session._handle_output("Aider v0.50\nModel: test\nReal output\n> ")
+    assert agent_session.get_output() == "Real output\n> "
+    agent_session._handle_output("Use /help for help\n")
+    assert agent_session.get_output() == "Real output\n> "
+
+def test_handle_output_collapses_live_progress(agent_session):
+    """Test a progress bar arriving a frame per chunk keeps only its last frame."""
+    for p in (10, 50, 100):
+        agent_session._handle_output(f"Scanning repo: {p}%|█| {p}/100\n", "stderr")
+        assert agent_session._last_output_time is not None
+    agent_session._handle_output("Repo scanned\n", "stdout")
+    assert agent_session.get_output() == "Repo scanned\n"
+    agent_session._handle_output("Done\n", "stderr")
+    assert agent_session.get_output() == "Repo scanned\nScanning repo: 100%|█| 100/100\nDone\n"
+
+@pytest.mark.skipif(not io_reactor.supported, reason="IOReactor needs selectable pipes")
+def test_attach_pipes_uses_reactor(agent_session):
+    """Test process output reaches the buffer through the shared reactor."""
+    agent_session.process = subprocess.Popen(
+        [sys.executable, '-c', "import sys; print('out'); sys.stdout.flush(); print('err', file=sys.stderr)"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, text=True
+    )
+    threads_before = threading.active_count()
+    agent_session._attach_pipes()
+    agent_session.process.wait()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and "err" not in (agent_session.get_output() or ""):
+        time.sleep(0.01)
+    assert "out\n" in agent_session.get_output()
+    assert "err\n" in agent_session.get_output()
+    assert threading.active_count() <= threads_before + 1
+    agent_session.cleanup()
+
+def test_handle_output_parses_events(agent_session):
+    """Test aider output is parsed into events held until taken."""
+    agent_session.write_output("earlier\n")
+    agent_session._handle_output("Applied edit to a.py\nCommit abc1234 Add a\n")
+    events = agent_session.take_events()
+    assert [e['type'] for e in events] == ['file_edited', 'commit']
+    assert events[0]['offset'] == len("earlier\n")
+    assert agent_session.take_events() == []
@@ -0,0 +1,73 @@
+import pytest
+from aider_events import AiderEventParser
+
+TRANSCRIPT = """I'll fix the bug.
+src/app.py
+```python
+def ok():
+    return a if b else c?
+```
+Applied edit to src/app.py
+Commit 1a2b3c4 fix: handle empty input
+Running pytest -q
+....F
+AssertionError: expected 1
+1 failed
+Exit status: 1
+Add tests/test_app.py to the chat? (Y)es/(N)o/(D)on't ask again [Yes]: y
+Would you like me to add more tests?
+Traceback (most recent call last):
+  File "x.py", line 1, in <module>
+ValueError: bad value
+Running ls
+a.txt
+> """
+
+@pytest.fixture
+def parser():
+    return AiderEventParser()
+
+def summarize(events):
+    return [(e['type'], e['data']) for e in events]
+
+def test_parses_transcript(parser):
+    """Test each kind of aider output becomes a typed event."""
+    events = parser.feed(TRANSCRIPT, 0)
+    assert summarize(events) == [
+        ('file_edited', {'path': 'src/app.py'}),
+        ('commit', {'hash': '1a2b3c4', 'message': 'fix: handle empty input'}),
+        ('command', {'command': 'pytest -q', 'exit_status': 1, 'lines': 3}),
+        ('question', {'question': 'Add tests/test_app.py to the chat?', 'answer': 'y', 'confirm': True}),
+        ('question', {'question': 'Would you like me to add more tests?', 'answer': None, 'confirm': False}),
+        ('error', {'message': 'ValueError: bad value', 'traceback': True}),
+        ('command', {'command': 'ls', 'exit_status': None, 'lines': 1}),
+    ]
+    assert all(e['timestamp'] for e in events)
+
+def test_offsets(parser):
+    """Test event offsets point at the line that produced them."""
+    events = parser.feed(TRANSCRIPT, 1000)
+    for event in events:
+        line = TRANSCRIPT[event['offset'] - 1000:].split('\n', 1)[0]
+        assert line.startswith(('Applied', 'Commit', 'Running', 'Add', 'Would', 'Traceback'))
+
+def test_incremental_feed_matches_whole(parser):
+    """Test feeding output in small pieces gives the same events."""
+    whole = summarize(AiderEventParser().feed(TRANSCRIPT, 0))
+    events = []
+    for i in range(0, len(TRANSCRIPT), 7):
+        events += parser.feed(TRANSCRIPT[i:i + 7], i)
+    assert summarize(events) == whole
+
+def test_flush_closes_pending(parser):
+    """Test flush parses the last unterminated line and ends a running command."""
+    assert parser.feed("Running make\nbuilding\nError: missing target", 0) == []
+    events = parser.flush()
+    assert summarize(events) == [('command', {'command': 'make', 'exit_status': None, 'lines': 2})]
+    assert parser.flush() == []
+
+def test_errors_outside_commands(parser):
+    """Test aider errors are reported when no command is running."""
+    events = parser.feed("Did not apply edit to src/app.py\nlitellm.RateLimitError: slow down\n", 0)
+    assert [e['type'] for e in events] == ['error', 'error']
+    assert events[1]['data']['message'] == 'litellm.RateLimitError: slow down'
@@ -13,9 +13,9 @@ def client():
         yield client
 
 @pytest.fixture
-def mock_db():
+def mock_db(tmp_path):
     """Create a temporary test database."""
-    db_path = Path("test_tasks.db")
+    db_path = tmp_path / "test_tasks.db"
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
@@ -34,18 +34,15 @@ def mock_db():
     conn.close()
     
     yield db_path
-    
-    # Cleanup
-    if db_path.exists():
-        db_path.unlink()
 
 def test_index(client):
     """Test the index route."""
     response = client.get('/')
     assert response.status_code == 200
 
+@patch('app.get_change_version')
 @patch('app.load_tasks')
-def test_serve_tasks_json(mock_load_tasks, client):
+def test_serve_tasks_json(mock_load_tasks, mock_get_version, client):
     """Test serving tasks JSON."""
     mock_data = {
         'tasks': [],
@@ -53,10 +50,40 @@ def test_serve_tasks_json(mock_load_tasks, client):
         'repository_url': ''
     }
     mock_load_tasks.return_value = mock_data
+    mock_get_version.return_value = 3
     
     response = client.get('/tasks/tasks.json')
     assert response.status_code == 200
-    assert response.json == mock_data
+    assert response.json == dict(mock_data, version=3, full=True)
+    assert response.headers['ETag'] == '"v3"'
+
+@patch('app.get_change_version')
+@patch('app.load_tasks')
+def test_serve_tasks_json_not_modified(mock_load_tasks, mock_get_version, client):
+    """Test an unchanged version answers If-None-Match with 304."""
+    mock_get_version.return_value = 3
+    response = client.get('/tasks/tasks.json', headers={'If-None-Match': '"v3"'})
+    assert response.status_code == 304
+    mock_load_tasks.assert_not_called()
+
+@patch('app.get_change_version')
+@patch('app.load_tasks')
+@patch('app.load_tasks_since')
+def test_serve_tasks_json_since(mock_load_since, mock_load_tasks, mock_get_version, client):
+    """Test ?since= returns a delta, falling back to a full load."""
+    mock_get_version.return_value = 5
+    mock_load_since.return_value = {'version': 5, 'agents': {'a1': {'id': 'a1', 'status': 'done'}}, 'deleted': []}
+    response = client.get('/tasks/tasks.json?since=4')
+    assert response.json['full'] is False
+    assert response.json['agents'] == {'a1': {'id': 'a1', 'status': 'done'}}
+    mock_load_since.assert_called_once_with(4)
+    mock_load_tasks.assert_not_called()
+
+    mock_load_since.return_value = None
+    mock_load_tasks.return_value = {'tasks': [], 'agents': {}, 'repository_url': ''}
+    response = client.get('/tasks/tasks.json?since=1')
+    assert response.json['full'] is True
+    assert response.json['version'] == 5
 
 @patch('app.load_tasks')
 @patch('app.save_tasks')
@@ -74,13 +101,14 @@ def test_agent_view(mock_save_tasks, mock_load_tasks, client):
     response = client.get('/agents')
     assert response.status_code == 200
 
-@patch('app.initialiseCodingAgent')
-def test_create_agent_success(mock_init_agent, client):
-    """Test successful agent creation."""
+@patch('app.main_loop')
+@patch('app.provisioning_queue')
+def test_create_agent_success(mock_queue, mock_main_loop, client):
+    """Test agent creation queues provisioning jobs and returns straight away."""
     # Setup mocks
     mock_token_manager = MagicMock()
     mock_token_manager.return_value.set_token.return_value = True
-    mock_init_agent.return_value = ['test_agent_id']
+    mock_queue.submit.return_value = ['test_job_id']
     
     # Test data
     test_data = {
@@ -95,12 +123,15 @@ def test_create_agent_success(mock_init_agent, client):
                              headers={'X-GitHub-Token': 'test_token'},
                              json=test_data)
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         assert response.json['success'] is True
-        assert 'test_agent_id' in response.json['agent_ids']
+        assert response.json['job_ids'] == ['test_job_id']
+        args, kwargs = mock_queue.submit.call_args
+        assert args == ('https://github.com/test/repo', 'Test Task\n\nTest Description')
+        assert kwargs['num_agents'] == 1
 
-@patch('app.initialiseCodingAgent')
-def test_create_agent_missing_token(mock_init_agent, client):
+@patch('app.provisioning_queue')
+def test_create_agent_missing_token(mock_queue, client):
     """Test agent creation without GitHub token."""
     test_data = {
         'repo_url': 'https://github.com/test/repo',
@@ -113,7 +144,8 @@ def test_create_agent_missing_token(mock_init_agent, client):
 
 def test_update_model_config(client, mock_db):
     """Test updating model configuration."""
-    with patch('app.DATABASE_PATH', mock_db):
+    from database import get_model_config
+    with patch('app.DATABASE_PATH', mock_db), patch('database.DATABASE_PATH', mock_db):
         test_config = {
             'orchestrator_model': 'test_model1',
             'aider_model': 'test_model2',
@@ -123,6 +155,8 @@ def test_update_model_config(client, mock_db):
         response = client.post('/config/models', json=test_config)
         assert response.status_code == 200
         assert response.json['success'] is True
+        # The cached model config picks up the change immediately
+        assert get_model_config()['aider_model'] == 'test_model2'
 
 def test_get_model_config(client, mock_db):
     """Test getting model configuration."""
@@ -132,6 +166,161 @@ def test_get_model_config(client, mock_db):
         assert response.json['success'] is True
         assert 'config' in response.json
 
+@patch('app.get_agent_history')
+def test_agent_history(mock_get_history, client):
+    """Test paging through agent history."""
+    mock_get_history.return_value = [{'id': 7, 'timestamp': 't', 'content': 'c'}]
+    response = client.get('/agents/agent1/history?kind=thought&limit=1&before=9')
+    assert response.status_code == 200
+    assert response.json['entries'][0]['content'] == 'c'
+    assert response.json['next_before'] == 7
+    mock_get_history.assert_called_once_with('agent1', 'thought', limit=1, before_id=9)
+
+@patch('app.get_agent_history')
+def test_agent_history_limit_is_clamped(mock_get_history, client):
+    """Test limits below 1 fetch one entry instead of failing or returning every row."""
+    mock_get_history.return_value = []
+    for limit in (0, -1):
+        response = client.get(f'/agents/agent1/history?limit={limit}')
+        assert response.status_code == 200
+        assert response.json['next_before'] is None
+        mock_get_history.assert_called_with('agent1', 'progress', limit=1, before_id=None)
+    client.get('/agents/agent1/history?limit=100000')
+    mock_get_history.assert_called_with('agent1', 'progress', limit=500, before_id=None)
+
+def test_agent_history_invalid_kind(client):
+    """Test unknown history kinds are rejected."""
+    response = client.get('/agents/agent1/history?kind=bogus')
+    assert response.status_code == 400
+
+@patch('app.get_agent_events')
+def test_agent_events(mock_get_events, client):
+    """Test paging through an agent's parsed aider events."""
+    mock_get_events.return_value = [{'id': 4, 'type': 'commit', 'offset': 0, 'data': {}}]
+    response = client.get('/agents/agent1/events?type=commit&limit=1')
+    assert response.status_code == 200
+    assert response.json['events'][0]['type'] == 'commit'
+    assert response.json['next_before'] == 4
+    mock_get_events.assert_called_once_with('agent1', 'commit', limit=1, before_id=None)
+
+@patch('app.get_agent_events')
+def test_agent_events_limit_is_clamped(mock_get_events, client):
+    """Test limits below 1 fetch one event instead of failing or returning every row."""
+    mock_get_events.return_value = []
+    for limit in (0, -1):
+        response = client.get(f'/agents/agent1/events?limit={limit}')
+        assert response.status_code == 200
+        assert response.json['next_before'] is None
+        mock_get_events.assert_called_with('agent1', None, limit=1, before_id=None)
+
+def test_agent_events_invalid_type(client):
+    """Test unknown event types are rejected."""
+    response = client.get('/agents/agent1/events?type=bogus')
+    assert response.status_code == 400
+
+@patch('app.get_agent_output')
+@patch('app.get_agent_output_length')
+def test_agent_output_range(mock_length, mock_get_output, client):
+    """Test fetching a range of an agent's transcript."""
+    mock_length.return_value = 100
+    mock_get_output.return_value = 'chunk'
+    response = client.get('/agents/agent1/output?start=10&end=500')
+    assert response.status_code == 200
+    assert response.json['output'] == 'chunk'
+    assert response.json['end'] == 100
+    assert response.json['length'] == 100
+    mock_get_output.assert_called_once_with('agent1', 10, 100)
+
+@patch('app.get_agent_output')
+@patch('app.get_agent_output_length')
+def test_agent_output_start_past_end(mock_length, mock_get_output, client):
+    """Test a start beyond the transcript gives an empty range at its end."""
+    mock_length.return_value = 100
+    mock_get_output.return_value = ''
+    response = client.get('/agents/agent1/output?start=150')
+    assert response.status_code == 200
+    assert (response.json['start'], response.json['end']) == (100, 100)
+    mock_get_output.assert_called_once_with('agent1', 100, 100)
+
+@patch('app.time.sleep')
+def test_events_stream(mock_sleep, client):
+    """Test /events replays events after Last-Event-ID."""
+    from event_bus import event_bus
+    last_id = event_bus.last_id
+    event_bus.publish('state', 'agent1', {'status': 'running'})
+    response = client.get('/events', headers={'Last-Event-ID': str(last_id)}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = (chunk.decode() for chunk in response.response)
+    assert next(chunks).startswith('retry:')
+    chunk = next(chunks)
+    assert f"id: {last_id + 1}" in chunk
+    assert "event: state" in chunk
+    assert '"status": "running"' in chunk
+    response.close()
+
+@patch('app.time.sleep')
+def test_events_stream_resumes_after_coalesced_output(mock_sleep, client):
+    """Test a batch's id covers output merged in after the batch's last event."""
+    from event_bus import event_bus
+    last_id = event_bus.last_id
+    event_bus.publish('output', 'agent1', {'text': 'a'})
+    event_bus.publish('aider_event', 'agent1', {'type': 'question'})
+    event_bus.publish('output', 'agent1', {'text': 'b'})
+    response = client.get('/events', headers={'Last-Event-ID': str(last_id)}, buffered=False)
+    chunks = (chunk.decode() for chunk in response.response)
+    next(chunks)
+    output, aider_event = next(chunks), next(chunks)
+    assert "event: output" in output and '"text": "ab"' in output
+    assert "id:" not in output
+    assert "event: aider_event" in aider_event
+    assert f"id: {last_id + 3}" in aider_event
+    response.close()
+
+@patch('app.time.sleep')
+def test_events_stream_reset(mock_sleep, client):
+    """Test an unknown Last-Event-ID gets a reset event."""
+    from event_bus import event_bus
+    response = client.get('/events', headers={'Last-Event-ID': str(event_bus.last_id + 100)}, buffered=False)
+    chunks = (chunk.decode() for chunk in response.response)
+    next(chunks)
+    assert "event: reset" in next(chunks)
+    response.close()
+
+@patch('app.provisioning_queue')
+def test_get_job(mock_queue, client):
+    """Test polling a provisioning job."""
+    mock_queue.get.return_value = {'id': 'job1', 'status': 'running'}
+    response = client.get('/jobs/job1')
+    assert response.status_code == 200
+    assert response.json['job']['status'] == 'running'
+    
+    mock_queue.get.return_value = None
+    assert client.get('/jobs/missing').status_code == 404
+
+@patch('app.provisioning_queue')
+def test_list_jobs(mock_queue, client):
+    """Test listing provisioning jobs filtered by id."""
+    mock_queue.list_jobs.return_value = [{'id': 'job1'}, {'id': 'job2'}, {'id': 'job3'}]
+    response = client.get('/jobs?ids=job1,job3')
+    assert [job['id'] for job in response.json['jobs']] == ['job1', 'job3']
+
+def test_llm_stats(client):
+    """Test the LLM scheduler stats endpoint."""
+    response = client.get('/llm/stats')
+    assert response.status_code == 200
+    assert response.json['success'] is True
+    assert 'queue_depth' in response.json
+    assert 'models' in response.json
+    assert 'circuits' in response.json
+
+def test_output_filter_stats(client):
+    """Test the output filter stats endpoint."""
+    response = client.get('/output_filter/stats')
+    assert response.status_code == 200
+    assert response.json['success'] is True
+    assert 'banner' in response.json['rules']
+    assert 'collapsed' in response.json
+
 def test_config_view(client):
     """Test the configuration view route."""
     response = client.get('/config')
@@ -164,12 +353,12 @@ def test_delete_agent_not_found(mock_load_tasks, mock_delete_agent, client):
     assert response.json['success'] is False
 
 # Add error case tests
-@patch('app.initialiseCodingAgent')
-def test_create_agent_failure(mock_init_agent, client):
+@patch('app.provisioning_queue')
+def test_create_agent_failure(mock_queue, client):
     """Test agent creation failure."""
     mock_token_manager = MagicMock()
     mock_token_manager.return_value.set_token.return_value = True
-    mock_init_agent.return_value = None
+    mock_queue.submit.side_effect = RuntimeError("Queue unavailable")
     
     test_data = {
         'repo_url': 'https://github.com/test/repo',
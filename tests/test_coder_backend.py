@@ -0,0 +1,162 @@
+import queue
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+import coder_backend
+from coder_backend import CoderSession, CoderWorkerPool, _worker_main
+
+class FakeCoder:
+    """Stand-in for aider's Coder that prints what it was asked to do."""
+
+    def __init__(self, workspace_path):
+        self.workspace_path = workspace_path
+
+    def run(self, instruction):
+        if instruction == 'explode':
+            raise RuntimeError("coder failed")
+        print(f"Applied: {instruction}")
+        return "done"
+
+class FakeProcess:
+    """Runs a worker in a thread so the pool can be tested in-process."""
+
+    def __init__(self, target, args, daemon=True):
+        self._thread = threading.Thread(target=target, args=args, daemon=daemon)
+
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+@pytest.fixture
+def fake_coders(monkeypatch, tmp_path):
+    """Replace Coder creation and keep worker chdir calls inside tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(coder_backend, '_create_coder', lambda workspace, model: FakeCoder(workspace))
+
+@pytest.fixture
+def pool(fake_coders):
+    """Create a worker pool whose workers are threads."""
+    pool = CoderWorkerPool(spare_workers=1)
+    pool._context = MagicMock(Queue=queue.Queue, Process=FakeProcess)
+    yield pool
+    pool.shutdown()
+
+def test_worker_main(fake_coders, tmp_path):
+    """Test the worker creates coders, streams run output and reports completion."""
+    requests, responses = queue.Queue(), queue.Queue()
+    for message in [
+        ('create', 's1', str(tmp_path), 'model'),
+        ('run', 's1', 'add a test'),
+        ('run', 's1', 'explode'),
+        ('run', 'unknown', 'anything'),
+        ('close', 's1'),
+        ('stop',)
+    ]:
+        requests.put(message)
+    _worker_main(requests, responses)
+    
+    messages = []
+    while not responses.empty():
+        messages.append(responses.get())
+    assert messages[0] == ('created', 's1', True, None)
+    output = ''.join(m[2] for m in messages if m[0] == 'output')
+    assert 'Applied: add a test' in output
+    done = [m for m in messages if m[0] == 'done']
+    assert done[0] == ('done', 's1', True, None)
+    assert done[1] == ('done', 's1', False, 'coder failed')
+    assert done[2][:3] == ('done', 'unknown', False)
+
+@patch('database.get_model_config', return_value={'aider_model': 'test-model'})
+def test_coder_session_runs_instruction(mock_get_model_config, pool, tmp_path):
+    """Test a session is ready exactly when coder.run() returns."""
+    session = CoderSession(str(tmp_path), "Test task", pool=pool)
+    assert session.start() is True
+    assert session.is_alive()
+    assert session.send_message("add a test", "instruct") is True
+    assert session.wait_until_ready(timeout=5) is True
+    output = session.get_output()
+    assert "Agent&nbsp;Action:&nbsp;instruct" in output
+    assert "Applied: add a test" in output
+
+@patch('database.get_model_config', return_value=None)
+def test_coder_session_reports_errors(mock_get_model_config, pool, tmp_path):
+    """Test a failing instruction ends the turn and is shown in the output."""
+    session = CoderSession(str(tmp_path), "Test task", pool=pool)
+    assert session.start() is True
+    session.send_message("explode", "instruct")
+    assert session.wait_until_ready(timeout=5) is True
+    assert "coder&nbsp;failed" in session.get_output()
+
+def test_coder_session_busy_until_finished(tmp_path):
+    """Test wait_until_ready times out while an instruction is running."""
+    fake_pool = MagicMock()
+    fake_pool.create.return_value = True
+    fake_pool.run.return_value = True
+    with patch('database.get_model_config', return_value=None):
+        session = CoderSession(str(tmp_path), "Test task", pool=fake_pool)
+        assert session.start() is True
+    session.send_message("slow", "instruct")
+    assert session.wait_until_ready(timeout=0.01) is False
+    session._run_finished(True)
+    assert session.wait_until_ready(timeout=0.01) is True
+
+def test_coder_session_cleanup(tmp_path):
+    """Test cleanup releases the coder and wakes waiters."""
+    fake_pool = MagicMock()
+    session = CoderSession(str(tmp_path), "Test task", pool=fake_pool)
+    session._busy = True
+    session.cleanup()
+    assert session.wait_until_ready(timeout=1) is False
+    fake_pool.close.assert_called_once_with(session.session_id)
+    assert not session.is_alive()
+
+@patch('database.get_model_config', return_value=None)
+def test_pool_create_failure(mock_get_model_config, pool, tmp_path, monkeypatch):
+    """Test a coder that cannot be built fails the session start."""
+    def fail(workspace, model):
+        raise RuntimeError("no model")
+    monkeypatch.setattr(coder_backend, '_create_coder', fail)
+    session = CoderSession(str(tmp_path), "Test task", pool=pool)
+    assert session.start() is False
+    assert pool.run(session.session_id, "anything") is False
+
+@patch('database.get_model_config', return_value=None)
+def test_pool_gives_each_session_its_own_worker(mock_get_model_config, pool, tmp_path, monkeypatch):
+    """Test a coder is created while another session's instruction runs, and spares shrink back."""
+    release = threading.Event()
+
+    class SlowCoder(FakeCoder):
+        def run(self, instruction):
+            release.wait(5)
+            return super().run(instruction)
+    monkeypatch.setattr(coder_backend, '_create_coder', lambda workspace, model: SlowCoder(workspace))
+    first = CoderSession(str(tmp_path), "Task one", pool=pool)
+    assert first.start() is True
+    first.send_message("slow", "instruct")
+
+    second = CoderSession(str(tmp_path), "Task two", pool=pool)
+    assert pool.create(second, str(tmp_path), 'model', timeout=2) is True
+    assert pool.worker_count() == 3  # One per session plus a warm spare
+    release.set()
+    assert first.wait_until_ready(timeout=5) is True
+
+    pool.close(first.session_id)
+    pool.close(second.session_id)
+    assert pool.worker_count() == 1
+
+@patch('database.get_model_config', return_value=None)
+def test_pool_worker_limit(mock_get_model_config, pool, tmp_path):
+    """Test the pool stops starting processes at max_workers."""
+    pool.max_workers = 2
+    sessions = [CoderSession(str(tmp_path), f"Task {i}", pool=pool) for i in range(3)]
+    assert sessions[0].start() is True
+    assert sessions[1].start() is True
+    assert sessions[2].start() is False
+    assert pool.worker_count() == 2
+    pool.close(sessions[0].session_id)
+    assert sessions[2].start() is True
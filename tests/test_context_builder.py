@@ -0,0 +1,139 @@
+import re
+import pytest
+from unittest.mock import MagicMock, patch
+from context_builder import ContextBuilder, TokenCounter, estimate_tokens, trim_middle
+from output_buffer import OutputRingBuffer
+from prompt_processor import AgentResponse
+
+@pytest.fixture
+def session():
+    """Create a fake session backed by a real output buffer."""
+    session = MagicMock()
+    session.output_buffer = OutputRingBuffer()
+    session.read_since.side_effect = session.output_buffer.read_since
+    return session
+
+@pytest.fixture
+def builder():
+    return ContextBuilder(token_budget=200, summary_turns=3)
+
+def make_history(count):
+    return [
+        AgentResponse(
+            progress=f'Progress {i}',
+            thought=f'Thought {i}',
+            action=f'/run step {i}',
+            future=f'Future {i}'
+        ) for i in range(count)
+    ]
+
+def test_estimate_tokens():
+    """Test the token estimate."""
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('a' * 40) == 11
+
+def test_first_turn_without_output(builder, session):
+    """Test the first turn falls back to the aider started marker."""
+    message, offset = builder.build('agent1', session, [])
+    assert message == '*aider started*'
+    assert offset == 0
+
+def test_only_new_output_is_sent(builder, session):
+    """Test committed output is not resent on the next turn."""
+    session.output_buffer.write('old output\n')
+    message, offset = builder.build('agent1', session, [])
+    assert 'old output' in message
+    builder.commit('agent1', offset)
+
+    session.output_buffer.write('new output\n')
+    message, _ = builder.build('agent1', session, make_history(1))
+    assert 'new output' in message
+    assert 'old output' not in message
+    assert '/run step 0 -> Progress 0' in message
+
+def test_uncommitted_output_is_resent(builder, session):
+    """Test output is resent when the previous decision failed."""
+    session.output_buffer.write('pending output\n')
+    builder.build('agent1', session, [])
+    message, _ = builder.build('agent1', session, [])
+    assert 'pending output' in message
+
+def test_no_new_output(builder, session):
+    """Test a turn with history but no new output."""
+    session.output_buffer.write('output\n')
+    _, offset = builder.build('agent1', session, [])
+    builder.commit('agent1', offset)
+    message, _ = builder.build('agent1', session, make_history(1))
+    assert 'No new aider output' in message
+
+def test_summary_is_rolling(builder, session):
+    """Test only the most recent turns are listed in the summary."""
+    session.output_buffer.write('output\n')
+    message, _ = builder.build('agent1', session, make_history(5))
+    assert '(2 earlier turns omitted)' in message
+    assert 'Progress 1' not in message
+    assert 'Progress 4' in message
+
+def test_delta_kept_under_budget(builder, session):
+    """Test large deltas keep their head and tail within the token budget."""
+    session.output_buffer.write('START' + 'x' * 5000 + 'END')
+    message, _ = builder.build('agent1', session, [])
+    assert 'START' in message
+    assert message.endswith('END')
+    assert 'characters omitted' in message
+    assert estimate_tokens(message) <= builder.token_budget + 50
+
+def test_output_token_budget(session):
+    """Test new output is capped by the output budget even when the total allows more."""
+    builder = ContextBuilder(token_budget=10000, output_token_budget=100)
+    session.output_buffer.write(''.join(f'line {i}\n' for i in range(2000)))
+    message, _ = builder.build('agent1', session, [])
+    assert 'line 0\n' in message
+    assert message.endswith('line 1999\n')
+    assert estimate_tokens(message) <= 150
+
+def test_trim_middle_keeps_text_that_fits():
+    """Test text within budget is returned unchanged, even when chunked."""
+    text = 'y' * 10000
+    assert trim_middle(text, 10000, TokenCounter(), start_offset=123) is text
+
+def test_trim_middle_head_and_tail():
+    """Test the head share and the tail are kept on line boundaries."""
+    text = ''.join(f'line {i:05d}\n' for i in range(10000))
+    trimmed = trim_middle(text, 1000, TokenCounter(), head_share=0.5)
+    head, omitted, tail = re.fullmatch(r'(.*)\n\[\.\.\. (\d+) characters omitted \.\.\.\]\n(.*)', trimmed, re.S).groups()
+    assert head.startswith('line 00000\n') and head.endswith('\n')
+    assert tail.startswith('line ') and tail.endswith('line 09999\n')
+    assert int(omitted) == len(text) - len(head) - len(tail)
+    assert abs(estimate_tokens(head) - estimate_tokens(tail)) < 100
+
+@patch('context_builder.litellm.token_counter')
+def test_token_counter_caches_chunks(mock_token_counter):
+    """Test the model tokenizer is used and its counts are cached."""
+    mock_token_counter.side_effect = lambda model, text: len(text) // 2
+    counter = TokenCounter()
+    text = 'z' * 20000
+    first = trim_middle(text, 1000, counter, model='test-model')
+    calls = mock_token_counter.call_count
+    assert trim_middle(text, 1000, counter, model='test-model') == first
+    # Cut pieces are recounted; whole chunks come from the cache
+    assert mock_token_counter.call_count - calls < calls
+    assert counter.hits > 0
+    assert 'characters omitted' in first
+    assert len(first) < 2100
+
+@patch('context_builder.litellm.token_counter', side_effect=Exception('no tokenizer'))
+def test_token_counter_falls_back(mock_token_counter):
+    """Test a failing tokenizer falls back to the estimate."""
+    assert TokenCounter().count('a' * 40, 'unknown-model') == estimate_tokens('a' * 40)
+    assert TokenCounter().count('a' * 40) == estimate_tokens('a' * 40)
+    assert mock_token_counter.call_count == 1
+
+def test_reset(builder, session):
+    """Test resetting an agent starts from the beginning again."""
+    session.output_buffer.write('output\n')
+    _, offset = builder.build('agent1', session, [])
+    builder.commit('agent1', offset)
+    builder.reset('agent1')
+    message, _ = builder.build('agent1', session, [])
+    assert 'output' in message
@@ -3,10 +3,17 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime
 import json
+import threading
 from database import (
     init_db, save_agent, get_agent, get_all_agents,
     delete_agent, save_task, get_all_tasks,
-    get_config, save_config, get_model_config
+    get_config, save_config, get_model_config,
+    save_model_config, invalidate_model_config_cache,
+    get_connection, close_all_connections,
+    append_agent_history, get_agent_history, append_agent_events, get_agent_events,
+    save_agents, AgentRecord,
+    append_agent_output, get_agent_output, get_agent_output_length, get_agent_fields,
+    get_change_version, get_changes_since
 )
 
 @pytest.fixture
@@ -83,8 +90,43 @@ def test_save_and_get_agent(initialized_db, sample_agent_data):
     assert agent['repo_path'] == sample_agent_data['repo_path']
     assert agent['task'] == sample_agent_data['task']
     assert agent['status'] == sample_agent_data['status']
-    assert agent['progress_history'] == sample_agent_data['progress_history']
-    assert agent['thought_history'] == sample_agent_data['thought_history']
+    # History is appended separately and starts empty
+    assert agent['progress_history'] == []
+    assert agent['thought_history'] == []
+
+def test_get_agent_row_only(initialized_db, sample_agent_data):
+    """Test a light fetch returns the agent columns without output, history or events."""
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_output("test_agent_1", "hello")
+    agent = get_agent("test_agent_1", full=False)
+    assert agent['task'] == sample_agent_data['task']
+    assert 'aider_output' not in agent
+    assert 'progress_history' not in agent
+    assert 'events' not in agent
+    agent['status'] = 'completed'
+    assert save_agent("test_agent_1", agent) is True
+    full = get_agent("test_agent_1")
+    assert full['status'] == 'completed'
+    assert full['aider_output'] == "hello"
+
+def test_get_agent_fields(initialized_db, sample_agent_data):
+    """Test deltas read only the changed fields and never the output tail."""
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_output("test_agent_1", "hello")
+    append_agent_history("test_agent_1", "progress", "step one")
+    fields = get_agent_fields("test_agent_1", ['status', 'progress_history', 'aider_output'])
+    assert fields == {
+        'id': "test_agent_1",
+        'status': sample_agent_data['status'],
+        'progress_history': [fields['progress_history'][0]],
+        'aider_output_length': 5
+    }
+    assert fields['progress_history'][0]['content'] == "step one"
+    everything = get_agent_fields("test_agent_1", ['*'])
+    assert everything['task'] == sample_agent_data['task']
+    assert 'events' in everything and 'thought_history' in everything
+    assert 'aider_output' not in everything
+    assert get_agent_fields("missing", ['status']) is None
 
 def test_save_agent_error(initialized_db, sample_agent_data, monkeypatch):
     """Test saving agent with database error."""
@@ -222,4 +264,322 @@ def test_get_model_config_error(initialized_db, monkeypatch):
         raise sqlite3.Error("Mock DB Error")
     
     monkeypatch.setattr(sqlite3, "connect", mock_connect)
-    assert get_model_config() is None
\ No newline at end of file
+    assert get_model_config() is None
+
+def test_get_model_config_cached(initialized_db, monkeypatch):
+    """Test repeated lookups are served from memory."""
+    assert get_model_config() is not None
+    
+    def mock_connect(*args, **kwargs):
+        raise sqlite3.Error("Mock DB Error")
+    
+    monkeypatch.setattr(sqlite3, "connect", mock_connect)
+    config = get_model_config()
+    assert config['aider_model'] == 'openrouter/google/gemini-flash-1.5'
+    
+    # Callers can't corrupt the cached copy
+    config['aider_model'] = 'changed'
+    assert get_model_config()['aider_model'] == 'openrouter/google/gemini-flash-1.5'
+
+def test_save_model_config_invalidates_cache(initialized_db):
+    """Test saving a new model config takes effect immediately."""
+    assert get_model_config()['agent_model'] == 'openrouter/google/gemini-flash-1.5'
+    assert save_model_config('model-a', 'model-b', 'model-c') is True
+    config = get_model_config()
+    assert config['orchestrator_model'] == 'model-a'
+    assert config['aider_model'] == 'model-b'
+    assert config['agent_model'] == 'model-c'
+
+def test_invalidate_model_config_cache(initialized_db):
+    """Test external writes are picked up after invalidation."""
+    get_model_config()
+    with sqlite3.connect(initialized_db) as conn:
+        conn.execute("UPDATE model_config SET aider_model = 'external'")
+    assert get_model_config()['aider_model'] != 'external'
+    invalidate_model_config_cache()
+    assert get_model_config()['aider_model'] == 'external'
+
+def test_save_model_config_error(initialized_db, monkeypatch):
+    """Test saving model config with database error."""
+    def mock_connect(*args, **kwargs):
+        raise sqlite3.Error("Mock DB Error")
+    
+    monkeypatch.setattr(sqlite3, "connect", mock_connect)
+    assert save_model_config('a', 'b', 'c') is False
+
+
+def test_connection_pool_reuses_connections(initialized_db):
+    """Test connections are handed back to the pool and reused."""
+    with get_connection() as first:
+        pass
+    with get_connection() as second:
+        assert second is first
+    close_all_connections()
+    with get_connection() as third:
+        assert third is not first
+
+def test_connection_uses_wal(initialized_db):
+    """Test pooled connections use WAL journaling and NORMAL sync."""
+    with get_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+def test_connection_rolls_back_on_error(initialized_db):
+    """Test a failing block leaves no partial writes behind."""
+    with pytest.raises(ValueError):
+        with get_connection() as conn:
+            conn.execute("INSERT INTO config (key, value) VALUES ('k', 'v')")
+            raise ValueError("boom")
+    assert get_config('k') is None
+
+def test_read_during_write(initialized_db):
+    """Test readers are not blocked by an open write transaction."""
+    save_task({'title': 'Existing', 'description': 'Task'})
+    writing = threading.Event()
+    done = threading.Event()
+
+    def writer():
+        with get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO tasks (title, description, created_at) VALUES ('New', 'Task', 'now')"
+            )
+            writing.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert writing.wait(5)
+    try:
+        # Sees the last committed state without waiting for the writer
+        assert [t['title'] for t in get_all_tasks()] == ['Existing']
+    finally:
+        done.set()
+        thread.join(5)
+    assert len(get_all_tasks()) == 2
+
+
+def test_append_agent_history(initialized_db, sample_agent_data):
+    """Test history entries are appended and embedded in agent records."""
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_history("test_agent_1", "progress", "Started task", "2024-01-01T00:00:00")
+    append_agent_history("test_agent_1", "thought", "Initial thought")
+    append_agent_history("test_agent_1", "progress", "Wrote tests")
+    
+    # Saving the agent again leaves the history alone
+    save_agent("test_agent_1", sample_agent_data)
+    agent = get_agent("test_agent_1")
+    assert [e['content'] for e in agent['progress_history']] == ["Started task", "Wrote tests"]
+    assert agent['progress_history'][0]['timestamp'] == "2024-01-01T00:00:00"
+    assert [e['content'] for e in agent['thought_history']] == ["Initial thought"]
+    assert get_all_agents()["test_agent_1"]['progress_history'] == agent['progress_history']
+
+def test_get_agent_history_paging(initialized_db):
+    """Test reading history a page at a time, newest page first."""
+    for i in range(5):
+        append_agent_history("test_agent_1", "progress", f"Step {i}")
+    page = get_agent_history("test_agent_1", "progress", limit=2)
+    assert [e['content'] for e in page] == ["Step 3", "Step 4"]
+    page = get_agent_history("test_agent_1", "progress", limit=2, before_id=page[0]['id'])
+    assert [e['content'] for e in page] == ["Step 1", "Step 2"]
+    page = get_agent_history("test_agent_1", "progress", limit=2, before_id=page[0]['id'])
+    assert [e['content'] for e in page] == ["Step 0"]
+
+def test_agent_events(initialized_db, sample_agent_data):
+    """Test aider events are stored, paged by type and summarized on agent records."""
+    save_agent("test_agent_1", sample_agent_data)
+    version = get_change_version()
+    last_id = append_agent_events("test_agent_1", [
+        {'type': 'file_edited', 'offset': 0, 'timestamp': '2024-01-01T00:00:00', 'data': {'path': 'a.py'}},
+        {'type': 'commit', 'offset': 21, 'data': {'hash': 'abc1234', 'message': 'Fix'}},
+        {'type': 'file_edited', 'offset': 40, 'data': {'path': 'b.py'}}
+    ])
+    assert last_id is not None
+    assert get_changes_since(version)['agents']["test_agent_1"]['fields'] == ['events']
+
+    events = get_agent_events("test_agent_1")
+    assert [e['type'] for e in events] == ['file_edited', 'commit', 'file_edited']
+    assert events[0]['timestamp'] == '2024-01-01T00:00:00'
+    assert events[1]['offset'] == 21
+    edits = get_agent_events("test_agent_1", 'file_edited', limit=1)
+    assert [e['data']['path'] for e in edits] == ['b.py']
+    edits = get_agent_events("test_agent_1", 'file_edited', limit=1, before_id=edits[0]['id'])
+    assert [e['data']['path'] for e in edits] == ['a.py']
+
+    agent = get_agent("test_agent_1")
+    assert agent['events']['counts'] == {'file_edited': 2, 'commit': 1}
+    assert agent['events']['recent'][-1]['data'] == {'path': 'b.py'}
+    assert append_agent_events("test_agent_1", []) is None
+
+def test_delete_agent_removes_history(initialized_db, sample_agent_data):
+    """Test deleting an agent also deletes its history and events."""
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_history("test_agent_1", "progress", "Started task")
+    append_agent_events("test_agent_1", [{'type': 'error', 'offset': 0, 'data': {'message': 'x'}}])
+    assert delete_agent("test_agent_1") is True
+    assert get_agent_history("test_agent_1", "progress") == []
+    assert get_agent_events("test_agent_1") == []
+
+def test_init_db_migrates_history_blobs(initialized_db, sample_agent_data):
+    """Test JSON history columns from older databases are moved to agent_history."""
+    save_agent("test_agent_1", sample_agent_data)
+    with sqlite3.connect(initialized_db) as conn:
+        conn.execute(
+            "UPDATE agents SET progress_history = ?, thought_history = ? WHERE id = ?",
+            (json.dumps([{'timestamp': 't1', 'content': 'Old progress'}]), json.dumps(['Old thought']), "test_agent_1")
+        )
+    init_db()
+    agent = get_agent("test_agent_1")
+    assert [e['content'] for e in agent['progress_history']] == ['Old progress']
+    assert agent['progress_history'][0]['timestamp'] == 't1'
+    assert [e['content'] for e in agent['thought_history']] == ['Old thought']
+    # Migrating twice does not duplicate entries
+    init_db()
+    assert len(get_agent("test_agent_1")['progress_history']) == 1
+
+
+def test_agent_record_dirty_tracking():
+    """Test AgentRecord only marks keys whose value changed."""
+    record = AgentRecord({'status': 'pending', 'progress': ''})
+    assert record.dirty_columns() == []
+    record['status'] = 'pending'
+    record.setdefault('progress', 'ignored')
+    assert record.dirty_columns() == []
+    record['status'] = 'running'
+    record.update(thought='Thinking', unknown_key='x')
+    assert record.dirty_columns() == ['status', 'thought']
+    record.mark_clean()
+    assert record.dirty_columns() == []
+
+def test_save_agent_writes_only_dirty_columns(initialized_db, sample_agent_data):
+    """Test saving a loaded agent leaves unchanged columns alone."""
+    save_agent("test_agent_1", sample_agent_data)
+    agent = get_agent("test_agent_1")
+    assert isinstance(agent, AgentRecord)
+    
+    # Another writer changes the agent behind our back
+    with sqlite3.connect(initialized_db) as conn:
+        conn.execute("UPDATE agents SET pr_url = 'https://example.com/pr/1' WHERE id = 'test_agent_1'")
+    
+    agent['status'] = 'completed'
+    assert save_agent("test_agent_1", agent) is True
+    assert agent.dirty_columns() == []
+    saved = get_agent("test_agent_1")
+    assert saved['status'] == 'completed'
+    assert saved['pr_url'] == 'https://example.com/pr/1'
+
+def test_save_agent_does_not_resurrect_deleted(initialized_db, sample_agent_data):
+    """Test saving a stale record of a deleted agent does not re-create it."""
+    save_agent("test_agent_1", sample_agent_data)
+    agent = get_agent("test_agent_1")
+    delete_agent("test_agent_1")
+    agent['status'] = 'completed'
+    assert save_agent("test_agent_1", agent) is True
+    assert get_agent("test_agent_1") is None
+
+def test_save_agents_batch(initialized_db, sample_agent_data):
+    """Test saving new and loaded agents together."""
+    save_agent("test_agent_1", sample_agent_data)
+    agents = get_all_agents()
+    agents["test_agent_1"]['progress'] = 'Halfway'
+    agents["test_agent_2"] = dict(sample_agent_data, task='Second task')
+    assert save_agents(agents) is True
+    saved = get_all_agents()
+    assert saved["test_agent_1"]['progress'] == 'Halfway'
+    assert saved["test_agent_2"]['task'] == 'Second task'
+
+
+def test_append_and_read_agent_output(initialized_db, sample_agent_data):
+    """Test transcripts are appended in chunks and readable by range."""
+    save_agent("test_agent_1", sample_agent_data)
+    assert append_agent_output("test_agent_1", "hello ") == 6
+    assert append_agent_output("test_agent_1", "") == 6
+    assert append_agent_output("test_agent_1", "aider world") == 17
+    
+    assert get_agent_output_length("test_agent_1") == 17
+    assert get_agent_output("test_agent_1") == "hello aider world"
+    assert get_agent_output("test_agent_1", 3, 9) == "lo aid"
+    assert get_agent_output("test_agent_1", 6) == "aider world"
+    assert get_agent_output("test_agent_1", 17) == ""
+    assert get_agent_output("missing_agent") == ""
+    
+    agent = get_agent("test_agent_1")
+    assert agent['aider_output'] == "hello aider world"
+    assert agent['aider_output_length'] == 17
+
+def test_agent_record_embeds_output_tail(initialized_db, sample_agent_data, monkeypatch):
+    """Test agent records only carry the end of long transcripts."""
+    import database
+    monkeypatch.setattr(database, "OUTPUT_TAIL_LENGTH", 5)
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_output("test_agent_1", "abcdefgh")
+    append_agent_output("test_agent_1", "ij")
+    assert get_agent("test_agent_1")['aider_output'] == "fghij"
+
+def test_delete_agent_removes_output(initialized_db, sample_agent_data):
+    """Test deleting an agent also deletes its transcript."""
+    save_agent("test_agent_1", sample_agent_data)
+    append_agent_output("test_agent_1", "output")
+    delete_agent("test_agent_1")
+    assert get_agent_output_length("test_agent_1") == 0
+
+def test_init_db_migrates_output_column(initialized_db, sample_agent_data):
+    """Test transcripts in the old aider_output column are moved to agent_output."""
+    save_agent("test_agent_1", sample_agent_data)
+    with sqlite3.connect(initialized_db) as conn:
+        conn.execute("UPDATE agents SET aider_output = 'old transcript' WHERE id = 'test_agent_1'")
+    init_db()
+    init_db()
+    assert get_agent_output("test_agent_1") == "old transcript"
+
+
+def test_change_version_increases(initialized_db, sample_agent_data):
+    """Test every write bumps the change version and no-op saves do not."""
+    assert get_change_version() == 0
+    save_agent("test_agent_1", sample_agent_data)
+    v1 = get_change_version()
+    assert v1 > 0
+    agent = get_agent("test_agent_1")
+    save_agent("test_agent_1", agent)
+    assert get_change_version() == v1
+    save_config('repository_url', 'https://github.com/test/repo')
+    v2 = get_change_version()
+    save_config('repository_url', 'https://github.com/test/repo')
+    assert get_change_version() == v2 > v1
+
+def test_get_changes_since(initialized_db, sample_agent_data):
+    """Test summarizing changed fields, appended output and deletions."""
+    save_agent("test_agent_1", sample_agent_data)
+    save_agent("test_agent_2", sample_agent_data)
+    append_agent_output("test_agent_1", "first ")
+    since = get_change_version()
+    
+    agent = get_agent("test_agent_1")
+    agent['status'] = 'completed'
+    save_agent("test_agent_1", agent)
+    append_agent_output("test_agent_1", "second ")
+    append_agent_output("test_agent_1", "third")
+    append_agent_history("test_agent_1", "thought", "Done")
+    delete_agent("test_agent_2")
+    save_task({'title': 'New task', 'description': ''})
+    
+    changes = get_changes_since(since)
+    assert changes['version'] == get_change_version()
+    assert changes['agents'] == {
+        "test_agent_1": {'fields': ['status', 'aider_output', 'thought_history'], 'output_start': 6}
+    }
+    assert changes['deleted'] == ["test_agent_2"]
+    assert changes['tasks'] is True
+    
+    assert get_changes_since(changes['version'])['agents'] == {}
+    assert get_changes_since(changes['version'] + 1) is None
+
+def test_get_changes_since_pruned(initialized_db, sample_agent_data, monkeypatch):
+    """Test versions older than the retained change log need a full reload."""
+    import database
+    monkeypatch.setattr(database, "CHANGE_LOG_RETENTION", 10)
+    save_agent("test_agent_1", sample_agent_data)
+    for i in range(500):
+        append_agent_output("test_agent_1", "x")
+    assert get_changes_since(0) is None
+    assert get_changes_since(get_change_version() - 5) is not None
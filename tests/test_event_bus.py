@@ -0,0 +1,54 @@
+import threading
+import time
+from event_bus import EventBus, coalesce
+
+def test_publish_and_events_since():
+    """Test events are returned after the given id with the agent id attached."""
+    bus = EventBus()
+    first = bus.publish('state', 'agent1', {'status': 'running'})
+    bus.publish('deleted', 'agent2')
+    events = bus.events_since(first, timeout=0)
+    assert [e['event'] for e in events] == ['deleted']
+    assert events[0]['data'] == {'agent_id': 'agent2'}
+    assert bus.last_id == 2
+
+def test_events_since_timeout():
+    """Test waiting with nothing new returns an empty list."""
+    bus = EventBus()
+    bus.publish('state', 'agent1', {})
+    assert bus.events_since(bus.last_id, timeout=0.01) == []
+
+def test_events_since_wakes_on_publish():
+    """Test a waiting reader wakes up as soon as an event is published."""
+    bus = EventBus()
+    threading.Timer(0.05, bus.publish, args=('output', 'agent1', {'text': 'hi'})).start()
+    start = time.monotonic()
+    events = bus.events_since(0, timeout=5)
+    assert time.monotonic() - start < 1
+    assert events[0]['data']['text'] == 'hi'
+
+def test_events_since_needs_resync():
+    """Test evicted or unknown ids ask the client to resync."""
+    bus = EventBus(history_size=3)
+    for i in range(5):
+        bus.publish('output', 'agent1', {'text': str(i)})
+    assert bus.events_since(0, timeout=0) is None
+    assert bus.events_since(99, timeout=0) is None
+    assert bus.events_since(2, timeout=0)[0]['data']['text'] == '234'
+
+def test_coalesce():
+    """Test output is joined at its first id and state merged per agent."""
+    bus = EventBus()
+    bus.publish('output', 'agent1', {'text': 'a'})
+    bus.publish('state', 'agent1', {'status': 'running', 'thought': 'x'})
+    bus.publish('output', 'agent2', {'text': 'b'})
+    bus.publish('output', 'agent1', {'text': 'c'})
+    bus.publish('state', 'agent1', {'thought': 'y'})
+    events = bus.events_since(0, timeout=0)
+    assert [(e['id'], e['event'], e['data']['agent_id']) for e in events] == [
+        (1, 'output', 'agent1'), (3, 'output', 'agent2'), (5, 'state', 'agent1')
+    ]
+    assert events[0]['data']['text'] == 'ac'
+    assert events[0]['last_id'] == 4
+    assert events[2]['data'] == {'agent_id': 'agent1', 'status': 'running', 'thought': 'y'}
+    assert coalesce([]) == []
@@ -0,0 +1,116 @@
+import os
+import sys
+import subprocess
+import threading
+import time
+import pytest
+from io_reactor import IOReactor
+
+pytestmark = pytest.mark.skipif(not IOReactor.supported, reason="IOReactor needs selectable pipes")
+
+class Collector:
+    def __init__(self):
+        self.chunks = []
+        self.closed = threading.Event()
+        self._lock = threading.Lock()
+
+    def on_data(self, text):
+        with self._lock:
+            self.chunks.append(text)
+
+    def on_close(self):
+        self.closed.set()
+
+    def text(self):
+        with self._lock:
+            return ''.join(self.chunks)
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def reactor():
+    reactor = IOReactor(partial_line_delay=0.05)
+    yield reactor
+    reactor.shutdown()
+
+def test_reads_lines_and_eof(reactor):
+    """Test complete lines are delivered and on_close fires at EOF."""
+    r, w = os.pipe()
+    collector = Collector()
+    with os.fdopen(r, 'rb') as pipe:
+        reactor.register(pipe, collector.on_data, collector.on_close)
+        os.write(w, b"first\r\nsecond\n")
+        os.close(w)
+        assert collector.closed.wait(5)
+    assert collector.text() == "first\nsecond\n"
+    assert reactor.stream_count() == 0
+
+def test_partial_line_held_then_flushed(reactor):
+    """Test an unterminated line is joined with its rest or flushed after the delay."""
+    r, w = os.pipe()
+    collector = Collector()
+    with os.fdopen(r, 'rb') as pipe:
+        reactor.register(pipe, collector.on_data)
+        os.write(w, b"Aider v0.")
+        os.write(w, b"50\n")
+        assert wait_for(lambda: collector.text() == "Aider v0.50\n")
+        os.write(w, b"> ")
+        assert wait_for(lambda: collector.text().endswith("> "))
+        assert "Aider v0.50\n" in collector.chunks
+        reactor.unregister(pipe)
+    os.close(w)
+
+def test_multibyte_split_across_reads():
+    """Test UTF-8 sequences split between reads decode correctly."""
+    reactor = IOReactor(chunk_size=1)
+    r, w = os.pipe()
+    collector = Collector()
+    try:
+        with os.fdopen(r, 'rb') as pipe:
+            reactor.register(pipe, collector.on_data, collector.on_close)
+            os.write(w, "héllo ✓\n".encode('utf-8'))
+            os.close(w)
+            assert collector.closed.wait(5)
+        assert collector.text() == "héllo ✓\n"
+    finally:
+        reactor.shutdown()
+
+def test_many_processes_single_thread(reactor):
+    """Test output from many subprocesses is read without extra threads."""
+    threads_before = threading.active_count()
+    processes, collectors = [], []
+    for i in range(20):
+        process = subprocess.Popen(
+            [sys.executable, '-c', f"print('agent {i}'); print('x' * 100000)"],
+            stdout=subprocess.PIPE
+        )
+        collector = Collector()
+        reactor.register(process.stdout, collector.on_data, collector.on_close)
+        processes.append(process)
+        collectors.append(collector)
+    # Only the reactor thread itself is added
+    assert threading.active_count() <= threads_before + 1
+    for i, (process, collector) in enumerate(zip(processes, collectors)):
+        assert collector.closed.wait(10)
+        process.wait()
+        process.stdout.close()
+        assert collector.text() == f"agent {i}\n" + 'x' * 100000 + "\n"
+
+def test_shutdown_stops_thread():
+    """Test shutdown stops the reactor thread and rejects new pipes."""
+    reactor = IOReactor()
+    r, w = os.pipe()
+    with os.fdopen(r, 'rb') as pipe:
+        reactor.register(pipe, lambda text: None)
+        thread = reactor._thread
+        reactor.shutdown()
+        assert not thread.is_alive()
+        with pytest.raises(RuntimeError):
+            reactor.register(pipe, lambda text: None)
+    os.close(w)
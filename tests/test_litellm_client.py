@@ -1,9 +1,15 @@
 import pytest
 import json
 import os
+import threading
+import time
 from unittest.mock import patch, MagicMock
 from pathlib import Path
-from litellm_client import LiteLLMClient
+from litellm_client import (
+    LiteLLMClient, LLMScheduler, TokenBucket, JsonFieldStream, build_messages, prompt_cache_usage,
+    load_rate_limits
+)
+from llm_retry import CircuitBreaker, RetryPolicy
 
 @pytest.fixture
 def mock_env_file(tmp_path):
@@ -162,3 +168,338 @@ def test_chat_completion_with_non_json_response(mock_get_config, mock_completion
         assert "error" in error_response
     except json.JSONDecodeError:
         pytest.fail("Result should be valid JSON")
+
+
+def test_token_bucket_wait_time():
+    """Test the bucket reports how long until capacity is available."""
+    bucket = TokenBucket(per_minute=60)
+    now = time.monotonic()
+    assert bucket.time_until(60, now) == 0
+    bucket.consume(60, now)
+    assert bucket.time_until(1, now) == pytest.approx(1.0, abs=0.05)
+    # Requests larger than the bucket only wait for a full bucket
+    assert bucket.time_until(1000, now) == pytest.approx(60.0, abs=0.1)
+
+def test_token_bucket_adjust():
+    """Test settling a reservation refunds or charges the difference."""
+    bucket = TokenBucket(per_minute=600)
+    now = time.monotonic()
+    bucket.consume(500, now)
+    bucket.adjust(400)
+    assert bucket.time_until(500, time.monotonic()) == 0
+    bucket.adjust(-1000)
+    assert bucket.time_until(1, time.monotonic()) > 0
+
+def test_scheduler_without_limits():
+    """Test models without limits pass straight through."""
+    scheduler = LLMScheduler()
+    assert scheduler.acquire('test-model', 100) < 0.1
+    stats = scheduler.get_stats()['test-model']
+    assert stats['requests'] == 1
+    assert stats['queue_depth'] == 0
+
+def test_scheduler_enforces_request_rate():
+    """Test requests beyond the per-minute budget are paced."""
+    scheduler = LLMScheduler()
+    scheduler.set_limits('test-model', rpm=600)  # one request per 0.1s once drained
+    scheduler._get_buckets('test-model')['requests'].level = 1
+    scheduler.acquire('test-model')
+    start = time.monotonic()
+    scheduler.acquire('test-model')
+    assert time.monotonic() - start >= 0.08
+    assert scheduler.get_stats()['test-model']['max_wait'] >= 0.08
+
+def test_scheduler_keeps_budgets_when_limits_reload():
+    """Test reloading limits only rebuilds buckets whose rpm/tpm changed."""
+    scheduler = LLMScheduler()
+    scheduler.load_limits({'*': {'rpm': 60, 'tpm': 1000}, 'own-model': {'tpm': 500}})
+    scheduler.acquire('test-model', 800)
+    scheduler.acquire('own-model', 400)
+    default_buckets = scheduler._get_buckets('test-model')
+    tokens_left = default_buckets['tokens'].level
+
+    scheduler.load_limits({'*': {'rpm': 60, 'tpm': 1000}, 'own-model': {'tpm': 500}})
+    assert scheduler._get_buckets('test-model')['tokens'].level == pytest.approx(tokens_left, abs=1)
+    assert scheduler._get_buckets('own-model')['tokens'].level < 200
+
+    # Changing the default tpm rebuilds only that bucket, and not for models with their own limits
+    requests_bucket = default_buckets['requests']
+    scheduler.set_limits('*', rpm=60, tpm=2000)
+    assert scheduler._get_buckets('test-model')['requests'] is requests_bucket
+    assert scheduler._get_buckets('test-model')['tokens'].capacity == 2000
+    assert scheduler._get_buckets('own-model')['tokens'].level < 200
+
+    # Models dropped from the config fall back to the default
+    scheduler.load_limits({'*': {'rpm': 60, 'tpm': 2000}})
+    assert scheduler._get_buckets('own-model')['tokens'].capacity == 2000
+
+@patch('database.get_config')
+def test_load_rate_limits_only_when_changed(mock_get_config):
+    """Test creating clients does not reset budgets while the config is unchanged."""
+    mock_get_config.return_value = '{"*": {"rpm": 60}}'
+    with patch('litellm_client.scheduler', LLMScheduler()) as scheduler, \
+         patch('litellm_client._loaded_rate_limits', None):
+        load_rate_limits()
+        scheduler.acquire('test-model')
+        bucket = scheduler._get_buckets('test-model')['requests']
+        load_rate_limits()
+        assert scheduler._get_buckets('test-model')['requests'] is bucket
+        mock_get_config.return_value = '{"*": {"rpm": 30}}'
+        load_rate_limits()
+        assert scheduler._get_buckets('test-model')['requests'].capacity == 30
+
+def test_scheduler_queue_depth():
+    """Test waiting requests are reported as queued, in FIFO order."""
+    scheduler = LLMScheduler()
+    scheduler.set_limits('*', tpm=60)
+    scheduler._get_buckets('test-model')['tokens'].level = 0
+    order = []
+
+    def request(name):
+        scheduler.acquire('test-model', 1)
+        order.append(name)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(2)]
+    threads[0].start()
+    time.sleep(0.05)
+    threads[1].start()
+    time.sleep(0.05)
+    assert scheduler.queue_depth('test-model') == 2
+    scheduler.set_limits('*', tpm=None)
+    for thread in threads:
+        thread.join(5)
+    assert order == [0, 1]
+    assert scheduler.queue_depth() == 0
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_records_usage(mock_get_config, mock_completion, client, mock_model_config):
+    """Test chat completion goes through the shared scheduler."""
+    mock_get_config.return_value = mock_model_config
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content='{"result": "test"}'))]
+    mock_response.usage.total_tokens = 42
+    mock_completion.return_value = mock_response
+
+    with patch('litellm_client.scheduler', LLMScheduler()) as scheduler:
+        client.chat_completion(system_message="test", user_message="test")
+        stats = scheduler.get_stats()[mock_model_config['orchestrator_model']]
+    assert stats['requests'] == 1
+    assert stats['tokens'] == 42
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_cache(mock_get_config, mock_completion, mock_env_vars, mock_model_config):
+    """Test cached responses skip the LLM round trip."""
+    mock_get_config.return_value = mock_model_config
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content='{"result": "test"}'))]
+    mock_completion.return_value = mock_response
+    cache = MagicMock()
+    cache.get.side_effect = [None, '{"result": "cached"}']
+
+    with patch('litellm_client.response_cache', cache):
+        client = LiteLLMClient(use_cache=True)
+        assert client.chat_completion(system_message="test", user_message="test") == '{"result": "test"}'
+        assert client.chat_completion(system_message="test", user_message="test") == '{"result": "cached"}'
+
+    mock_completion.assert_called_once()
+    cache.set.assert_called_once()
+
+def test_chat_completion_cache_disabled(client):
+    """Test caching is off unless enabled."""
+    assert client.cache is None
+
+def test_json_field_stream_reports_fields_as_they_complete():
+    """Test each top-level field is reported once its value has fully streamed in."""
+    fields = []
+    stream = JsonFieldStream(lambda name, value: fields.append((name, value)))
+    text = '```json\n{"progress": "p, {1}", "action": "/instruct say \\"hi\\"", "n": 3, "x": {"a": [1, "}"]}, "future": "f"}\n```'
+    for i, ch in enumerate(text):
+        stream.feed(ch)
+        if text[:i + 1].endswith('hi\\""'):
+            assert fields == [('progress', 'p, {1}'), ('action', '/instruct say "hi"')]
+    assert fields == [
+        ('progress', 'p, {1}'),
+        ('action', '/instruct say "hi"'),
+        ('n', 3),
+        ('x', {'a': [1, '}']}),
+        ('future', 'f')
+    ]
+
+def _stream_chunk(content=None, total_tokens=None):
+    chunk = MagicMock()
+    chunk.choices = [MagicMock(delta=MagicMock(content=content))]
+    chunk.usage = MagicMock(total_tokens=total_tokens) if total_tokens else None
+    return chunk
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_streaming(mock_get_config, mock_completion, client, mock_model_config):
+    """Test streamed completions report fields before the response ends."""
+    mock_get_config.return_value = mock_model_config
+    seen_at_action = []
+    fields = []
+
+    def chunks():
+        yield _stream_chunk('{"action": "/ls"')
+        seen_at_action.extend(fields)
+        yield _stream_chunk(', "future": "f"}')
+        yield _stream_chunk(total_tokens=17)
+    mock_completion.return_value = chunks()
+
+    with patch('litellm_client.scheduler', LLMScheduler()) as scheduler:
+        result = client.chat_completion(
+            system_message="test", user_message="test",
+            on_field=lambda name, value: fields.append((name, value))
+        )
+        stats = scheduler.get_stats()[mock_model_config['orchestrator_model']]
+    assert result == '{"action": "/ls", "future": "f"}'
+    assert seen_at_action == [('action', '/ls')]
+    assert fields == [('action', '/ls'), ('future', 'f')]
+    assert mock_completion.call_args[1]['stream'] is True
+    assert stats['tokens'] == 17
+    assert stats['avg_first_token'] is not None
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_streaming_cache_hit(mock_get_config, mock_completion, mock_env_vars, mock_model_config):
+    """Test cached responses are replayed to the field callback."""
+    mock_get_config.return_value = mock_model_config
+    cache = MagicMock()
+    cache.get.return_value = '{"action": "/ls"}'
+    fields = []
+
+    with patch('litellm_client.response_cache', cache):
+        client = LiteLLMClient(use_cache=True)
+        client.chat_completion(system_message="test", user_message="test",
+                               on_field=lambda name, value: fields.append((name, value)))
+    assert fields == [('action', '/ls')]
+    mock_completion.assert_not_called()
+
+class _RateLimited(Exception):
+    status_code = 429
+
+def _json_response(content):
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content=content))]
+    response.usage.total_tokens = 10
+    return response
+
+@pytest.fixture
+def resilience():
+    """Fresh retry policy and circuit breaker without real sleeps."""
+    with patch('litellm_client.retry_policy', RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.001)), \
+         patch('litellm_client.circuit_breaker', CircuitBreaker(threshold=2, cooldown=60)) as breaker, \
+         patch.dict('llm_retry.fallback_models', {}, clear=True) as fallbacks:
+        yield breaker, fallbacks
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_retries_transient_errors(mock_get_config, mock_completion, client, mock_model_config, resilience):
+    """Test rate limited calls are retried until they succeed."""
+    mock_get_config.return_value = mock_model_config
+    mock_completion.side_effect = [_RateLimited('slow down'), _json_response('{"result": "test"}')]
+
+    assert client.chat_completion(system_message="test", user_message="test") == '{"result": "test"}'
+    assert mock_completion.call_count == 2
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_falls_back(mock_get_config, mock_completion, client, mock_model_config, resilience):
+    """Test the fallback chain is used once a model keeps failing, and its open circuit is skipped."""
+    breaker, fallbacks = resilience
+    fallbacks['*'] = ['backup-model']
+    mock_get_config.return_value = mock_model_config
+    primary = mock_model_config['orchestrator_model']
+
+    def fake_completion(model, **kwargs):
+        if model == primary:
+            raise _RateLimited('down')
+        return _json_response('{"result": "backup"}')
+    mock_completion.side_effect = fake_completion
+
+    assert client.chat_completion(system_message="test", user_message="test") == '{"result": "backup"}'
+    # Two failures open the primary's circuit, so the next call goes straight to the backup
+    assert breaker.state(primary) == 'open'
+    mock_completion.reset_mock()
+    assert client.chat_completion(system_message="other", user_message="test") == '{"result": "backup"}'
+    assert [c[1]['model'] for c in mock_completion.call_args_list] == ['backup-model']
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_does_not_retry_fatal_errors(mock_get_config, mock_completion, client, mock_model_config, resilience):
+    """Test errors that a retry cannot fix fail immediately."""
+    mock_get_config.return_value = mock_model_config
+    mock_completion.side_effect = Exception("Bad request")
+
+    assert json.loads(client.chat_completion(system_message="test", user_message="test"))['error'] == "Bad request"
+    assert mock_completion.call_count == 1
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_stream_not_retried_after_fields(mock_get_config, mock_completion, client, mock_model_config, resilience):
+    """Test a stream that fails after reporting fields is not replayed."""
+    mock_get_config.return_value = mock_model_config
+    fields = []
+
+    def chunks():
+        yield _stream_chunk('{"action": "/ls", ')
+        raise _RateLimited('cut off')
+    mock_completion.side_effect = lambda **kwargs: chunks()
+
+    result = client.chat_completion(system_message="test", user_message="test",
+                                    on_field=lambda name, value: fields.append(name))
+    assert 'error' in json.loads(result)
+    assert fields == ['action']
+    assert mock_completion.call_count == 1
+
+def test_build_messages_puts_stable_prompt_first():
+    """Test the system prompt and task lead, with cache breakpoints only where providers need them."""
+    messages = build_messages('openrouter/openai/gpt-4o', 'system', 'new output', 'task ')
+    assert messages == [
+        {'role': 'system', 'content': 'system'},
+        {'role': 'user', 'content': 'task new output'}
+    ]
+    # The default model gets plain string messages, with no cache breakpoints
+    messages = build_messages('openrouter/google/gemini-flash-1.5', 'system', 'new output', 'task ')
+    assert messages == [
+        {'role': 'system', 'content': 'system'},
+        {'role': 'user', 'content': 'task new output'}
+    ]
+    messages = build_messages('openrouter/anthropic/claude-3.5-sonnet', 'system', 'new output', 'task ')
+    assert messages[0]['content'] == [{'type': 'text', 'text': 'system', 'cache_control': {'type': 'ephemeral'}}]
+    assert messages[1]['content'] == [
+        {'type': 'text', 'text': 'task ', 'cache_control': {'type': 'ephemeral'}},
+        {'type': 'text', 'text': 'new output'}
+    ]
+
+def test_prompt_cache_usage():
+    """Test cached prompt tokens are read from both OpenAI and Anthropic style usage."""
+    openai_usage = MagicMock(prompt_tokens=1000, prompt_tokens_details=MagicMock(cached_tokens=800))
+    assert prompt_cache_usage(openai_usage) == (1000, 800)
+    anthropic_usage = MagicMock(prompt_tokens=1000, prompt_tokens_details=None, cache_read_input_tokens=600)
+    assert prompt_cache_usage(anthropic_usage) == (1000, 600)
+    assert prompt_cache_usage(None) == (0, 0)
+
+@patch('litellm_client.completion')
+@patch('database.get_model_config')
+def test_chat_completion_tracks_prompt_cache_hits(mock_get_config, mock_completion, client, mock_model_config):
+    """Test the prefix is sent ahead of the turn content and cache hits are counted per model."""
+    mock_get_config.return_value = mock_model_config
+    response = _json_response('{"result": "test"}')
+    response.usage = MagicMock(total_tokens=1100, prompt_tokens=1000,
+                               prompt_tokens_details=MagicMock(cached_tokens=750))
+    mock_completion.return_value = response
+
+    with patch('litellm_client.scheduler', LLMScheduler()) as scheduler:
+        client.chat_completion(system_message="system", user_message="turn", prefix_message="task\n")
+        stats = scheduler.get_stats()[mock_model_config['orchestrator_model']]
+    messages = mock_completion.call_args[1]['messages']
+    # The default Gemini model caches the repeated prefix without breakpoints
+    assert messages == [
+        {'role': 'system', 'content': 'system'},
+        {'role': 'user', 'content': 'task\nturn'}
+    ]
+    assert stats['cached_tokens'] == 750
+    assert stats['cache_hit_rate'] == 0.75
@@ -0,0 +1,76 @@
+import pytest
+import time
+from unittest.mock import patch, MagicMock
+import llm_retry
+from llm_retry import (
+    CircuitBreaker, RetryPolicy, classify_error, model_chain, retry_after,
+    RATE_LIMITED, TRANSIENT, FATAL
+)
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.headers = headers
+
+def test_classify_error():
+    """Test rate limits and transient failures are retryable, the rest are not."""
+    assert classify_error(StatusError(429)) == RATE_LIMITED
+    assert classify_error(StatusError(503)) == TRANSIENT
+    assert classify_error(TimeoutError()) == TRANSIENT
+    assert classify_error(StatusError(400)) == FATAL
+    assert classify_error(StatusError(401)) == FATAL
+    assert classify_error(Exception('API Error')) == FATAL
+
+def test_retry_delay_is_jittered_and_capped():
+    """Test backoff grows exponentially under the cap and honours Retry-After."""
+    policy = RetryPolicy(max_retries=5, base_delay=1.0, max_delay=8.0)
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt) <= min(8.0, 2 ** attempt)
+    error = StatusError(429, headers={'retry-after': '5'})
+    assert retry_after(error) == 5.0
+    assert policy.delay(0, error) >= 5.0
+    assert policy.delay(0, StatusError(429, headers={'retry-after': '60'})) == 8.0
+
+def test_circuit_breaker_opens_and_probes():
+    """Test the circuit opens after repeated failures and closes after a good probe."""
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    assert breaker.allow('m')
+    breaker.record_failure('m')
+    assert breaker.state('m') == 'closed'
+    breaker.record_failure('m')
+    assert breaker.state('m') == 'open'
+    assert not breaker.allow('m')
+
+    time.sleep(0.06)
+    assert breaker.allow('m')
+    assert not breaker.allow('m')  # Only one probe at a time
+    breaker.record_failure('m')
+    assert breaker.state('m') == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow('m')
+    breaker.record_success('m')
+    assert breaker.state('m') == 'closed'
+    assert breaker.get_stats()['m']['trips'] == 1
+
+def test_model_chain():
+    """Test fallbacks follow the configured model, per model type or for all types."""
+    with patch.dict(llm_retry.fallback_models, {'agent': ['b', 'a', 'c'], '*': ['z']}, clear=True):
+        assert model_chain('agent', 'a') == ['a', 'b', 'c']
+        assert model_chain('orchestrator', 'a') == ['a', 'z']
+    with patch.dict(llm_retry.fallback_models, {}, clear=True):
+        assert model_chain('agent', 'a') == ['a']
+
+@patch('database.get_config')
+def test_load_retry_settings(mock_get_config):
+    """Test config keys override the defaults."""
+    config = {'llm_max_retries': '1', 'llm_breaker_threshold': '7', 'llm_fallback_models': '["x", "y"]'}
+    mock_get_config.side_effect = config.get
+    with patch.object(llm_retry, 'retry_policy', RetryPolicy()) as policy, \
+         patch.object(llm_retry, 'circuit_breaker', CircuitBreaker()) as breaker, \
+         patch.dict(llm_retry.fallback_models, {}, clear=True):
+        llm_retry.load_retry_settings()
+        assert policy.max_retries == 1
+        assert breaker.threshold == 7
+        assert llm_retry.fallback_models == {'*': ['x', 'y']}
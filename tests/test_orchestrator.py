@@ -4,6 +4,8 @@ from pathlib import Path
 import os
 import subprocess
 import json
+import threading
+import time
 from unittest.mock import patch, MagicMock
 
 # Add the project root to Python path
@@ -13,13 +15,21 @@ from orchestrator import (
     initialiseCodingAgent,
     load_tasks,
     save_tasks,
+    load_tasks_since,
+    provision_agent,
+    create_session,
     delete_agent,
     cloneRepository,
     get_github_token,
     update_agent_output,
+    supervise_agent,
+    AgentSupervisor,
+    DecisionBatcher,
     main_loop
 )
+import orchestrator
 from pull_request import PullRequestManager
+from prompt_processor import PromptProcessor
 from agent_session import AgentSession # Added import statement
 
 # Mock functions for testing
@@ -86,8 +96,8 @@ def test_delete_agent_not_found(mock_load_tasks):
     assert result is False
 
 @patch('orchestrator.save_config')
-@patch('orchestrator.save_agent')
-def test_save_tasks(mock_save_agent, mock_save_config):
+@patch('orchestrator.save_agents')
+def test_save_tasks(mock_save_agents, mock_save_config):
     """Test save_tasks normal operation."""
     tasks_data = {
         'repository_url': 'https://github.com/test/repo',
@@ -97,7 +107,7 @@ def test_save_tasks(mock_save_agent, mock_save_config):
     }
     save_tasks(tasks_data)
     mock_save_config.assert_called_once_with('repository_url', 'https://github.com/test/repo')
-    mock_save_agent.assert_called_once_with('agent1', {'status': 'pending'})
+    mock_save_agents.assert_called_once_with({'agent1': {'status': 'pending'}})
 
 @patch('orchestrator.subprocess.run')
 def test_clone_repository_success(mock_subprocess_run):
@@ -143,21 +153,27 @@ def test_initialiseCodingAgent_success(
     mock_chdir.return_value = None  # Mock successful directory change
 
     # Mock database operations
-    with patch('orchestrator.save_tasks') as mock_save_tasks:
-        with patch('orchestrator.get_config') as mock_get_config:
-            mock_get_config.return_value = None  # Mock no existing config
-            result = initialiseCodingAgent(
-                repository_url="https://github.com/test/repo",
-                task_description="test task",
-                num_agents=1
-            )
-            
-            assert result is not None
-            assert len(result) == 1
-            assert isinstance(result[0], str)
-            mock_clone.assert_called_once()
-            mock_check_call.assert_called()
-            mock_save_tasks.assert_called()
+    with patch('orchestrator.save_agent') as mock_save_agent, \
+         patch('orchestrator.save_config') as mock_save_config, \
+         patch('orchestrator.load_tasks', return_value={'agents': {}}):
+        result = initialiseCodingAgent(
+            repository_url="https://github.com/test/repo",
+            task_description="test task",
+            num_agents=1
+        )
+        
+        assert result is not None
+        assert len(result) == 1
+        assert isinstance(result[0], str)
+        mock_clone.assert_called_once()
+        # Provisioning never changes the process working directory
+        mock_chdir.assert_not_called()
+        branch_cmd, branch_kwargs = mock_check_call.call_args
+        assert branch_cmd[0][:3] == ['git', 'checkout', '-b']
+        assert branch_kwargs['cwd'].endswith('repo')
+        mock_save_agent.assert_called_once()
+        assert mock_save_agent.call_args[0][1]['task'] == "test task"
+        mock_save_config.assert_called_once_with('repository_url', "https://github.com/test/repo")
 
 @patch('orchestrator.load_tasks')
 @patch('orchestrator.db_delete_agent')
@@ -180,26 +196,411 @@ def test_delete_agent_success(mock_exists, mock_db_delete, mock_load_tasks):
         assert result is True
         mock_rmtree.assert_called_once_with('/tmp/test_workspace')
 
-@patch('orchestrator.load_tasks')
-def test_update_agent_output_success(mock_load_tasks):
+@patch('orchestrator.append_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_update_agent_output_success(mock_get_agent, mock_save_agent, mock_append_output):
     """Test successful agent output update."""
-    mock_load_tasks.return_value = {
-        'agents': {
-            'test_agent': {
-                'status': 'pending'
-            }
-        }
-    }
+    mock_get_agent.return_value = {'status': 'pending'}
+    mock_append_output.return_value = 11
+    session = MagicMock()
+    session.read_since.return_value = ('test output', 11)
+    session.take_events.return_value = []
     
-    with patch.dict('orchestrator.aider_sessions', {
-        'test_agent': MagicMock(get_output=lambda: 'test output')
-    }):
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}), \
+         patch.dict('orchestrator.persisted_output_offsets', {}):
         result = update_agent_output('test_agent')
         assert result is True
+        mock_append_output.assert_called_once_with('test_agent', 'test output')
+        assert mock_save_agent.call_args[0][1]['last_updated']
+        
+        # Only the output produced since the last update is appended
+        session.read_since.return_value = ('', 11)
+        assert update_agent_output('test_agent') is True
+        session.read_since.assert_called_with(11)
+        assert mock_append_output.call_count == 1
 
-@patch('orchestrator.load_tasks')
-def test_update_agent_output_no_agent(mock_load_tasks):
+@patch('orchestrator.append_agent_events')
+@patch('orchestrator.get_agent_output_length')
+@patch('orchestrator.append_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_update_agent_output_events(mock_get_agent, mock_save_agent, mock_append_output,
+                                    mock_output_length, mock_append_events):
+    """Test parsed events are stored with offsets into the stored transcript."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    # A restarted session: its output starts at 0, the stored transcript is 100 long
+    mock_append_output.return_value = 130
+    session = MagicMock()
+    session.read_since.return_value = ('Applied edit to a.py\nmore output\n', 30)
+    session.take_events.return_value = [{'type': 'file_edited', 'offset': 0, 'data': {'path': 'a.py'}}]
+
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}), \
+         patch.dict('orchestrator.persisted_output_offsets', {}):
+        assert update_agent_output('test_agent') is True
+        events = mock_append_events.call_args[0][1]
+        assert events[0]['offset'] == 100
+
+        # Events whose output was already persisted use the stored length
+        mock_output_length.return_value = 130
+        session.read_since.return_value = ('', 30)
+        session.take_events.return_value = [{'type': 'question', 'offset': 21, 'data': {}}]
+        assert update_agent_output('test_agent') is True
+        assert mock_append_events.call_args[0][1][0]['offset'] == 121
+
+@patch('orchestrator.append_agent_events')
+@patch('orchestrator.append_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_update_agent_output_events_after_eviction(mock_get_agent, mock_save_agent, mock_append_output,
+                                                   mock_append_events):
+    """Test event offsets stay right when the session evicted output before it was persisted."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    session = AgentSession("test/workspace", "task", config={'output_buffer_max_length': 20})
+    session.write_output('first line\n')
+    session.take_events()
+
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}), \
+         patch.dict('orchestrator.persisted_output_offsets', {}):
+        mock_append_output.return_value = 11
+        assert update_agent_output('test_agent') is True
+
+        # 40 characters arrive between persists, the first 20 are evicted unread
+        session.write_output('evicted line xxxxxx\n')
+        session.write_output('Applied edit to a.py')
+        session.take_events()
+        events = [{'type': 'question', 'offset': 0, 'data': {}},
+                  {'type': 'question', 'offset': 20, 'data': {}},
+                  {'type': 'file_edited', 'offset': 31, 'data': {'path': 'a.py'}}]
+        with patch.object(session, 'take_events', return_value=events):
+            mock_append_output.return_value = 31
+            assert update_agent_output('test_agent') is True
+
+        mock_append_output.assert_called_with('test_agent', 'Applied edit to a.py')
+        stored = mock_append_events.call_args[0][1]
+        # The event in already persisted output keeps its place, the evicted one is dropped
+        assert [event['offset'] for event in stored] == [0, 11]
+        assert stored[1]['type'] == 'file_edited'
+
+@patch('orchestrator.get_agent')
+def test_update_agent_output_no_agent(mock_get_agent):
     """Test agent output update with non-existent agent."""
-    mock_load_tasks.return_value = {'agents': {}}
+    mock_get_agent.return_value = None
     result = update_agent_output('non_existent_agent')
     assert result is False
+
+@patch('orchestrator.append_agent_history')
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_supervise_agent_sends_action(mock_get_agent, mock_save_agent, mock_update_output, mock_append_history):
+    """Test a supervise step forwards the LLM action to the session."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    session = MagicMock(task='test task')
+    session.is_ready.return_value = True
+    session.read_since.return_value = ('aider output', 12)
+    processor = MagicMock()
+    processor.get_response_history.return_value = []
+    processor.process_response.return_value = 'add a test'
+    client = MagicMock()
+    client.chat_completion.return_value = json.dumps({
+        'progress': 'p', 'thought': 't', 'action': '/instruct add a test', 'future': 'f'
+    })
+
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}), \
+         patch.dict('orchestrator.prompt_processors', {'test_agent': processor}):
+        assert supervise_agent('test_agent', client, MagicMock()) is True
+
+    session.send_message.assert_called_once_with('add a test', 'instruct')
+    assert 'aider output' in client.chat_completion.call_args[0][1]
+    assert orchestrator.context_builder.offsets['test_agent'] == 12
+    saved = mock_save_agent.call_args[0][1]
+    assert saved['progress'] == 'p'
+    assert saved['last_action'] == '/instruct add a test'
+    kinds = [c[0][1] for c in mock_append_history.call_args_list]
+    assert kinds == ['progress', 'thought']
+
+@patch('orchestrator.get_config', return_value=None)
+@patch('orchestrator.append_agent_history')
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_supervise_agent_dispatches_streamed_action(mock_get_agent, mock_save_agent, mock_update_output,
+                                                    mock_append_history, mock_get_config):
+    """Test the action is sent while the rest of the response is still streaming."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    session = MagicMock(task='test task')
+    session.is_ready.return_value = True
+    session.read_since.return_value = ('aider output', 12)
+    processor = PromptProcessor()
+    response = {'progress': 'p', 'thought': 't', 'action': '/instruct add a test', 'future': 'f'}
+    sent_before_future = []
+
+    def chat_completion(*args, on_field=None, **kwargs):
+        for name, value in response.items():
+            if name == 'future':
+                sent_before_future.extend(session.send_message.call_args_list)
+            on_field(name, value)
+        return json.dumps(response)
+    client = MagicMock()
+    client.chat_completion.side_effect = chat_completion
+
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}), \
+         patch.dict('orchestrator.prompt_processors', {'test_agent': processor}):
+        assert supervise_agent('test_agent', client, MagicMock()) is True
+
+    session.send_message.assert_called_once_with('add a test', 'instruct')
+    assert len(sent_before_future) == 1
+    assert orchestrator.context_builder.offsets['test_agent'] == 12
+    assert mock_save_agent.call_args[0][1]['future'] == 'f'
+    assert processor.get_agent_state('test_agent')['future'] == 'f'
+
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.get_agent')
+def test_supervise_agent_not_ready(mock_get_agent, mock_update_output):
+    """Test a supervise step does not call the LLM while aider is busy."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    session = MagicMock(task='test task')
+    session.is_ready.return_value = False
+    client = MagicMock()
+
+    with patch.dict('orchestrator.aider_sessions', {'test_agent': session}):
+        assert supervise_agent('test_agent', client, MagicMock()) is True
+    client.chat_completion.assert_not_called()
+
+@patch('orchestrator.get_agent')
+def test_supervise_agent_completed(mock_get_agent):
+    """Test agents with a PR are no longer supervised."""
+    mock_get_agent.return_value = {'pr_url': 'https://github.com/test/repo/pull/1'}
+    assert supervise_agent('test_agent', MagicMock(), MagicMock()) is False
+
+def test_agent_supervisor_runs_agents_concurrently():
+    """Test one slow agent does not hold up the others."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fake_supervise(agent_id, client, pr_manager, llm_slots):
+        calls.append(agent_id)
+        if agent_id == 'slow_agent':
+            started.set()
+            release.wait(5)
+        return False
+
+    sessions = {'slow_agent': MagicMock(), 'fast_agent': MagicMock()}
+    with patch.dict('orchestrator.aider_sessions', sessions), \
+         patch('orchestrator.supervise_agent', side_effect=fake_supervise):
+        supervisor = AgentSupervisor(MagicMock(), MagicMock(), max_llm_calls=2)
+        supervisor.sync_workers()
+        assert started.wait(5)
+        supervisor.workers['fast_agent'].join(5)
+        assert 'fast_agent' in calls
+        assert supervisor.workers['slow_agent'].is_alive()
+        release.set()
+        supervisor.workers['slow_agent'].join(5)
+
+
+def _ready_session(task, output):
+    session = MagicMock(task=task)
+    session.is_ready.return_value = True
+    session.wait_until_ready.return_value = True
+    session.read_since.return_value = (output, len(output))
+    return session
+
+@patch('orchestrator.get_config', return_value=None)
+@patch('orchestrator.append_agent_history')
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.get_agent')
+def test_decision_batcher_fans_out_decisions(mock_get_agent, mock_save_agent, mock_update_output,
+                                             mock_append_history, mock_get_config):
+    """Test ready agents share one request and each gets its own decision."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    sessions = {'a1': _ready_session('task one', 'output one'), 'a2': _ready_session('task two', 'output two'),
+                'a3': _ready_session('task three', 'output three')}
+    processors = {agent_id: PromptProcessor() for agent_id in sessions}
+    decision = {'progress': 'p', 'thought': 't', 'action': '/ls', 'future': 'f'}
+
+    def chat_completion(system_message, user_message, **kwargs):
+        if '"decisions"' in system_message:
+            assert '### Agent a1' in user_message and 'task two' in user_message and 'output three' in user_message
+            # a3 is missing from the batch response and has to be asked alone
+            return json.dumps({'decisions': {
+                'a1': decision, 'a2': dict(decision, action='/instruct add tests')
+            }})
+        assert 'task three' in kwargs['prefix_message']
+        return json.dumps(dict(decision, action='/map'))
+    client = MagicMock()
+    client.chat_completion.side_effect = chat_completion
+
+    with patch.dict('orchestrator.aider_sessions', sessions), \
+         patch.dict('orchestrator.prompt_processors', processors):
+        DecisionBatcher(client, MagicMock(), window=0).run_once()
+
+    assert client.chat_completion.call_count == 2
+    sessions['a1'].send_message.assert_called_once_with('/ls', 'instruct')
+    sessions['a2'].send_message.assert_called_once_with('add tests', 'instruct')
+    sessions['a3'].send_message.assert_called_once_with('/map', 'instruct')
+    assert processors['a2'].get_agent_state('a2')['last_action'] == '/instruct add tests'
+    assert orchestrator.context_builder.offsets['a1'] == len('output one')
+
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.get_agent')
+def test_decision_batcher_waits_for_busy_agents(mock_get_agent, mock_update_output):
+    """Test agents that become ready within the window join the batch."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    ready = _ready_session('task one', 'output one')
+    busy = _ready_session('task two', 'output two')
+    busy.wait_until_ready.side_effect = [False, False, True, True]
+    batcher = DecisionBatcher(MagicMock(), MagicMock(), window=5)
+
+    with patch.dict('orchestrator.aider_sessions', {'a1': ready, 'a2': busy}), \
+         patch('orchestrator.BATCH_POLL_INTERVAL', 0.01), \
+         patch.object(batcher, 'decide') as mock_decide:
+        batcher.run_once()
+
+    mock_decide.assert_called_once()
+    assert set(mock_decide.call_args[0][0]) == {'a1', 'a2'}
+
+@patch('orchestrator.update_agent_output')
+@patch('orchestrator.get_agent')
+def test_decision_batcher_does_not_block_on_busy_sessions(mock_get_agent, mock_update_output):
+    """Test a session with recent output is polled, not waited on for stability_duration."""
+    mock_get_agent.return_value = {'status': 'pending'}
+    ready = _ready_session('task one', 'output one')
+    busy = AgentSession("test/workspace", "task two", config={'stability_duration': 10})
+    busy.write_output("still working\n")
+    batcher = DecisionBatcher(MagicMock(), MagicMock(), window=0.2)
+
+    with patch.dict('orchestrator.aider_sessions', {'a1': ready, 'a2': busy}), \
+         patch('orchestrator.BATCH_POLL_INTERVAL', 0.01), \
+         patch.object(batcher, 'decide') as mock_decide:
+        start = time.monotonic()
+        batcher.run_once()
+        elapsed = time.monotonic() - start
+
+    assert elapsed < 2
+    assert set(mock_decide.call_args[0][0]) == {'a1'}
+
+@patch('orchestrator.get_agent_output')
+@patch('orchestrator.get_agent_fields')
+@patch('orchestrator.get_changes_since')
+def test_load_tasks_since(mock_get_changes, mock_get_fields, mock_get_output):
+    """Test load_tasks_since only returns changed fields and appended output."""
+    mock_get_changes.return_value = {
+        'version': 9,
+        'agents': {
+            'agent1': {'fields': ['status', 'aider_output'], 'output_start': 40},
+            'agent2': {'fields': ['*'], 'output_start': None}
+        },
+        'deleted': ['agent3'],
+        'tasks': False,
+        'config': []
+    }
+    records = {
+        'agent1': {'id': 'agent1', 'status': 'completed', 'aider_output_length': 50},
+        'agent2': {'id': 'agent2', 'status': 'pending'}
+    }
+    mock_get_fields.side_effect = lambda agent_id, fields: dict(records[agent_id])
+    mock_get_output.return_value = 'new output'
+    
+    delta = load_tasks_since(5)
+    assert delta['version'] == 9
+    assert delta['deleted'] == ['agent3']
+    assert delta['agents']['agent1'] == {
+        'id': 'agent1',
+        'status': 'completed',
+        'aider_output_append': {'start': 40, 'text': 'new output'},
+        'aider_output_length': 50
+    }
+    assert delta['agents']['agent2'] == records['agent2']
+    assert 'tasks' not in delta
+    mock_get_output.assert_called_once_with('agent1', 40)
+    mock_get_fields.assert_any_call('agent1', ['status', 'aider_output'])
+
+@patch('orchestrator.get_changes_since')
+def test_load_tasks_since_too_old(mock_get_changes):
+    """Test load_tasks_since asks for a full reload when the version is unknown."""
+    mock_get_changes.return_value = None
+    assert load_tasks_since(1) is None
+
+
+@patch('orchestrator.cloneRepository')
+def test_provision_agent_clone_failure_cleans_up(mock_clone, tmp_path):
+    """Test a failed clone removes the agent workspace."""
+    mock_clone.return_value = False
+    workspace = tmp_path / "agent_workspace"
+    workspace.mkdir()
+    with patch('orchestrator.tempfile.mkdtemp', return_value=str(workspace)):
+        assert provision_agent("https://github.com/test/repo.git", "test task") is None
+    assert mock_clone.call_args[0][1] == (workspace / "repo" / "repo").resolve()
+    assert not workspace.exists()
+
+@patch('orchestrator.get_config')
+@patch('orchestrator.subprocess.run')
+def test_clone_repository_into_target(mock_subprocess_run, mock_get_config, tmp_path):
+    """Test cloning into an explicit directory with the mirror cache disabled."""
+    mock_get_config.return_value = 'false'
+    mock_subprocess_run.return_value = MagicMock(returncode=0)
+    assert cloneRepository('https://github.com/test/repo', tmp_path / "repo") is True
+    assert mock_subprocess_run.call_args[0][0] == [
+        'git', 'clone', '--quiet', 'https://github.com/test/repo', str(tmp_path / "repo")
+    ]
+
+@patch('orchestrator.get_config', return_value=None)
+@patch('orchestrator.subprocess.run')
+@patch('orchestrator.repo_cache')
+def test_clone_repository_uses_mirror(mock_repo_cache, mock_subprocess_run, mock_get_config, tmp_path):
+    """Test workspaces come from the mirror cache, falling back to a direct clone."""
+    mock_repo_cache.clone.return_value = True
+    assert cloneRepository('https://github.com/test/repo', tmp_path / "repo") is True
+    mock_repo_cache.clone.assert_called_once_with('https://github.com/test/repo', tmp_path / "repo")
+    mock_subprocess_run.assert_not_called()
+
+    mock_repo_cache.clone.return_value = False
+    mock_subprocess_run.return_value = MagicMock(returncode=0)
+    assert cloneRepository('https://github.com/test/repo', tmp_path / "repo") is True
+    mock_subprocess_run.assert_called_once()
+
+
+@patch('orchestrator.save_config')
+@patch('orchestrator.save_agent')
+@patch('orchestrator.subprocess.check_call')
+@patch('orchestrator.prepare_workspace')
+@patch('orchestrator.warm_pool')
+def test_provision_agent_uses_warm_workspace(mock_warm_pool, mock_prepare, mock_check_call, mock_save_agent, mock_save_config, tmp_path):
+    """Test a warm workspace only needs its branch and task assigned."""
+    session = MagicMock(config={})
+    mock_warm_pool.take.return_value = MagicMock(workspace=tmp_path, repo_path=tmp_path / "repo", session=session)
+    
+    with patch.dict('orchestrator.aider_sessions', {}), patch.dict('orchestrator.prompt_processors', {}):
+        agent_id = provision_agent("https://github.com/test/repo", "test task")
+        assert orchestrator.aider_sessions[agent_id] is session
+    
+    mock_prepare.assert_not_called()
+    session.start.assert_not_called()
+    assert session.task == "test task"
+    assert session.agent_id == agent_id
+    assert (tmp_path / "current_task.txt").read_text() == "test task"
+    assert mock_check_call.call_args[1]['cwd'] == str(tmp_path / "repo")
+    mock_warm_pool.refill.assert_called_once_with("https://github.com/test/repo")
+
+@patch('orchestrator.prepare_workspace')
+@patch('orchestrator.warm_pool')
+def test_provision_agent_custom_commands_skip_warm_pool(mock_warm_pool, mock_prepare):
+    """Test agents with custom aider commands always start cold."""
+    mock_prepare.return_value = None
+    assert provision_agent("https://github.com/test/repo", "test task", aider_commands="--no-git") is None
+    mock_warm_pool.take.assert_not_called()
+    mock_prepare.assert_called_once()
+
+
+@patch('orchestrator.get_config')
+def test_create_session_backend(mock_get_config):
+    """Test the aider backend is picked from config."""
+    mock_get_config.return_value = 'coder'
+    assert isinstance(create_session('/tmp/ws', 'task'), orchestrator.CoderSession)
+    # Custom aider arguments need the CLI
+    assert not isinstance(create_session('/tmp/ws', 'task', aider_commands='--no-git'), orchestrator.CoderSession)
+    mock_get_config.return_value = None
+    assert not isinstance(create_session('/tmp/ws', 'task', agent_id='a1'), orchestrator.CoderSession)
@@ -0,0 +1,67 @@
+import pytest
+from output_buffer import OutputRingBuffer
+
+@pytest.fixture
+def buffer():
+    """Create a small ring buffer for testing."""
+    return OutputRingBuffer(max_length=20, chunk_size=8)
+
+def test_write_and_getvalue(buffer):
+    """Test written text is returned in order."""
+    assert buffer.write("hello ") == 6
+    buffer.write("world")
+    assert buffer.getvalue() == "hello world"
+    assert buffer.start_offset == 0
+    assert buffer.end_offset == 11
+    assert len(buffer) == 11
+
+def test_write_empty(buffer):
+    """Test empty writes are ignored."""
+    assert buffer.write("") == 0
+    assert buffer.end_offset == 0
+    assert buffer.getvalue() == ""
+
+def test_read_since(buffer):
+    """Test reading only the text written after an offset."""
+    buffer.write("abcdefgh")
+    buffer.write("ijkl")
+    text, offset = buffer.read_since(5)
+    assert text == "fghijkl"
+    assert offset == 12
+
+    # Nothing new since the end offset
+    assert buffer.read_since(offset) == ("", 12)
+
+    buffer.write("mn")
+    assert buffer.read_since(offset) == ("mn", 14)
+
+def test_bounded_length(buffer):
+    """Test the oldest text is evicted once max_length is exceeded."""
+    for i in range(10):
+        buffer.write(f"line{i}\n")
+    assert len(buffer) == 20
+    assert buffer.end_offset == 60
+    assert buffer.start_offset == 40
+    assert buffer.getvalue() == "".join(f"line{i}\n" for i in range(10))[-20:]
+
+def test_read_since_evicted_offset(buffer):
+    """Test reading from an evicted offset resumes at the oldest held text."""
+    buffer.write("x" * 30)
+    text, offset = buffer.read_since(0)
+    assert len(text) == 20
+    assert offset == 30
+    assert buffer.start_offset == 10
+
+def test_single_write_larger_than_max(buffer):
+    """Test a single oversized write keeps only its tail."""
+    buffer.write("0123456789" * 3)
+    assert buffer.getvalue() == "0123456789" * 2
+    assert buffer.read_since(25) == ("56789", 30)
+
+def test_clear(buffer):
+    """Test clearing keeps offsets monotonic."""
+    buffer.write("abc")
+    buffer.clear()
+    assert buffer.getvalue() == ""
+    buffer.write("d")
+    assert buffer.read_since(0) == ("d", 4)
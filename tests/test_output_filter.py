@@ -0,0 +1,94 @@
+import json
+import pytest
+from unittest.mock import patch
+import output_filter as output_filter_module
+from output_filter import OutputFilter, DEFAULT_FILTER_RULES, PROGRESS_PATTERN, load_output_filter
+
+@pytest.fixture
+def output_filter():
+    return OutputFilter()
+
+def test_clean_chunk_returned_unchanged(output_filter):
+    """Test chunks without noise pass through untouched."""
+    text = "Applied edit to app.py\nCommit 1a2b3c4 Fix bug\n> "
+    assert output_filter.filter(text) is text
+    assert output_filter.stats()['hits'] == {}
+
+def test_drops_noise_and_counts_hits(output_filter):
+    """Test noise lines are dropped and counted per rule."""
+    text = (
+        "Aider v0.50.1\n"
+        "Model: gpt-4 with diff edit format\n"
+        "Newer aider version v0.51 is available.\n"
+        "Real output\n"
+        "Can't initialize prompt toolkit: No Windows console found\n"
+        "> "
+    )
+    assert output_filter.filter(text) == "Real output\n> "
+    stats = output_filter.stats()
+    assert stats['hits'] == {'banner': 2, 'update_notice': 1, 'prompt_toolkit': 1}
+
+def test_collapses_progress_frames(output_filter):
+    """Test consecutive frames of a progress bar collapse to the last one."""
+    frames = [f"Scanning repo: {p}%|{'█' * (p // 10)}| {p}/100\n" for p in (10, 50, 100)]
+    text = "Start\n" + "".join(frames) + "Waiting for LLM ⠋\nWaiting for LLM ⠙\nDone\n"
+    assert output_filter.filter(text) == "Start\n" + frames[-1] + "Waiting for LLM ⠙\nDone\n"
+    assert output_filter.stats()['collapsed'] == 3
+
+def test_distinct_progress_lines_kept(output_filter):
+    """Test different progress lines are not merged together."""
+    text = "Scanning repo: 100%|█| 5/5\nUpdating repo map: 100%|█| 5/5\n"
+    assert output_filter.filter(text) == text
+
+def test_adjacent_progress_runs_collapse_separately(output_filter):
+    """Test back to back progress bars each keep their last frame, also at the chunk end."""
+    text = ("Scanning repo: 50%|█| 1/2\nScanning repo: 100%|█| 2/2\n"
+            "Updating repo map: 50%|█| 1/2\nUpdating repo map: 100%|█| 2/2")
+    assert output_filter.filter(text) == "Scanning repo: 100%|█| 2/2\nUpdating repo map: 100%|█| 2/2"
+    assert output_filter.stats()['collapsed'] == 2
+
+def test_collapses_frames_across_calls(output_filter):
+    """Test frames delivered one call at a time collapse per stream."""
+    bar = [f"Scanning repo: {p}%|{'█' * (p // 10)}| {p}/100\n" for p in range(0, 101, 10)]
+    spinner = [f"Waiting for LLM {frame}\n" for frame in "⠋⠙⠹⠸⠼"]
+    kept = [output_filter.filter(line, 'stream') for line in ["Start\n"] + bar + spinner + ["Done\n"]]
+    assert ''.join(kept) == "Start\n" + bar[-1] + spinner[-1] + "Done\n"
+    assert output_filter.stats()['collapsed'] == 14
+
+    # Another stream's frames are held separately, and flush() releases a trailing frame
+    assert output_filter.filter(bar[0], 'other') == ''
+    assert output_filter.filter(bar[1], 'stream') == ''
+    assert output_filter.flush('other') == bar[0]
+    assert output_filter.flush('stream') == bar[1]
+    assert output_filter.flush('stream') == ''
+
+def test_custom_rules():
+    """Test custom rules replace the defaults and can disable collapsing."""
+    output_filter = OutputFilter({'tokens': r"^Tokens: \d+"}, progress_pattern=None)
+    text = "Aider v0.50\nTokens: 1200 sent\n 50%|█|\n 60%|█|\n"
+    assert output_filter.filter(text) == "Aider v0.50\n 50%|█|\n 60%|█|\n"
+    assert output_filter.stats() == {'rules': ['tokens'], 'hits': {'tokens': 1}, 'collapsed': 0}
+
+@patch('database.get_config')
+def test_load_output_filter(mock_get_config):
+    """Test rules from config are merged over the defaults."""
+    config = {
+        'output_filter_rules': json.dumps({'banner': None, 'tokens': r"^Tokens:"}),
+        'output_filter_progress': ''
+    }
+    mock_get_config.side_effect = config.get
+    try:
+        load_output_filter()
+        stats = output_filter_module.output_filter.stats()
+        assert 'banner' not in stats['rules']
+        assert 'tokens' in stats['rules']
+        assert output_filter_module.output_filter.filter("Aider v1\nTokens: 5\n") == "Aider v1\n"
+    finally:
+        output_filter_module.output_filter.configure(DEFAULT_FILTER_RULES, PROGRESS_PATTERN)
+
+@patch('database.get_config')
+def test_load_output_filter_invalid_regex(mock_get_config):
+    """Test an invalid rule keeps the current filter."""
+    mock_get_config.side_effect = {'output_filter_rules': json.dumps({'bad': '('})}.get
+    load_output_filter()
+    assert 'bad' not in output_filter_module.output_filter.stats()['rules']
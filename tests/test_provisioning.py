@@ -0,0 +1,55 @@
+import threading
+import pytest
+from unittest.mock import patch
+from provisioning import ProvisioningQueue
+
+@pytest.fixture
+def provisioning_queue():
+    """Create a provisioning queue and shut it down after the test."""
+    queue = ProvisioningQueue(max_workers=2)
+    yield queue
+    queue.shutdown()
+
+@patch('orchestrator.provision_agent')
+def test_submit_runs_jobs(mock_provision, provisioning_queue):
+    """Test one job is queued per agent and records the new agent id."""
+    mock_provision.side_effect = ['agent1', None]
+    job_ids = provisioning_queue.submit('https://github.com/test/repo', 'task', num_agents=2, aider_commands='--cmd')
+    assert len(job_ids) == 2
+    provisioning_queue.shutdown()
+    
+    jobs = [provisioning_queue.get(job_id) for job_id in job_ids]
+    assert sorted(j['status'] for j in jobs) == ['failed', 'succeeded']
+    succeeded = next(j for j in jobs if j['status'] == 'succeeded')
+    assert succeeded['agent_id'] == 'agent1'
+    assert succeeded['started_at'] and succeeded['finished_at']
+    failed = next(j for j in jobs if j['status'] == 'failed')
+    assert failed['error'] == 'Failed to provision agent'
+    mock_provision.assert_called_with('https://github.com/test/repo', 'task', None, '--cmd')
+
+@patch('orchestrator.provision_agent')
+def test_job_exception(mock_provision, provisioning_queue):
+    """Test an exception while provisioning fails the job."""
+    mock_provision.side_effect = RuntimeError("clone exploded")
+    job_id = provisioning_queue.submit('https://github.com/test/repo', 'task')[0]
+    provisioning_queue.shutdown()
+    job = provisioning_queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'clone exploded'
+
+@patch('orchestrator.provision_agent')
+def test_jobs_run_in_parallel(mock_provision, provisioning_queue):
+    """Test jobs are provisioned concurrently on the worker pool."""
+    barrier = threading.Barrier(2, timeout=5)
+    def provision(*args):
+        barrier.wait()
+        return 'agent'
+    mock_provision.side_effect = provision
+    job_ids = provisioning_queue.submit('https://github.com/test/repo', 'task', num_agents=2)
+    provisioning_queue.shutdown()
+    assert all(provisioning_queue.get(job_id)['status'] == 'succeeded' for job_id in job_ids)
+
+def test_get_unknown_job(provisioning_queue):
+    """Test unknown job ids return None."""
+    assert provisioning_queue.get('missing') is None
+    assert provisioning_queue.list_jobs() == []
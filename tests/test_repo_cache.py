@@ -0,0 +1,65 @@
+import subprocess
+import pytest
+from pathlib import Path
+from repo_cache import RepoCache
+
+def git(*args, cwd=None):
+    return subprocess.run(
+        ['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com'] + list(args),
+        cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+@pytest.fixture
+def upstream(tmp_path):
+    """Create an upstream repository with one commit."""
+    repo = tmp_path / "upstream"
+    repo.mkdir()
+    git('init', '--quiet', cwd=repo)
+    (repo / "README.md").write_text("hello")
+    git('add', 'README.md', cwd=repo)
+    git('commit', '--quiet', '-m', 'Initial commit', cwd=repo)
+    return repo
+
+@pytest.fixture
+def repo_cache(tmp_path):
+    """Create a repo cache in a temporary directory."""
+    return RepoCache(cache_dir=tmp_path / "cache", fetch_interval=0)
+
+def test_mirror_path(repo_cache):
+    """Test mirrors are named after the repository and keyed by URL."""
+    path = repo_cache.mirror_path('https://github.com/test/repo.git')
+    assert path.parent == repo_cache.cache_dir
+    assert path.name.startswith('repo-') and path.name.endswith('.git')
+    assert path != repo_cache.mirror_path('https://github.com/other/repo.git')
+
+def test_clone_from_mirror(repo_cache, upstream, tmp_path):
+    """Test workspaces share the mirror's objects and push to the real remote."""
+    workspace = tmp_path / "workspace"
+    assert repo_cache.clone(str(upstream), workspace) is True
+    assert (workspace / "README.md").read_text() == "hello"
+    assert git('remote', 'get-url', 'origin', cwd=workspace) == str(upstream)
+    alternates = (workspace / ".git" / "objects" / "info" / "alternates").read_text()
+    assert str(repo_cache.mirror_path(str(upstream))) in alternates
+
+def test_mirror_fetches_incrementally(repo_cache, upstream, tmp_path):
+    """Test later workspaces see upstream commits made after the mirror was created."""
+    assert repo_cache.clone(str(upstream), tmp_path / "first") is True
+    (upstream / "NEW.md").write_text("new")
+    git('add', 'NEW.md', cwd=upstream)
+    git('commit', '--quiet', '-m', 'Second commit', cwd=upstream)
+    assert repo_cache.clone(str(upstream), tmp_path / "second") is True
+    assert (tmp_path / "second" / "NEW.md").exists()
+    assert not (tmp_path / "first" / "NEW.md").exists()
+
+def test_mirror_reused_within_fetch_interval(upstream, tmp_path, monkeypatch):
+    """Test a fresh mirror is not fetched again."""
+    cache = RepoCache(cache_dir=tmp_path / "cache", fetch_interval=3600)
+    assert cache.ensure_mirror(str(upstream)) is not None
+    calls = []
+    monkeypatch.setattr('repo_cache._git', lambda args, cwd=None: calls.append(args) or True)
+    assert cache.ensure_mirror(str(upstream)) == cache.mirror_path(str(upstream))
+    assert calls == []
+
+def test_clone_missing_repository(repo_cache, tmp_path):
+    """Test an unreachable repository fails cleanly."""
+    assert repo_cache.clone(str(tmp_path / "missing"), tmp_path / "workspace") is False
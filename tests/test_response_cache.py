@@ -0,0 +1,53 @@
+import pytest
+import time
+import database
+from database import init_db
+from response_cache import ResponseCache
+
+@pytest.fixture
+def initialized_db(tmp_path):
+    """Initialize a temporary database for testing."""
+    original_path = database.DATABASE_PATH
+    database.DATABASE_PATH = tmp_path / "test_tasks.db"
+    init_db()
+    yield database.DATABASE_PATH
+    database.DATABASE_PATH = original_path
+
+@pytest.fixture
+def cache(initialized_db):
+    return ResponseCache(max_entries=3, ttl=60)
+
+def test_make_key():
+    """Test keys depend on every part of the request."""
+    key = ResponseCache.make_key('model', 'system', 'user', {'type': 'json_object'})
+    assert key == ResponseCache.make_key('model', 'system', 'user', {'type': 'json_object'})
+    assert key != ResponseCache.make_key('other-model', 'system', 'user', {'type': 'json_object'})
+    assert key != ResponseCache.make_key('model', 'system', 'other user', {'type': 'json_object'})
+    assert key != ResponseCache.make_key('model', 'system', 'user', None)
+
+def test_get_and_set(cache):
+    """Test a stored response is returned and counted as a hit."""
+    assert cache.get('key1') is None
+    cache.set('key1', 'model', '{"action": "/ls"}')
+    assert cache.get('key1') == '{"action": "/ls"}'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+def test_ttl(cache):
+    """Test expired entries are not returned."""
+    cache.set('key1', 'model', '{}')
+    cache.ttl = 0.01
+    time.sleep(0.05)
+    assert cache.get('key1') is None
+
+def test_lru_eviction(cache):
+    """Test the least recently used entry is evicted past max_entries."""
+    for i in range(3):
+        cache.set(f'key{i}', 'model', f'"{i}"')
+        time.sleep(0.01)
+    # Touch key0 so key1 becomes the least recently used
+    assert cache.get('key0') == '"0"'
+    time.sleep(0.01)
+    cache.set('key3', 'model', '"3"')
+    assert cache.get('key1') is None
+    assert cache.get('key0') == '"0"'
+    assert cache.get('key3') == '"3"'
@@ -0,0 +1,76 @@
+import pytest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+from warm_pool import WarmPool, WarmWorkspace
+
+@pytest.fixture
+def warm_pool():
+    """Create a warm pool with a fixed size that ignores config."""
+    pool = WarmPool(size=2, max_workers=2)
+    with patch.object(WarmPool, '_target_size', lambda self: self.size):
+        yield pool
+    pool.drain()
+
+def make_warm(tmp_path, name, alive=True):
+    workspace = tmp_path / name
+    workspace.mkdir()
+    session = MagicMock()
+    session.is_alive.return_value = alive
+    return WarmWorkspace(workspace, workspace / "repo", session)
+
+def wait_for_refill(pool):
+    executor = pool._executor
+    pool._executor = None
+    executor.shutdown(wait=True)
+
+@patch('orchestrator.create_session')
+@patch('orchestrator.prepare_workspace')
+def test_refill_and_take(mock_prepare, mock_session_cls, warm_pool, tmp_path):
+    """Test the pool fills up in the background and hands out ready workspaces."""
+    mock_prepare.side_effect = lambda url, prefix: (tmp_path, tmp_path / "repo")
+    mock_session_cls.return_value.start.return_value = True
+    mock_session_cls.return_value.is_alive.return_value = True
+    
+    assert warm_pool.take('https://github.com/test/repo') is None
+    assert warm_pool.refill('https://github.com/test/repo') == 2
+    # Already full or pending: nothing more to queue
+    assert warm_pool.refill('https://github.com/test/repo') == 0
+    wait_for_refill(warm_pool)
+    assert warm_pool.stats() == {'https://github.com/test/repo': {'ready': 2, 'pending': 0}}
+    
+    warm = warm_pool.take('https://github.com/test/repo')
+    assert warm.repo_path == tmp_path / "repo"
+    mock_session_cls.assert_called_with(str(tmp_path / "repo"), None)
+    assert warm_pool.stats()['https://github.com/test/repo']['ready'] == 1
+
+@patch('orchestrator.prepare_workspace')
+def test_refill_failure(mock_prepare, warm_pool):
+    """Test failed workspace builds leave the pool empty."""
+    mock_prepare.return_value = None
+    warm_pool.refill('https://github.com/test/repo')
+    wait_for_refill(warm_pool)
+    assert warm_pool.take('https://github.com/test/repo') is None
+    assert warm_pool.stats()['https://github.com/test/repo'] == {'ready': 0, 'pending': 0}
+
+def test_take_skips_dead_sessions(warm_pool, tmp_path):
+    """Test workspaces whose aider process exited are discarded."""
+    dead = make_warm(tmp_path, "dead", alive=False)
+    alive = make_warm(tmp_path, "alive")
+    warm_pool._ready['repo'] = [dead, alive]
+    assert warm_pool.take('repo') is alive
+
+def test_disabled_pool():
+    """Test a size of zero never prepares workspaces."""
+    pool = WarmPool(size=0)
+    with patch.object(WarmPool, '_target_size', lambda self: self.size):
+        assert pool.refill('https://github.com/test/repo') == 0
+    assert pool._executor is None
+
+def test_drain(warm_pool, tmp_path):
+    """Test draining discards ready workspaces and stops refilling."""
+    warm = make_warm(tmp_path, "ready")
+    warm_pool._ready['repo'] = [warm]
+    warm_pool.drain()
+    warm.session.cleanup.assert_called_once()
+    assert not warm.workspace.exists()
+    assert warm_pool.refill('repo') == 0
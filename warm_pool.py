@@ -0,0 +1,124 @@
+import atexit
+import logging
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+WARM_POOL_SIZE = 0  # Ready workspaces kept per repository; 0 disables the pool
+WARM_POOL_WORKERS = 2  # Workspaces prepared in parallel when refilling
+
+class WarmWorkspace:
+    """A cloned workspace with an aider session already running but no task yet."""
+
+    def __init__(self, workspace, repo_path, session):
+        self.workspace = workspace
+        self.repo_path = repo_path
+        self.session = session
+
+    def discard(self) -> None:
+        try:
+            self.session.cleanup()
+        finally:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+
+class WarmPool:
+    """Per-repository pool of ready workspaces for fast agent starts.
+
+    Once a repository has been used, up to `size` workspaces (config
+    warm_pool_size, off by default) are kept cloned with an idle aider session,
+    so provisioning an agent only has to create its branch and hand over the
+    task. take() never blocks; refill() tops the pool up on a background
+    executor.
+    """
+
+    def __init__(self, size: int = WARM_POOL_SIZE, max_workers: int = WARM_POOL_WORKERS):
+        self.size = size
+        self.max_workers = max_workers
+        self._ready: Dict[str, List[WarmWorkspace]] = {}
+        self._pending: Dict[str, int] = {}
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _target_size(self) -> int:
+        try:
+            from database import get_config
+            value = get_config('warm_pool_size')
+            return int(value) if value else self.size
+        except Exception as e:
+            logging.warning(f"Invalid warm_pool_size config: {e}")
+            return self.size
+
+    def take(self, repository_url: str) -> Optional[WarmWorkspace]:
+        """Remove and return a ready workspace for repository_url, if any."""
+        with self._lock:
+            ready = self._ready.get(repository_url)
+            while ready:
+                warm = ready.pop(0)
+                # Skip sessions whose aider process died while idle
+                if warm.session.is_alive():
+                    return warm
+                threading.Thread(target=warm.discard, daemon=True).start()
+        return None
+
+    def refill(self, repository_url: str) -> int:
+        """Start preparing workspaces until the pool is full; returns how many were queued."""
+        target = self._target_size()
+        with self._lock:
+            if self._closed:
+                return 0
+            missing = target - len(self._ready.get(repository_url, [])) - self._pending.get(repository_url, 0)
+            if missing <= 0:
+                return 0
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='warm-pool')
+            self._pending[repository_url] = self._pending.get(repository_url, 0) + missing
+            for _ in range(missing):
+                self._executor.submit(self._build, repository_url)
+        return missing
+
+    def _build(self, repository_url: str) -> None:
+        from orchestrator import prepare_workspace, create_session
+        warm = None
+        try:
+            workspace = prepare_workspace(repository_url, "agent_warm_")
+            if workspace:
+                session = create_session(str(workspace[1]), None)
+                if session.start():
+                    warm = WarmWorkspace(workspace[0], workspace[1], session)
+                else:
+                    logging.error(f"Failed to start warm aider session for {repository_url}")
+                    shutil.rmtree(workspace[0], ignore_errors=True)
+        except Exception as e:
+            logging.error(f"Error preparing warm workspace for {repository_url}: {e}", exc_info=True)
+        with self._lock:
+            self._pending[repository_url] -= 1
+            if warm and not self._closed:
+                self._ready.setdefault(repository_url, []).append(warm)
+                warm = None
+        if warm:
+            warm.discard()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                url: {'ready': len(self._ready.get(url, [])), 'pending': self._pending.get(url, 0)}
+                for url in set(self._ready) | set(self._pending)
+            }
+
+    def drain(self) -> None:
+        """Stop refilling and discard every ready workspace."""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            ready = [warm for workspaces in self._ready.values() for warm in workspaces]
+            self._ready.clear()
+        if executor:
+            executor.shutdown(wait=False)
+        for warm in ready:
+            warm.discard()
+
+# Shared by every provisioning job
+warm_pool = WarmPool()
+atexit.register(warm_pool.drain)